@@ -0,0 +1,61 @@
+"""Per-session setup latency: rebuilding the topology per session vs a shared `RouterEngine`.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_engine_setup --sessions 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from data_agents.engine import RouterEngine
+
+
+async def rebuild_per_session(sessions: int) -> list:
+    latencies = []
+    for i in range(sessions):
+        start = time.perf_counter()
+        # What run_stream used to do: new client, new runtime, new registrations, every time.
+        engine = RouterEngine()
+        session = await engine.open_session(f"user{i}", "bench", "")
+        latencies.append(time.perf_counter() - start)
+        await engine.close_session(session)
+        await engine.stop()
+    return latencies
+
+
+async def shared_engine(sessions: int) -> list:
+    engine = RouterEngine()
+    await engine.start()
+    latencies = []
+    for i in range(sessions):
+        start = time.perf_counter()
+        session = await engine.open_session(f"user{i}", "bench", "")
+        latencies.append(time.perf_counter() - start)
+        await engine.close_session(session)
+    await engine.stop()
+    return latencies
+
+
+def report(name: str, latencies: list) -> None:
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:<22} mean {statistics.mean(latencies) * 1e3:8.3f} ms  "
+          f"p50 {statistics.median(latencies) * 1e3:8.3f} ms  p99 {p99 * 1e3:8.3f} ms")
+
+
+async def main(sessions: int) -> None:
+    report("rebuild per session", await rebuild_per_session(sessions))
+    report("shared engine", await shared_engine(sessions))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200)
+    args = parser.parse_args()
+    # Persistence and workspaces are relative to the working directory, keep them out of the tree.
+    os.chdir(tempfile.mkdtemp(prefix="bench_engine_setup_"))
+    asyncio.run(main(args.sessions))
@@ -0,0 +1,107 @@
+"""Local intent routing: scoring cost per message, and its effect on the router's rounds.
+
+The scoring run embeds `--messages` questions and scores them against the participants' profiles
+one at a time and in batches, as the micro-batching of concurrent sessions does. The routing run
+plays `--sessions` concurrent conversations of `--rounds` HR questions against the scripted model
+stand-in, whose selector calls take `--latency` seconds, without and with the local router, and
+reports the share of rounds decided without a selector call and the routing latency. The routing
+cache is off, it would answer the repeated questions either way. The local router batches the
+requests that arrive within `--batch-window` seconds.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_intent_router --sessions 100 --rounds 3 --latency 0.05 --batch-window 0.002
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict
+
+from data_agents.engine import RouterEngine, create_default_intent_router
+from data_agents.models.scripted_client import ScriptedChatCompletionClient, router_rules
+from data_agents.persistence.localfile import LocalFilePersistence
+
+ANSWER = "The company offers an annual leave of 10 days per year."
+QUESTIONS = [
+    "What's the annual leave policy for part-time staff?", "How many sick days do I get?",
+    "Does my unused leave carry over to next year?", "What is the salary of employee {}?",
+    "What is the notice period when I resign?", "Can I take parental leave after 6 months?",
+    "Hi there, quick one for you.", "My manager has not answered my request, what now?",
+]
+
+
+def bench_scoring(messages: int, batch_sizes: list) -> None:
+    router = create_default_intent_router()
+    texts = [QUESTIONS[i % len(QUESTIONS)].format(i) for i in range(messages)]
+    start = time.perf_counter()
+    for text in texts:
+        router.scores([text])
+    single = (time.perf_counter() - start) / messages
+    print(f"{'batch':>8}{'us/message':>14}")
+    print(f"{1:>8}{single * 1e6:>14.1f}")
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        for offset in range(0, messages, batch_size):
+            router.scores(texts[offset:offset + batch_size])
+        print(f"{batch_size:>8}{(time.perf_counter() - start) / messages * 1e6:>14.1f}")
+
+
+async def bench_routing(sessions: int, rounds: int, latency: float, local: bool, batch_window: float) -> Dict[str, Any]:
+    engine = RouterEngine(model_client=ScriptedChatCompletionClient(rules=router_rules(), default=ANSWER,
+                                                                    latency=latency),
+                          persistence=LocalFilePersistence(f"routing-{local}"),
+                          intent_router=create_default_intent_router(batch_window=batch_window) if local else None)
+    await engine.start()
+
+    async def conversation(index: int) -> None:
+        asked = 1
+
+        async def input_func(prompt: str = "", cancellation_token=None) -> str:
+            nonlocal asked
+            if asked >= rounds:
+                return "APPROVE"
+            asked += 1
+            return QUESTIONS[(index + asked) % len(QUESTIONS)].format(index)
+
+        async for _ in engine.run_stream(f"user{index}", "bench", "", QUESTIONS[index % len(QUESTIONS)].format(index),
+                                         input_func=input_func):
+            pass
+
+    start = time.perf_counter()
+    await asyncio.gather(*[conversation(index) for index in range(sessions)])
+    elapsed = time.perf_counter() - start
+    await engine.stop()
+    return {
+        "elapsed_s": elapsed,
+        "routing": engine.routing_stats.as_dict(),
+        "intent_router": engine.intent_router.stats.as_dict() if engine.intent_router is not None else None,
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    bench_scoring(args.messages, args.batch_sizes)
+    for local in (False, True):
+        result = await bench_routing(args.sessions, args.rounds, args.latency, local, args.batch_window)
+        routing = result["routing"]
+        print(f"\nlocal routing {'on' if local else 'off'}: {routing['rounds']} routing decisions in "
+              f"{result['elapsed_s']:.2f}s, {routing['llm_avoided_rate']:.0%} without the selector, "
+              f"p50 {routing['latency']['p50_ms']:.2f} ms, p90 {routing['latency']['p90_ms']:.2f} ms, "
+              f"p99 {routing['latency']['p99_ms']:.2f} ms")
+        print(json.dumps({"decided_by": routing["decided_by"], "intent_router": result["intent_router"]}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=10000, help="Messages scored by the scoring run.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 256])
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds of each scripted model call.")
+    parser.add_argument("--batch-window", type=float, default=0.0,
+                        help="Seconds the local router collects requests for, 0 batches those of one loop iteration.")
+    args = parser.parse_args()
+    os.chdir(tempfile.mkdtemp(prefix="bench_intent_router_"))
+    asyncio.run(main(args))
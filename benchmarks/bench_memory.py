@@ -0,0 +1,110 @@
+"""Resident memory per session of conversations waiting at the user's turn.
+
+Runs `--sessions` conversations of `--rounds` user messages against the scripted model stand-in,
+holds them all at their last input request and reports the memory allocated since they started,
+per session, as traced by `tracemalloc`, with the `--top` source lines holding the most of it.
+Compare commits by running it on each, e.g. before and after a change to how histories are kept.
+With `--suspend` the sessions are suspended at the user's turn rather than held, and resumed by
+the next user message, `--concurrency` of them at a time, and with `--resident` the sessions stay
+in a `SessionCache` of that size in between, whose estimate of their size is reported alongside.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_memory --sessions 20 --rounds 20
+    python -m benchmarks.bench_memory --sessions 10000 --rounds 3 [--suspend]
+    python -m benchmarks.bench_memory --sessions 1000 --rounds 3 --suspend --resident 1000
+"""
+import argparse
+import asyncio
+import gc
+import os
+import tempfile
+import tracemalloc
+
+from data_agents.engine import RouterConfig, RouterEngine
+from data_agents.models.scripted_client import ScriptedChatCompletionClient, router_rules
+from data_agents.persistence.localfile import LocalFilePersistence
+from data_agents.session_cache import SessionCache
+
+ANSWER = ("The company offers an annual leave of 10 days per year, and employees are required to notify "
+          "their line manager 3 days in advance. ") * 3
+# Source lines are shown relative to it, the benchmark runs in a temporary workspace.
+ROOT = os.getcwd()
+QUESTION = "Question number {} about the annual leave policy for part-time staff in the Berlin office?"
+
+
+async def main(args: argparse.Namespace) -> None:
+    persistence = LocalFilePersistence()
+    engine = RouterEngine(model_client=ScriptedChatCompletionClient(rules=router_rules(), default=ANSWER),
+                          persistence=persistence, config=RouterConfig(suspend_at_user_turn=args.suspend),
+                          session_cache=SessionCache(maxsize=args.resident) if args.resident else None)
+    await engine.start()
+    release = asyncio.Event()
+    held = asyncio.Semaphore(0)
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def conversation(index: int) -> None:
+        rounds = 0
+
+        async def input_func(prompt: str = "", cancellation_token=None) -> str:
+            nonlocal rounds
+            rounds += 1
+            if rounds >= args.rounds:
+                held.release()
+                await release.wait()
+                return "APPROVE"
+            return QUESTION.format(rounds)
+
+        async for _ in engine.run_stream(f"user-{index}", "name", "", "What's the annual leave policy?",
+                                         input_func=input_func):
+            pass
+
+    async def suspended_conversation(index: int) -> None:
+        async with limit:
+            task = "What's the annual leave policy?"
+            for rounds in range(1, args.rounds + 1):
+                async for _ in engine.run_stream(f"user-{index}", "name", "", task):
+                    pass
+                task = QUESTION.format(rounds)
+        held.release()
+
+    gc.collect()
+    tracemalloc.start(args.frames)
+    before = tracemalloc.take_snapshot()
+    tasks = [asyncio.create_task((suspended_conversation if args.suspend else conversation)(index))
+             for index in range(args.sessions)]
+    for _ in range(args.sessions):
+        await held.acquire()
+    await persistence.aflush()
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    print(f"{args.sessions} sessions {'suspended' if args.suspend else 'held'} at round {args.rounds}: "
+          f"{total / args.sessions / 1024:.1f} KiB per session, {total / 1024 / 1024:.2f} MiB in total, "
+          f"{total / args.sessions * 10000 / 1024 / 1024:.1f} MiB per 10k sessions")
+    if engine.session_cache is not None:
+        print(f"{len(engine.session_cache)} sessions resident, estimated "
+              f"{engine.session_cache.resident_bytes / len(engine.session_cache) / 1024:.1f} KiB per session")
+    for stat in after.compare_to(before, "lineno")[:args.top]:
+        frame = stat.traceback[0]
+        print(f"{stat.size_diff / args.sessions / 1024:8.1f} KiB  {stat.count_diff / args.sessions:7.1f} blocks  "
+              f"{os.path.relpath(frame.filename, ROOT)}:{frame.lineno}")
+
+    release.set()
+    await asyncio.gather(*tasks)
+    await engine.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=20, help="User messages of each conversation.")
+    parser.add_argument("--top", type=int, default=10, help="Source lines to list, by memory per session.")
+    parser.add_argument("--frames", type=int, default=1, help="Frames tracemalloc keeps per allocation.")
+    parser.add_argument("--suspend", action="store_true", help="Suspend the sessions at the user's turn.")
+    parser.add_argument("--resident", type=int, default=0, help="Sessions the session cache keeps resident.")
+    parser.add_argument("--concurrency", type=int, default=100, help="Suspended sessions running at a time.")
+    os.chdir(tempfile.mkdtemp())
+    asyncio.run(main(parser.parse_args()))
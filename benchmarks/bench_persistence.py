@@ -0,0 +1,128 @@
+"""Per-turn save and load cost of the snapshot, segment log and SQL (SQLite) backends.
+
+Each session grows by two messages per turn, the numbers are averaged over the last `--turns`
+turns before it reaches the given size. The throughput run then saves `--sessions` sessions of
+`--turns` turns each from `--threads` threads, as the write-behind workers of a busy router do.
+Run from the repository root:
+
+    python -m benchmarks.bench_persistence
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from autogen_core.models import UserMessage
+
+from data_agents.persistence.localfile import LocalFilePersistence
+from data_agents.persistence.segmentlog import SegmentLogPersistence
+from data_agents.persistence.sql import SQLPersistence
+
+AGENT_KEY = "group_chat_manager/{}"
+BACKENDS = {
+    "snapshot": LocalFilePersistence,
+    "segment log": SegmentLogPersistence,
+    "sql (sqlite)": lambda path: SQLPersistence(f"sqlite:///{os.path.join(path, 'sessions.sqlite3')}"),
+}
+
+
+def make_state(messages: int, uuid: str = "bench~user~~0") -> dict:
+    return {
+        AGENT_KEY.format(uuid): {
+            "memory": {
+                "messages": [
+                    UserMessage(content=f"message {i}: the company offers an annual leave of 10 days per year.",
+                                source="User" if i % 2 == 0 else "HR_onpre")
+                    for i in range(messages)
+                ],
+                "buffer_size": 100,
+            }
+        }
+    }
+
+
+def session_bytes(persistance_path: str, uuid: str) -> int:
+    total = 0
+    # The SQLite database, and its write-ahead log, hold only the benchmarked session.
+    for path in [os.path.join(persistance_path, uuid + suffix) for suffix in ('.json', '.snap', '.log')] + [
+            os.path.join(persistance_path, 'sessions.sqlite3' + suffix) for suffix in ('', '-wal')]:
+        if os.path.exists(path):
+            total += os.path.getsize(path)
+    return total
+
+
+def run(name: str, size: int, turns: int) -> dict:
+    persistance_path = tempfile.mkdtemp(prefix="bench_persistence_")
+    persistence = BACKENDS[name](persistance_path)
+    uuid = f"bench~user~~{size}"
+
+    persistence.save_content(uuid, make_state(max(size - 2 * turns, 0), uuid))
+    if isinstance(persistence, SegmentLogPersistence):
+        persistence.compact_due()
+    save_latencies = []
+    written = []
+    for turn in range(turns, 0, -1):
+        state = make_state(size - 2 * (turn - 1), uuid)
+        before = session_bytes(persistance_path, uuid)
+        start = time.perf_counter()
+        persistence.save_content(uuid, state)
+        save_latencies.append(time.perf_counter() - start)
+        after = session_bytes(persistance_path, uuid)
+        # A rewrite writes the whole file, an append writes the growth.
+        written.append(after if name == "snapshot" else max(after - before, 0))
+        if isinstance(persistence, SegmentLogPersistence):
+            # Off the save path, as the background compaction of the async methods.
+            persistence.compact_due()
+
+    load_latencies = []
+    for _ in range(turns):
+        # Use a fresh instance so nothing is served from per-session caches.
+        reader = BACKENDS[name](persistance_path)
+        start = time.perf_counter()
+        reader.load_content(uuid)
+        load_latencies.append(time.perf_counter() - start)
+
+    return {
+        "save_ms": statistics.mean(save_latencies) * 1e3,
+        "bytes_per_save": statistics.mean(written),
+        "load_ms": statistics.mean(load_latencies) * 1e3,
+    }
+
+
+def throughput(name: str, sessions: int, turns: int, threads: int) -> float:
+    """Saves per second of `sessions` sessions growing turn by turn, saved from `threads` threads."""
+    persistence = BACKENDS[name](tempfile.mkdtemp(prefix="bench_persistence_"))
+
+    def session(index: int) -> None:
+        uuid = f"user{index}~bench~~{index}"
+        for turn in range(1, turns + 1):
+            persistence.save_content(uuid, make_state(2 * turn, uuid))
+        if isinstance(persistence, SegmentLogPersistence):
+            persistence.compact_due()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(session, range(sessions)))
+    return sessions * turns / (time.perf_counter() - start)
+
+
+def main(args: argparse.Namespace) -> None:
+    print(f"{'backend':<14}{'messages':>10}{'save ms':>12}{'bytes/save':>14}{'load ms':>12}")
+    for size in args.sizes:
+        for name in BACKENDS:
+            result = run(name, size, args.turns)
+            print(f"{name:<14}{size:>10}{result['save_ms']:>12.3f}{result['bytes_per_save']:>14.0f}{result['load_ms']:>12.3f}")
+    print(f"\n{args.sessions} sessions of {args.turns} turns, {args.threads} threads")
+    for name in BACKENDS:
+        print(f"{name:<14}{throughput(name, args.sessions, args.turns, args.threads):>10.0f} saves/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    main(parser.parse_args())
@@ -0,0 +1,91 @@
+"""Balancing, retries and hedging of `EndpointPool` over scripted stand-in endpoints.
+
+The pool fronts three endpoints of one label: a fast one, one with a slow tail and one that
+fails a share of its requests. Each configuration serves `--requests` completions, `--concurrency`
+at a time, and reports the p50/p99 latency, the share of failed requests and the hedges and
+retries it took.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_pool --requests 2000 --concurrency 32
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from autogen_core.models import UserMessage
+
+from data_agents.models.pool import Endpoint, EndpointPool, percentile
+from data_agents.models.scripted_client import ScriptedChatCompletionClient
+
+CONFIGURATIONS = [
+    ("least_outstanding", None),
+    ("ewma", None),
+    ("least_outstanding", 0.95),
+    ("ewma", 0.95),
+]
+
+
+def endpoints(latency: float, tail_latency: float, tail_rate: float, failure_rate: float, seed: int) -> list:
+    return [
+        Endpoint("fast", ScriptedChatCompletionClient(latency=latency, seed=seed), "on-premise", max_concurrency=16),
+        Endpoint("slow-tail", ScriptedChatCompletionClient(
+            latency=latency, tail_latency=tail_latency, tail_rate=tail_rate, seed=seed + 1), "on-premise",
+            max_concurrency=16),
+        Endpoint("failing", ScriptedChatCompletionClient(
+            latency=latency, failure_rate=failure_rate, seed=seed + 2), "on-premise", max_concurrency=16),
+    ]
+
+
+async def run(pool: EndpointPool, requests: int, concurrency: int) -> tuple:
+    latencies: list = []
+    failures = 0
+    limit = asyncio.Semaphore(concurrency)
+    messages = [UserMessage(content="What's the annual leave policy?", source="User")]
+
+    async def request() -> None:
+        nonlocal failures
+        async with limit:
+            start = time.perf_counter()
+            try:
+                await pool.create(messages)
+            except Exception:
+                failures += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[request() for _ in range(requests)])
+    return latencies, failures
+
+
+async def main(args: argparse.Namespace) -> None:
+    print(f"{args.requests} requests, concurrency {args.concurrency}, latency {args.latency * 1e3:.0f} ms, "
+          f"tail {args.tail_latency * 1e3:.0f} ms at {args.tail_rate:.0%}, failures {args.failure_rate:.0%}")
+    print(f"{'strategy':<18} {'hedge':>6} {'p50 ms':>8} {'p99 ms':>8} {'failed':>7} {'hedges':>7} {'retries':>8}")
+    for strategy, hedge_percentile in CONFIGURATIONS:
+        pool = EndpointPool(
+            "on-premise",
+            endpoints(args.latency, args.tail_latency, args.tail_rate, args.failure_rate, args.seed),
+            strategy=strategy, retries=args.retries, backoff_base=0.01, hedge_percentile=hedge_percentile,
+            rng=random.Random(args.seed))
+        latencies, failures = await run(pool, args.requests, args.concurrency)
+        latencies.sort()
+        hedge = f"p{hedge_percentile * 100:.0f}" if hedge_percentile else "-"
+        print(f"{strategy:<18} {hedge:>6} {statistics.median(latencies) * 1e3:8.1f} "
+              f"{percentile(latencies, 0.99) * 1e3:8.1f} {failures / args.requests:7.1%} "
+              f"{pool.hedges:7d} {pool.retries:8d}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds to answer of every endpoint.")
+    parser.add_argument("--tail-latency", type=float, default=0.3, help="Extra seconds of the slow tail.")
+    parser.add_argument("--tail-rate", type=float, default=0.1, help="Share of slow-tail requests.")
+    parser.add_argument("--failure-rate", type=float, default=0.2, help="Share of failing requests.")
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
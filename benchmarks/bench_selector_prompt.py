@@ -0,0 +1,79 @@
+"""Selector prompt build time and size versus round count.
+
+Compares re-rendering the whole buffered history every round with the incrementally maintained
+`SelectorHistory`. Summaries are replaced by a fixed string so no model is called. Run from the
+repository root:
+
+    python -m benchmarks.bench_selector_prompt --rounds 1000
+"""
+import argparse
+import time
+from typing import List
+
+from autogen_core import AgentId, AgentInstantiationContext, SingleThreadedAgentRuntime
+from autogen_core.models import UserMessage
+
+from data_agents import engine
+from data_agents.groupchat_manager import GroupChatManager, SELECTOR_PROMPT
+from data_agents.utils.utils import count_tokens
+
+PARTICIPANTS = [engine.HR_ONPREMISE_TOPIC_TYPE, engine.HR_PUBLIC_TOPIC_TYPE, engine.USER_TOPIC_TYPE,
+                engine.GENERIC_ASSISTANT_ONPREMISE_TOPIC_TYPE, engine.GENERIC_ASSISTANT_PUBLIC_TOPIC_TYPE]
+DESCRIPTIONS = [engine.HR_ONPREMISE_DESCRIPTION, engine.HR_PUBLIC_DESCRIPTION, engine.USER_DESCRIPTION,
+                engine.GENERIC_ASSISTANT_ONPREMISE_DESCRIPTION, engine.GENERIC_ASSISTANT_PUBLIC_DESCRIPTION]
+
+
+def full_render_prompt(messages: List[UserMessage], candidates: List[str]) -> str:
+    # What GroupChatManager did every round before the incremental history.
+    lines = [f"{msg.source}: {msg.content}" for msg in messages[-100:]]
+    history = "\n".join(lines)
+    roles = "\n".join(f"{t}: {d}" for t, d in zip(PARTICIPANTS, DESCRIPTIONS) if t in candidates)
+    return SELECTOR_PROMPT.format(roles=roles, history=history[:-1], question=history[-1],
+                                  participants=str(candidates))
+
+
+def make_manager(budget: int | None) -> GroupChatManager:
+    runtime = SingleThreadedAgentRuntime()
+    with AgentInstantiationContext.populate_context((runtime, AgentId("group_chat_manager", "bench"))):
+        return GroupChatManager(
+            participant_topic_types=PARTICIPANTS,
+            model_client=None,
+            participant_descriptions=DESCRIPTIONS,
+            group_chat_topic_type="group_chat",
+            history_token_budget=budget,
+        )
+
+
+def main(rounds: int, budget: int, report_every: int) -> None:
+    manager = make_manager(budget)
+    candidates = PARTICIPANTS[:3]
+    messages: List[UserMessage] = []
+    print(f"{'round':>6}{'full ms':>10}{'full tokens':>13}{'incr ms':>10}{'incr tokens':>13}")
+    for round in range(1, rounds + 1):
+        message = UserMessage(content=f"round {round}: " + "the company offers an annual leave of 10 days. " * 4,
+                              source=PARTICIPANTS[round % len(PARTICIPANTS)])
+        messages.append(message)
+
+        start = time.perf_counter()
+        full_prompt = full_render_prompt(messages, candidates)
+        full_ms = (time.perf_counter() - start) * 1e3
+
+        start = time.perf_counter()
+        manager._history.append(message)
+        if manager._history.needs_summary:
+            manager._history.set_summary("earlier rounds discussed the annual leave policy.")
+        incremental_prompt = manager._build_selector_prompt(candidates)
+        incremental_ms = (time.perf_counter() - start) * 1e3
+
+        if round % report_every == 0:
+            print(f"{round:>6}{full_ms:>10.3f}{count_tokens(full_prompt):>13}"
+                  f"{incremental_ms:>10.3f}{count_tokens(incremental_prompt):>13}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=1000)
+    parser.add_argument("--budget", type=int, default=4000)
+    parser.add_argument("--report-every", type=int, default=100)
+    args = parser.parse_args()
+    main(args.rounds, args.budget, args.report_every)
@@ -0,0 +1,126 @@
+"""Load test of the HTTP front end against the scripted model stand-in.
+
+Serves `data_agents.server` in process, then drives `--sessions` conversations of `--rounds`
+user turns each, `--concurrency` at a time, over SSE. Reports sessions/sec and the latency of a
+round (user turn sent to the assistant's complete answer) and of its first streamed chunk.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_server --sessions 200 --concurrency 50 --rounds 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import tempfile
+import time
+
+import httpx
+import uvicorn
+
+from data_agents.engine import RouterConfig, RouterEngine
+from data_agents.models.scripted_client import ScriptedChatCompletionClient, route_rule, summary_rule
+from data_agents.server import RouterServer, create_app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def conversation(client: httpx.AsyncClient, index: int, rounds: int, round_latencies: list,
+                       first_chunk_latencies: list) -> bool:
+    started = time.perf_counter()
+    first_chunk = None
+    turns = 0
+    event = None
+    async with client.stream("POST", "/sessions", json={
+            "user_id": f"user{index}", "user_name": "bench", "task": "What's the annual leave policy?"}) as response:
+        if response.status_code != 200:
+            return False
+        async for line in response.aiter_lines():
+            line = line.rstrip("\r\n")
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+                continue
+            if not line.startswith("data: "):
+                continue
+            data = json.loads(line[len("data: "):])
+            if event == "session":
+                conversation_id = data["conversation_id"]
+            elif event == "chunk" and first_chunk is None:
+                first_chunk = time.perf_counter() - started
+            elif event == "message" and data["source"] != "User":
+                round_latencies.append(time.perf_counter() - started)
+                if first_chunk is not None:
+                    first_chunk_latencies.append(first_chunk)
+            elif event == "input":
+                turns += 1
+                content = "APPROVE" if turns >= rounds else "And for part-time employees?"
+                started, first_chunk = time.perf_counter(), None
+                await client.post(f"/sessions/{conversation_id}/input", json={"content": content})
+            elif event == "terminate":
+                return True
+    return False
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def main(sessions: int, concurrency: int, rounds: int, latency: float, max_sessions: int) -> None:
+    # Every user turn goes to the on-premise HR assistant, which answers without tools in a few chunks.
+    model_client = ScriptedChatCompletionClient(
+        rules=[summary_rule(), route_rule("HR_onpre")], default="Employees get 20 days of annual leave.",
+        latency=latency / 2, latency_per_token=latency / 2 / 10)
+    engine = RouterEngine(model_client=model_client, config=RouterConfig(streaming=True, output_queue_size=64))
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(create_app(RouterServer(engine, max_sessions=max_sessions)),
+                                           host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    round_latencies: list = []
+    first_chunk_latencies: list = []
+    limit = asyncio.Semaphore(concurrency)
+
+    async def run(index: int) -> bool:
+        async with limit:
+            return await conversation(client, index, rounds, round_latencies, first_chunk_latencies)
+
+    limits = httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency * 2)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60, limits=limits) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(*[run(index) for index in range(sessions)])
+        elapsed = time.perf_counter() - start
+        stats = (await client.get("/stats")).json()["sessions"]
+
+    server.should_exit = True
+    await serving
+
+    completed = sum(results)
+    print(f"sessions {completed}/{sessions} completed, {stats['rejected']} rejected, "
+          f"concurrency {concurrency}, {rounds} rounds, model latency {latency * 1e3:.0f} ms")
+    print(f"throughput      {completed / elapsed:8.1f} sessions/s")
+    for name, values in [("round", round_latencies), ("first chunk", first_chunk_latencies)]:
+        if values:
+            print(f"{name:<15} p50 {statistics.median(values) * 1e3:8.1f} ms  "
+                  f"p99 {percentile(values, 0.99) * 1e3:8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated model latency in seconds.")
+    parser.add_argument("--max-sessions", type=int, default=64)
+    args = parser.parse_args()
+    # Persistence and workspaces are relative to the working directory, keep them out of the tree.
+    os.chdir(tempfile.mkdtemp(prefix="bench_server_"))
+    asyncio.run(main(args.sessions, args.concurrency, args.rounds, args.latency, args.max_sessions))
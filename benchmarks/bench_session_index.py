@@ -0,0 +1,66 @@
+"""Session lookup latency: directory glob scan vs the sqlite session index.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_session_index --sessions 100000
+"""
+import argparse
+import glob
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+from data_agents.persistence.localfile import LocalFilePersistence
+
+
+def glob_get_uuid(persistance_path: str, userid: str) -> str | None:
+    # The lookup LocalFilePersistence.get_uuid used before the index.
+    for file in glob.glob(os.path.join(persistance_path, '*.json')):
+        file_name = os.path.basename(file)
+        if userid in file_name:
+            return os.path.splitext(file_name)[0]
+    return None
+
+
+def report(name: str, latencies: list) -> None:
+    print(f"{name:<14} mean {statistics.mean(latencies) * 1e3:10.3f} ms  "
+          f"p50 {statistics.median(latencies) * 1e3:10.3f} ms  max {max(latencies) * 1e3:10.3f} ms")
+
+
+def main(sessions: int, lookups: int) -> None:
+    persistance_path = tempfile.mkdtemp(prefix="bench_session_index_")
+    users = [f"user{i}~name{i}~" for i in range(sessions)]
+    for user in users:
+        with open(os.path.join(persistance_path, f"{user}~{uuid.uuid4()}.json"), "w") as file:
+            file.write("{}")
+
+    persistence = LocalFilePersistence(persistance_path)
+    start = time.perf_counter()
+    count = persistence.rebuild_index()
+    print(f"rebuild-index  {count} sessions in {time.perf_counter() - start:.2f} s")
+
+    # Look up the last users, the worst case of the scan.
+    targets = users[-lookups:]
+    glob_latencies = []
+    for user in targets:
+        start = time.perf_counter()
+        glob_get_uuid(persistance_path, user)
+        glob_latencies.append(time.perf_counter() - start)
+    index_latencies = []
+    for user in targets:
+        start = time.perf_counter()
+        persistence.get_uuid(user)
+        index_latencies.append(time.perf_counter() - start)
+
+    report("glob scan", glob_latencies)
+    report("index", index_latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=20)
+    args = parser.parse_args()
+    main(args.sessions, args.lookups)
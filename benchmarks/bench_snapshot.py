@@ -0,0 +1,130 @@
+"""Size and load time of session snapshots, JSON against the binary format and its codecs.
+
+Sessions are HR conversations of `--messages` messages, built from a pool of typical questions
+and answers. "zstd+dict" compresses with a dictionary trained on `--training` other sessions.
+Load times are the decode of the file's bytes: "resume" reads the newest `--resume` messages, as
+the group chat manager does for a session whose older turns are summarized, "full" reads all.
+"load_state" decodes the file and loads the manager's state from it, with `--budget` tokens of
+selector history, as resuming a session does.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_snapshot --messages 20 200 2000
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from autogen_core.models import UserMessage
+
+from benchmarks.bench_selector_prompt import make_manager
+from data_agents.persistence.localfile import to_messages, to_records
+from data_agents.persistence.snapshot import SnapshotCodec, train_dictionary
+
+QUESTIONS = [
+    "What's the company's annual leave policy?",
+    "How early do I need to notify my line manager before taking leave?",
+    "Does unused annual leave carry over to next year?",
+    "Can part-time staff in the Berlin office take parental leave?",
+    "What is the salary of employee {}?",
+    "How many sick days are covered without a doctor's note?",
+]
+ANSWERS = [
+    "The company offers an annual leave of 10 days per year, and employees are required to notify their "
+    "line manager 3 days in advance.",
+    "Up to 5 days of unused annual leave carry over, they expire at the end of March of the following year.",
+    "Employee {} is a senior engineer in the Berlin office, the salary is {} EUR per year.",
+    "Parental leave is available to all staff after 6 months of employment, part-time staff included.",
+    "Three sick days per year are covered without a doctor's note, longer absences need a certificate.",
+]
+SOURCES = ["HR_onpre", "HR_public", "generic_assitant_onpre"]
+AGENT_KEY = "group_chat_manager/bench~user~~{}"
+
+
+def make_content(messages: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    history = []
+    for i in range(messages):
+        if i % 2 == 0:
+            content = rng.choice(QUESTIONS).format(rng.randrange(1000, 9999))
+            history.append(UserMessage(content=content, source="User"))
+        else:
+            content = rng.choice(ANSWERS).format(rng.randrange(1000, 9999), rng.randrange(40000, 90000))
+            history.append(UserMessage(content=content, source=rng.choice(SOURCES)))
+    return {AGENT_KEY.format(seed): {"memory": {"messages": history, "buffer_size": 100},
+                                     "sensitive": False, "summary": "", "folded": 0, "last_assistant": None}}
+
+
+def json_encode(content: dict) -> bytes:
+    # The `LocalFilePersistence` format of earlier versions.
+    return json.dumps({key: {**value, "memory": {**value["memory"], "messages": to_records(value["memory"]["messages"])}}
+                       for key, value in content.items()}).encode("utf-8")
+
+
+def json_decode(data: bytes) -> dict:
+    content = json.loads(data)
+    for value in content.values():
+        value["memory"]["messages"] = to_messages(value["memory"]["messages"])
+    return content
+
+
+def timed(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main(args: argparse.Namespace) -> None:
+    dictionary = train_dictionary([make_content(max(args.messages), -seed) for seed in range(1, args.training + 1)],
+                                  args.dictionary_size)
+    formats = [
+        ("json", json_encode, json_decode),
+        *[(name, codec.encode, codec.decode) for name, codec in [
+            ("binary", SnapshotCodec("none")),
+            ("binary+lz4", SnapshotCodec("lz4")),
+            ("binary+zstd", SnapshotCodec("zstd")),
+            ("binary+zstd+dict", SnapshotCodec("zstd", dictionaries=[dictionary])),
+        ]],
+    ]
+    manager = make_manager(args.budget)
+    loop = asyncio.new_event_loop()
+    print(f"{'format':<18}{'messages':>10}{'bytes':>10}{'ratio':>8}{'save ms':>10}{'resume ms':>11}{'full ms':>10}"
+          f"{'load_state ms':>15}")
+    for size in args.messages:
+        content = make_content(size, seed=size)
+        json_size = len(json_encode(content))
+        for name, encode, decode in formats:
+            data = encode(content)
+
+            def resume():
+                messages = decode(data)[AGENT_KEY.format(size)]["memory"]["messages"]
+                return messages[-args.resume:]
+
+            def full():
+                return list(decode(data)[AGENT_KEY.format(size)]["memory"]["messages"])
+
+            def load_state():
+                loop.run_until_complete(manager.load_state(decode(data)[AGENT_KEY.format(size)]))
+
+            print(f"{name:<18}{size:>10}{len(data):>10}{json_size / len(data):>8.1f}"
+                  f"{timed(lambda: encode(content), args.repeat) * 1e3:>10.3f}"
+                  f"{timed(resume, args.repeat) * 1e3:>11.3f}{timed(full, args.repeat) * 1e3:>10.3f}"
+                  f"{timed(load_state, args.repeat) * 1e3:>15.3f}")
+    loop.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, nargs="+", default=[20, 200, 2000])
+    parser.add_argument("--resume", type=int, default=20, help="Newest messages read to resume a session.")
+    parser.add_argument("--budget", type=int, default=4000, help="Token budget of the selector history.")
+    parser.add_argument("--training", type=int, default=100, help="Sessions the zstd dictionary is trained on.")
+    parser.add_argument("--dictionary-size", type=int, default=16 * 1024)
+    parser.add_argument("--repeat", type=int, default=20)
+    main(parser.parse_args())
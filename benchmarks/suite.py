@@ -0,0 +1,210 @@
+"""End-to-end benchmark suite against the scripted model stand-in, results are printed as JSON.
+
+Measures topology setup, per-round selection overhead of `GroupChatManager`, tool-loop
+overhead of the assistants, persistence save/load cost and rounds/sec at each `--sessions`
+concurrency. Overheads are wall time between the publishes that start and end a stage and
+include the stand-in's latency, keep `--latency 0` to measure the router alone.
+
+Run from the repository root:
+
+    python -m benchmarks.suite --sessions 1 10 100 1000 --output results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from autogen_core import AgentId
+from autogen_core.base.intervention import DefaultInterventionHandler
+
+from data_agents import engine as router
+from data_agents.engine import RouterConfig, RouterEngine
+from data_agents.messages import GroupChatMessage, InputRequest, RequestToSpeak
+from data_agents.models.scripted_client import ScriptedChatCompletionClient, router_rules
+from data_agents.persistence.localfile import SNAPSHOT_SUFFIX, LocalFilePersistence
+
+ANSWER = "The company offers an annual leave of 10 days per year."
+QUESTIONS = ["What's the company's annual leave policy?", "How early do I need to ask for it?",
+             "Does it carry over to next year?"]
+
+
+def summarize(values: List[float]) -> Dict[str, Any]:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "mean_ms": statistics.mean(values) * 1e3,
+        "p50_ms": statistics.median(values) * 1e3,
+        "p99_ms": values[min(len(values) - 1, int(len(values) * 0.99))] * 1e3,
+    }
+
+
+class StageTimer(DefaultInterventionHandler):
+    """Times selection (a group chat message to the manager's request to speak) and the speaker's turn."""
+
+    def __init__(self) -> None:
+        self.selection: List[float] = []
+        self.tool_loop: List[float] = []
+        self._message_at: Dict[str, float] = {}
+        self._asked_at: Dict[str, float] = {}
+
+    async def on_publish(self, message: Any, *, sender: AgentId | None) -> Any:
+        if sender is None:
+            return message
+        now = time.perf_counter()
+        if isinstance(message, GroupChatMessage):
+            if sender.type != router.USER_TOPIC_TYPE and sender.key in self._asked_at:
+                self.tool_loop.append(now - self._asked_at.pop(sender.key))
+            self._message_at[sender.key] = now
+        elif isinstance(message, RequestToSpeak):
+            # The task that opens a session is published by the engine, its selection is not timed.
+            if sender.key in self._message_at:
+                self.selection.append(now - self._message_at.pop(sender.key))
+            self._asked_at[sender.key] = now
+        return message
+
+
+def model_client(latency: float) -> ScriptedChatCompletionClient:
+    return ScriptedChatCompletionClient(rules=router_rules(), default=ANSWER, latency=latency)
+
+
+async def conversation(engine: RouterEngine, index: int, rounds: int, round_latencies: List[float]) -> int:
+    # The task is the first round, the user then asks `rounds - 1` follow-ups and approves.
+    turns = iter(QUESTIONS[1:] * rounds)
+    asked = 1
+
+    async def input_func(prompt: str = "", cancellation_token=None) -> str:
+        nonlocal asked
+        if asked >= rounds:
+            return "APPROVE"
+        asked += 1
+        return next(turns)
+
+    answered = 0
+    started = time.perf_counter()
+    async for message in engine.run_stream(f"user{index}", "bench", "", QUESTIONS[0], input_func=input_func):
+        if isinstance(message, InputRequest):
+            now = time.perf_counter()
+            round_latencies.append(now - started)
+            answered += 1
+            started = now
+    return answered
+
+
+async def bench_setup(repeat: int, latency: float) -> Dict[str, Any]:
+    start_latencies, open_latencies = [], []
+    for i in range(repeat):
+        engine = RouterEngine(model_client=model_client(latency), persistence=LocalFilePersistence(f"setup{i}"))
+        start = time.perf_counter()
+        await engine.start()
+        start_latencies.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        session = await engine.open_session("user", "bench", "")
+        open_latencies.append(time.perf_counter() - start)
+        await engine.close_session(session)
+        await engine.stop()
+    return {"start": summarize(start_latencies), "open_session": summarize(open_latencies)}
+
+
+async def bench_sessions(sessions: int, rounds: int, latency: float, speculative: bool) -> Dict[str, Any]:
+    timer = StageTimer()
+    engine = RouterEngine(model_client=model_client(latency), persistence=LocalFilePersistence(f"sessions{sessions}"),
+                          intervention_handlers=[timer], config=RouterConfig(speculative=speculative))
+    await engine.start()
+    round_latencies: List[float] = []
+    start = time.perf_counter()
+    answered = await asyncio.gather(*[conversation(engine, i, rounds, round_latencies) for i in range(sessions)])
+    elapsed = time.perf_counter() - start
+    await engine.stop()
+    return {
+        "sessions": sessions,
+        "rounds": sum(answered),
+        "elapsed_s": elapsed,
+        "rounds_per_s": sum(answered) / elapsed,
+        "round": summarize(round_latencies),
+        "selection": summarize(timer.selection),
+        "tool_loop": summarize(timer.tool_loop),
+        "speculation": engine.speculation_stats.as_dict() if speculative else None,
+    }
+
+
+async def bench_persistence(rounds: int, repeat: int, latency: float) -> Dict[str, Any]:
+    persistence = LocalFilePersistence("persistence")
+    engine = RouterEngine(model_client=model_client(latency), persistence=persistence)
+    await engine.start()
+    await conversation(engine, 0, rounds, [])
+    await engine.stop()
+
+    uuid = persistence.get_uuid("user0~bench~")
+    save_latencies, load_latencies = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        content = persistence.load_content(uuid)
+        load_latencies.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        persistence.save_content(uuid, content)
+        save_latencies.append(time.perf_counter() - start)
+    return {
+        "rounds": rounds,
+        "bytes": os.path.getsize(os.path.join("persistence", uuid + SNAPSHOT_SUFFIX)),
+        "save": summarize(save_latencies),
+        "load": summarize(load_latencies),
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    results: Dict[str, Any] = {
+        "meta": {
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "args": vars(args),
+        },
+    }
+    print("setup", file=sys.stderr)
+    results["setup"] = await bench_setup(args.setup_repeat, args.latency)
+    results["concurrency"] = []
+    for sessions in args.sessions:
+        print(f"{sessions} concurrent sessions", file=sys.stderr)
+        results["concurrency"].append(await bench_sessions(sessions, args.rounds, args.latency, args.speculative))
+    print("persistence", file=sys.stderr)
+    results["persistence"] = await bench_persistence(args.persistence_rounds, args.persistence_repeat, args.latency)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--rounds", type=int, default=3, help="User turns per session.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to the first token of the stand-in.")
+    parser.add_argument("--speculative", action="store_true", help="Run assistants' turns speculatively.")
+    parser.add_argument("--setup-repeat", type=int, default=20)
+    parser.add_argument("--persistence-rounds", type=int, default=50)
+    parser.add_argument("--persistence-repeat", type=int, default=50)
+    parser.add_argument("--output", help="Also write the JSON results to this file.")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    # Persistence and workspaces are relative to the working directory, keep them out of the tree.
+    os.chdir(tempfile.mkdtemp(prefix="bench_suite_"))
+    results = asyncio.run(main(args))
+    print(json.dumps(results, indent=2))
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
@@ -6,6 +6,11 @@ from autogen_core.models import (
 from autogen_core.tools import ToolSchema
 from typing import Optional
 from data_agents.base import BaseGroupChatAgent
+from data_agents.context_policy import ContextPolicy
+from data_agents.speculation import SpeculationStats
+from data_agents.tool_loop import ToolLoopPolicy, ToolLoopStats
+from data_agents.transcript import Transcript
+from data_agents.deadline import StageTimeouts, TimeoutStats
 
 class GenericAssistant(BaseGroupChatAgent):
     def __init__(
@@ -14,7 +19,16 @@ class GenericAssistant(BaseGroupChatAgent):
         group_chat_topic_type: str,
         model_client: ChatCompletionClient,
         tool_schema: Optional[List[ToolSchema]] = None,
-        tool_agent_type: Optional[str] = None
+        tool_agent_type: Optional[str] = None,
+        context_policy: Optional[ContextPolicy] = None,
+        stream_topic_type: Optional[str] = None,
+        speculation_stats: Optional[SpeculationStats] = None,
+        tool_loop_policy: Optional[ToolLoopPolicy] = None,
+        tool_loop_stats: Optional[ToolLoopStats] = None,
+        transcript: Optional[Transcript] = None,
+        stage_timeouts: Optional[StageTimeouts] = None,
+        timeout_stats: Optional[TimeoutStats] = None,
+        fallback_model_client: Optional[ChatCompletionClient] = None,
     ) -> None:
         super().__init__(
             description=description,
@@ -24,7 +38,16 @@ class GenericAssistant(BaseGroupChatAgent):
             A usefule AI assistant, try best to resolve the question.
             """,
             tool_schema=tool_schema,
-            tool_agent_type=tool_agent_type
+            tool_agent_type=tool_agent_type,
+            context_policy=context_policy,
+            stream_topic_type=stream_topic_type,
+            speculation_stats=speculation_stats,
+            tool_loop_policy=tool_loop_policy,
+            tool_loop_stats=tool_loop_stats,
+            transcript=transcript,
+            stage_timeouts=stage_timeouts,
+            timeout_stats=timeout_stats,
+            fallback_model_client=fallback_model_client,
         )
 
 
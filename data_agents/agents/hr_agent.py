@@ -4,14 +4,11 @@ from autogen_core.models import (
 from autogen_core.tools import ToolSchema
 from typing import Optional, List
 from data_agents.base import BaseGroupChatAgent
-from data_agents.messages import RequestToSpeak
-from autogen_core import (
-    MessageContext,
-    message_handler,
-)
-from autogen_core.models import (
-    UserMessage,
-)
+from data_agents.context_policy import ChatHistory, ContextPolicy
+from data_agents.speculation import SpeculationStats
+from data_agents.tool_loop import ToolLoopPolicy, ToolLoopStats
+from data_agents.transcript import Transcript
+from data_agents.deadline import StageTimeouts, TimeoutStats
 
 class HRAssistant(BaseGroupChatAgent):
     def __init__(
@@ -22,6 +19,15 @@ class HRAssistant(BaseGroupChatAgent):
         tool_schema: Optional[List[ToolSchema]] = None,
         tool_agent_type: Optional[str] = None,
         workspace: Optional[str] = None,
+        context_policy: Optional[ContextPolicy] = None,
+        stream_topic_type: Optional[str] = None,
+        speculation_stats: Optional[SpeculationStats] = None,
+        tool_loop_policy: Optional[ToolLoopPolicy] = None,
+        tool_loop_stats: Optional[ToolLoopStats] = None,
+        transcript: Optional[Transcript] = None,
+        stage_timeouts: Optional[StageTimeouts] = None,
+        timeout_stats: Optional[TimeoutStats] = None,
+        fallback_model_client: Optional[ChatCompletionClient] = None,
     ) -> None:
         super().__init__(
             description=description,
@@ -32,18 +38,20 @@ class HRAssistant(BaseGroupChatAgent):
             """,
             tool_schema=tool_schema,
             tool_agent_type=tool_agent_type,
-            workspace=workspace
+            workspace=workspace,
+            context_policy=context_policy,
+            stream_topic_type=stream_topic_type,
+            speculation_stats=speculation_stats,
+            tool_loop_policy=tool_loop_policy,
+            tool_loop_stats=tool_loop_stats,
+            transcript=transcript,
+            stage_timeouts=stage_timeouts,
+            timeout_stats=timeout_stats,
+            fallback_model_client=fallback_model_client,
         )
 
         self.extra_instruction = None
 
-    @message_handler
-    async def handle_request_to_speak(self, message: RequestToSpeak, ctx: MessageContext) -> None:
+    def _before_turn(self, history: ChatHistory) -> None:
         if self.extra_instruction:
-            self._chat_history.append(
-                UserMessage(content=self.extra_instruction, source="system")
-            )
-        await super().handle_request_to_speak(
-            message,
-            ctx
-        )
\ No newline at end of file
+            history.append_note(self.extra_instruction)
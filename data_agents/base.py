@@ -1,5 +1,10 @@
-from typing import List, Optional
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, List, Mapping, Optional, Tuple
+import asyncio
+import time
 from autogen_core import (
+    CancellationToken,
     DefaultTopicId,
     MessageContext,
     RoutedAgent,
@@ -13,11 +18,65 @@ from autogen_core.models import (
     SystemMessage,
     UserMessage,
 )
-from data_agents.messages import GroupChatMessage, RequestToSpeak
+from data_agents.messages import (CancelSpeculation, GroupChatMessage, RequestToSpeak, SpeculateToSpeak, StreamChunk,
+                                  TerminateMessage)
+from data_agents.context_policy import ChatHistory, ContextPolicy, TokenBudgetPolicy, message_tokens
+from data_agents.speculation import SpeculationStats
+from data_agents.deadline import DeadlineToken, StageTimeoutError, StageTimeouts, TimeoutStats, linked_token, past_deadline, time_left
+from data_agents.transcript import Transcript
 from autogen_core.tools import ToolSchema
 import warnings
 warnings.simplefilter("ignore", UserWarning)
-from autogen_core.tool_agent import tool_agent_caller_loop
+from data_agents.tool_loop import ToolLoopPolicy, ToolLoopStats, tool_agent_caller_loop
+from data_agents import telemetry
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Speculation:
+    """A turn run on a copy of the chat history, ahead of the manager's decision."""
+    speculation_id: str
+    history: ChatHistory
+    # Messages the agent had received when the turn started, the copy is stale once it changes.
+    version: int
+    started: float
+    # The turn's token, linked to the session's while the turn runs.
+    cancellation_token: Optional[DeadlineToken] = None
+    task: Optional[asyncio.Task] = None
+    finished: Optional[float] = None
+    # Streamed chunks are held back until the turn is confirmed.
+    publish_chunk: Optional["_ChunkPublisher"] = None
+    chunks: List[str] = field(default_factory=list)
+    committed: bool = False
+
+
+class _ChunkPublisher:
+    """Publishes the chunks of one attempt at a turn's answer to the agent's stream topic."""
+
+    def __init__(self, agent: "BaseGroupChatAgent", started: float, cancellation_token: CancellationToken,
+                 restart: bool = False) -> None:
+        self._agent = agent
+        self._started = started
+        self._cancellation_token = cancellation_token
+        self._restart = restart
+        # Chunks published so far.
+        self.index = 0
+
+    async def __call__(self, content: str) -> None:
+        if not content:
+            return
+        elapsed = time.perf_counter() - self._started
+        if self.index == 0 and not self._restart:
+            self._agent.time_to_first_token.append(elapsed)
+        await self._agent.publish_message(
+            StreamChunk(source=self._agent.id.type, content=content, index=self.index, elapsed=elapsed,
+                        restart=self._restart and self.index == 0),
+            topic_id=DefaultTopicId(type=self._agent._stream_topic_type),
+            cancellation_token=self._cancellation_token,
+        )
+        self.index += 1
 
 
 class BaseGroupChatAgent(RoutedAgent):
@@ -31,48 +90,266 @@ class BaseGroupChatAgent(RoutedAgent):
         system_message: str,
         tool_schema: Optional[List[ToolSchema]] = None,
         tool_agent_type: Optional[str] = None,
-        workspace: Optional[str] = None
+        workspace: Optional[str] = None,
+        context_policy: Optional[ContextPolicy] = None,
+        stream_topic_type: Optional[str] = None,
+        speculation_stats: Optional[SpeculationStats] = None,
+        tool_loop_policy: Optional[ToolLoopPolicy] = None,
+        tool_loop_stats: Optional[ToolLoopStats] = None,
+        transcript: Optional[Transcript] = None,
+        stage_timeouts: Optional[StageTimeouts] = None,
+        timeout_stats: Optional[TimeoutStats] = None,
+        fallback_model_client: Optional[ChatCompletionClient] = None,
     ) -> None:
         super().__init__(description=description)
         self._group_chat_topic_type = group_chat_topic_type
         self._model_client = model_client
         self._system_message = SystemMessage(content=system_message)
-        self._chat_history: List[LLMMessage] = []
+        # Shared with the other agents of the session, the history only references its messages.
+        self._chat_history = ChatHistory(transcript)
         self._tool_schema = tool_schema
         self._tool_agent_id = AgentId(tool_agent_type, self.id.key) if tool_agent_type else None 
         self._workspace = workspace
+        self._context_policy = context_policy or TokenBudgetPolicy()
+        self._last_source: str | None = None
+        self._persona_index: int | None = None
+        # Prompt tokens sent to the model per turn, before tool calls, of the most recent turns.
+        self.tokens_sent: Deque[int] = deque(maxlen=1000)
+        # When set, the answer is streamed from the model and its chunks are published to this topic.
+        self._stream_topic_type = stream_topic_type
+        # Seconds from the request to speak to the first streamed chunk, of the most recent streamed turns.
+        self.time_to_first_token: Deque[float] = deque(maxlen=1000)
+        self._history_version = 0
+        self._speculation: Optional[_Speculation] = None
+        self._speculation_stats = speculation_stats
+        self._tool_loop_policy = tool_loop_policy or ToolLoopPolicy()
+        # Bounds the tool calls of all turns of the agent, a speculative one included.
+        self._tool_slots = asyncio.Semaphore(self._tool_loop_policy.max_concurrency)
+        self._tool_loop_stats = tool_loop_stats
+        self._stage_timeouts = stage_timeouts or StageTimeouts()
+        self._timeout_stats = timeout_stats
+        # A turn that runs out of time is retried once on this client, the on-premise deployment.
+        self._fallback_model_client = fallback_model_client
 
     @message_handler
     async def handle_message(self, message: GroupChatMessage, ctx: MessageContext) -> None:
-        self._chat_history.extend(
-            [
-                UserMessage(content=f"Transferred to {message.body.source}", source="system"),
-                message.body,
-            ]
-        )
+        # Consecutive messages of the same speaker need a single transfer note.
+        if message.body.source != self._last_source:
+            self._chat_history.append_note(f"Transferred to {message.body.source}")
+        self._chat_history.append_shared(message.body)
+        self._last_source = message.body.source
+        self._history_version += 1
 
-    @message_handler
-    async def handle_request_to_speak(self, message: RequestToSpeak, ctx: MessageContext) -> None:
-        # print(f"\n{'-'*80}\n{self.id.type} speaking:", flush=True)
-        self._chat_history.append(
-            UserMessage(content=f"Transferred to {self.id.type}, adopt the persona immediately.", source="system")
-        )
+    async def save_state(self) -> Mapping[str, Any]:
+        # A speculative turn is not part of the history until it is committed.
+        return {
+            "history": self._chat_history.save(),
+            "last_source": self._last_source,
+            "persona_index": self._persona_index,
+        }
+
+    async def load_state(self, state: Mapping[str, Any]) -> None:
+        self._chat_history.load(state["history"])
+        self._last_source = state.get("last_source")
+        self._persona_index = state.get("persona_index")
+
+    def _before_turn(self, history: ChatHistory) -> None:
+        """Hook for subclasses to add to the history a turn is run on."""
+
+    async def _run_turn(
+        self,
+        history: ChatHistory,
+        persona_index: Optional[int],
+        cancellation_token: CancellationToken,
+        on_chunk: Optional[Callable[[str], Awaitable[None]]],
+        speculative: bool = False,
+        model_client: Optional[ChatCompletionClient] = None,
+    ) -> Tuple[str, int]:
+        """Answer from `history` and append the answer to it, returns the answer and the new persona note index."""
+        with telemetry.stage("turn", session_id=self.id.key, topic_type=self.id.type, speculative=speculative):
+            return await self._answer(history, persona_index, cancellation_token, on_chunk,
+                                      model_client or self._model_client)
+
+    async def _answer(
+        self,
+        history: ChatHistory,
+        persona_index: Optional[int],
+        cancellation_token: CancellationToken,
+        on_chunk: Optional[Callable[[str], Awaitable[None]]],
+        model_client: ChatCompletionClient,
+    ) -> Tuple[str, int]:
+        self._before_turn(history)
+        # Only the latest persona note matters, drop the previous one.
+        if persona_index is not None:
+            history.remove_at(persona_index)
+        history.append_note(f"Transferred to {self.id.type}, adopt the persona immediately.")
+
+        input_messages = await self._context_policy.prepare(
+            history, self._system_message, model_client, cancellation_token)
+        # The policy may have folded older messages, find the persona note again.
+        persona_index = len(history) - 1
+        self.tokens_sent.append(sum(message_tokens(item) for item in input_messages))
+        logger.debug(f"{self.id}: {self.tokens_sent[-1]} prompt tokens, {len(input_messages)} messages")
 
         # Run the caller loop to handle tool calls.
         messages = await tool_agent_caller_loop(
             self,
             tool_agent_id=self._tool_agent_id,
-            model_client=self._model_client,
-            input_messages=[self._system_message] + self._chat_history,
+            model_client=model_client,
+            input_messages=input_messages,
             tool_schema=self._tool_schema,
-            cancellation_token=ctx.cancellation_token,
+            cancellation_token=cancellation_token,
+            on_chunk=on_chunk,
+            policy=self._tool_loop_policy,
+            slots=self._tool_slots,
+            stats=self._tool_loop_stats,
+            model_timeout=self._stage_timeouts.model,
+            timeout_stats=self._timeout_stats,
         )
         # Return the final response.
         assert isinstance(messages[-1].content, str)
-        # print(f"\n{messages[-1].content}")
-        self._chat_history.append(AssistantMessage(content=messages[-1].content, source=self.id.type))  # type: ignore
-        
+        history.append(AssistantMessage(content=messages[-1].content, source=self.id.type))  # type: ignore
+        return messages[-1].content, persona_index
+
+    @message_handler
+    async def handle_request_to_speak(self, message: RequestToSpeak, ctx: MessageContext) -> None:
+        # print(f"\n{'-'*80}\n{self.id.type} speaking:", flush=True)
+        started = time.perf_counter()
+        speculation, self._speculation = self._speculation, None
+        if speculation is not None and speculation.speculation_id == message.speculation_id \
+                and speculation.version == self._history_version:
+            try:
+                content = await self._commit(speculation, ctx.cancellation_token)
+            except Exception as e:
+                # The speculative turn ran out of time or failed, answer again from the history.
+                if not isinstance(e, asyncio.TimeoutError):
+                    logger.warning(f"{self.id}: speculative turn failed ({e!r}), answering again.")
+                elif not isinstance(e, StageTimeoutError) and self._timeout_stats is not None:
+                    self._timeout_stats.timed_out("turn")
+                content = await self._answer_in_time(
+                    started, ctx.cancellation_token,
+                    streamed=speculation.publish_chunk is not None and speculation.publish_chunk.index > 0)
+        else:
+            if speculation is not None:
+                self._discard(speculation)
+            content = await self._answer_in_time(started, ctx.cancellation_token)
+        if content is None:
+            if past_deadline(ctx.cancellation_token):
+                return
+            await self.publish_message(
+                TerminateMessage(content=f"{self.id.type} (termination condition): No answer in time."),
+                topic_id=DefaultTopicId(type=self._group_chat_topic_type),
+                cancellation_token=ctx.cancellation_token,
+            )
+            return
+        # print(f"\n{content}")
+        self._last_source = self.id.type
+
         await self.publish_message(
-            GroupChatMessage(body=UserMessage(content=messages[-1].content, source=self.id.type)),
+            GroupChatMessage(body=UserMessage(content=content, source=self.id.type)),
             topic_id=DefaultTopicId(type=self._group_chat_topic_type),
-        )
\ No newline at end of file
+            cancellation_token=ctx.cancellation_token,
+        )
+
+    async def _answer_in_time(self, started: float, cancellation_token: CancellationToken,
+                              streamed: bool = False) -> Optional[str]:
+        """Run the turn within the turn timeout, once more on the fallback client, None if neither answered in time.
+
+        An attempt after one that already streamed chunks, `streamed` for the turn's speculation, restarts the stream.
+        """
+        model_clients = [self._model_client]
+        if self._fallback_model_client is not None:
+            model_clients.append(self._fallback_model_client)
+        for attempt, model_client in enumerate(model_clients):
+            timeout = time_left(cancellation_token, self._stage_timeouts.turn)
+            if attempt and timeout is not None and timeout <= 0:
+                break
+            # A turn that runs out of time leaves the history as it was.
+            history = self._chat_history.copy()
+            publish_chunk = _ChunkPublisher(self, started, cancellation_token, restart=streamed) \
+                if self._stream_topic_type else None
+            try:
+                content, persona_index = await asyncio.wait_for(self._run_turn(
+                    history, self._persona_index, cancellation_token, publish_chunk,
+                    model_client=model_client), timeout=timeout)
+            except asyncio.TimeoutError as e:
+                streamed = streamed or (publish_chunk is not None and publish_chunk.index > 0)
+                if past_deadline(cancellation_token):
+                    return None
+                if not isinstance(e, StageTimeoutError) and self._timeout_stats is not None:
+                    self._timeout_stats.timed_out("turn")
+                logger.warning(f"{self.id}: turn timed out ({str(e) or f'after {timeout}s'}), attempt {attempt + 1}.")
+                continue
+            self._chat_history, self._persona_index = history, persona_index
+            if attempt and self._timeout_stats is not None:
+                self._timeout_stats.fell_back("turn", "on_premise")
+            return content
+        if self._timeout_stats is not None:
+            self._timeout_stats.fell_back("turn", "terminate")
+        return None
+
+    @message_handler
+    async def handle_speculate_to_speak(self, message: SpeculateToSpeak, ctx: MessageContext) -> None:
+        if self._speculation is not None:
+            self._discard(self._speculation)
+        speculation = _Speculation(speculation_id=message.speculation_id, history=self._chat_history.copy(),
+                                   version=self._history_version, started=time.perf_counter())
+        on_chunk = None
+        if self._stream_topic_type:
+            speculation.publish_chunk = _ChunkPublisher(self, speculation.started, ctx.cancellation_token)
+
+            async def on_chunk(content: str) -> None:
+                if speculation.committed:
+                    await speculation.publish_chunk(content)
+                else:
+                    speculation.chunks.append(content)
+
+        async def run() -> Tuple[str, int]:
+            # Cancelled with the session's run too, unlinked from it when the turn ends.
+            with linked_token(ctx.cancellation_token) as turn_token:
+                speculation.cancellation_token = turn_token
+                return await self._run_turn(speculation.history, self._persona_index, turn_token, on_chunk,
+                                            speculative=True)
+
+        speculation.task = asyncio.ensure_future(run())
+
+        def finished(task: asyncio.Task) -> None:
+            speculation.finished = time.perf_counter()
+            if not task.cancelled() and task.exception() is not None and not speculation.committed:
+                logger.debug(f"{self.id}: speculative turn failed: {task.exception()!r}")
+        speculation.task.add_done_callback(finished)
+        self._speculation = speculation
+
+    @message_handler
+    async def handle_cancel_speculation(self, message: CancelSpeculation, ctx: MessageContext) -> None:
+        if self._speculation is not None and self._speculation.speculation_id == message.speculation_id:
+            self._discard(self._speculation)
+            self._speculation = None
+
+    async def _commit(self, speculation: _Speculation, cancellation_token: CancellationToken) -> str:
+        confirmed = time.perf_counter()
+        # Release the held back chunks in order, later ones are published as they arrive.
+        flushed = 0
+        while speculation.publish_chunk is not None and flushed < len(speculation.chunks):
+            await speculation.publish_chunk(speculation.chunks[flushed])
+            flushed += 1
+        speculation.committed = True
+        # The turn started with the speculation, it has what is left of the turn timeout.
+        timeout = self._stage_timeouts.turn
+        if timeout is not None:
+            timeout = max(timeout - (time.perf_counter() - speculation.started), 0.0)
+        content, self._persona_index = await asyncio.wait_for(
+            speculation.task, timeout=time_left(cancellation_token, timeout))
+        self._chat_history = speculation.history
+        if self._speculation_stats is not None:
+            overlap_end = confirmed if speculation.finished is None else min(confirmed, speculation.finished)
+            self._speculation_stats.saved.append(overlap_end - speculation.started)
+        return content
+
+    def _discard(self, speculation: _Speculation) -> None:
+        if speculation.cancellation_token is not None:
+            speculation.cancellation_token.cancel()
+        speculation.task.cancel()
+        if self._speculation_stats is not None:
+            self._speculation_stats.discarded.append(
+                (speculation.finished or time.perf_counter()) - speculation.started)
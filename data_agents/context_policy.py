@@ -0,0 +1,241 @@
+from abc import ABC, abstractmethod
+from array import array
+from collections.abc import Sequence
+from typing import Any, Dict, Iterator, List, Optional
+from autogen_core import CancellationToken
+from autogen_core.models import (
+    AssistantMessage,
+    ChatCompletionClient,
+    LLMMessage,
+    SystemMessage,
+    UserMessage,
+)
+from data_agents.deadline import linked_token
+from data_agents.transcript import Transcript, message_tokens
+
+# Kinds of history entries, an entry is the position of its message shifted left by 2 bits, or'd with its kind.
+_SHARED, _NOTE, _PRIVATE = 0, 1, 2
+# Types of the agent's own messages, its answers and the summaries of folded messages.
+_PRIVATE_TYPES = {cls.__name__: cls for cls in (AssistantMessage, UserMessage)}
+
+
+class ChatHistory:
+    """Chat history of an agent, a view of its session's `Transcript` plus the agent's own messages.
+
+    Group chat messages and system notes are referenced by their position in the transcript, only
+    the agent's own messages (its answers, summaries of folded messages) are held here. The token
+    count of each message is computed once, when it is first stored.
+    """
+
+    def __init__(self, transcript: Optional[Transcript] = None) -> None:
+        self._transcript = transcript if transcript is not None else Transcript()
+        self._entries = array("q")
+        self._private: List[LLMMessage] = []
+        self._private_tokens = array("I")
+
+    def _message(self, entry: int) -> LLMMessage:
+        position, kind = entry >> 2, entry & 3
+        if kind == _SHARED:
+            return self._transcript.message(position)
+        if kind == _NOTE:
+            return self._transcript.note_message(position)
+        return self._private[position]
+
+    def _tokens(self, entry: int) -> int:
+        position, kind = entry >> 2, entry & 3
+        if kind == _SHARED:
+            return self._transcript.tokens(position)
+        if kind == _NOTE:
+            return self._transcript.note_tokens(position)
+        return self._private_tokens[position]
+
+    def _add_private(self, message: LLMMessage) -> int:
+        self._private.append(message)
+        self._private_tokens.append(message_tokens(message))
+        return (len(self._private) - 1) << 2 | _PRIVATE
+
+    def append(self, message: LLMMessage) -> None:
+        """Append a message of the agent's own."""
+        self._entries.append(self._add_private(message))
+
+    def append_shared(self, message: LLMMessage) -> None:
+        """Append a group chat message, stored once in the transcript for all agents of the session."""
+        self._entries.append(self._transcript.add(message) << 2 | _SHARED)
+
+    def append_note(self, content: str) -> None:
+        """Append a system note, notes with the same content are one message of the transcript."""
+        self._entries.append(self._transcript.note(content) << 2 | _NOTE)
+
+    def extend(self, messages: List[LLMMessage]) -> None:
+        for message in messages:
+            self.append(message)
+
+    def remove_at(self, index: int) -> None:
+        del self._entries[index]
+
+    def fold(self, count: int, summary: LLMMessage) -> None:
+        """Replace the oldest `count` messages by `summary`."""
+        entries = [self._add_private(summary)] + list(self._entries[count:])
+        # Drop the agent's own messages that were folded.
+        private, private_tokens = self._private, self._private_tokens
+        self._private, self._private_tokens = [], array("I")
+        self._entries = array("q")
+        for entry in entries:
+            if entry & 3 == _PRIVATE:
+                self._private.append(private[entry >> 2])
+                self._private_tokens.append(private_tokens[entry >> 2])
+                entry = (len(self._private) - 1) << 2 | _PRIVATE
+            self._entries.append(entry)
+
+    def copy(self) -> "ChatHistory":
+        history = ChatHistory(self._transcript)
+        history._entries = array("q", self._entries)
+        history._private = list(self._private)
+        history._private_tokens = array("I", self._private_tokens)
+        return history
+
+    def save(self) -> List[Any]:
+        """The entries as JSON: transcript positions, note contents and the agent's own messages."""
+        saved: List[Any] = []
+        for entry in self._entries:
+            position, kind = entry >> 2, entry & 3
+            if kind == _SHARED:
+                saved.append(position)
+            elif kind == _NOTE:
+                saved.append(self._transcript.note_message(position).content)
+            else:
+                saved.append(self._private[position].model_dump())
+        return saved
+
+    def load(self, saved: List[Any]) -> None:
+        """Restore saved entries, their positions refer to the transcript the session saved along."""
+        self._entries = array("q")
+        self._private, self._private_tokens = [], array("I")
+        for item in saved:
+            if isinstance(item, int):
+                self._entries.append(item << 2 | _SHARED)
+            elif isinstance(item, str):
+                self.append_note(item)
+            else:
+                item = dict(item)
+                self.append(_PRIVATE_TYPES[item.pop("type")](**item))
+
+    @property
+    def messages(self) -> Sequence[LLMMessage]:
+        return _EntryView(self._entries, self._message)
+
+    @property
+    def tokens(self) -> Sequence[int]:
+        return _EntryView(self._entries, self._tokens)
+
+    def __iter__(self) -> Iterator[LLMMessage]:
+        return (self._message(entry) for entry in self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __getitem__(self, index):
+        return self.messages[index]
+
+
+class _EntryView(Sequence):
+    """Read-only sequence resolving history entries, slices are lists."""
+
+    def __init__(self, entries: array, resolve) -> None:
+        self._entries = entries
+        self._resolve = resolve
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._resolve(entry) for entry in self._entries[index]]
+        return self._resolve(self._entries[index])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ContextPolicy(ABC):
+    """Decides which part of the chat history is sent to the model."""
+
+    @abstractmethod
+    async def prepare(
+        self,
+        history: ChatHistory,
+        system_message: SystemMessage,
+        model_client: ChatCompletionClient,
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> List[LLMMessage]:
+        """Return the messages to send, system message included."""
+        pass
+
+
+class FullHistoryPolicy(ContextPolicy):
+    async def prepare(self, history, system_message, model_client, cancellation_token=None) -> List[LLMMessage]:
+        return [system_message] + history.messages[:]
+
+
+class SlidingWindowPolicy(ContextPolicy):
+    def __init__(self, max_messages: int = 20) -> None:
+        self._max_messages = max_messages
+
+    async def prepare(self, history, system_message, model_client, cancellation_token=None) -> List[LLMMessage]:
+        return [system_message] + history.messages[-self._max_messages:]
+
+
+def _fit(history: ChatHistory, budget: int) -> int:
+    """Index of the oldest message of the newest suffix of `history` that fits in `budget` tokens."""
+    start = len(history)
+    used = 0
+    while start > 0 and used + history.tokens[start - 1] <= budget:
+        start -= 1
+        used += history.tokens[start]
+    # Never send an empty history, the latest message goes even if it alone exceeds the budget.
+    return min(start, max(len(history) - 1, 0))
+
+
+class TokenBudgetPolicy(ContextPolicy):
+    """Send the newest messages that fit in `max_tokens`, the system message included."""
+
+    def __init__(self, max_tokens: int = 6000) -> None:
+        self._max_tokens = max_tokens
+
+    async def prepare(self, history, system_message, model_client, cancellation_token=None) -> List[LLMMessage]:
+        start = _fit(history, self._max_tokens - message_tokens(system_message))
+        return [system_message] + history.messages[start:]
+
+
+SUMMARY_PROMPT = """Summarize the conversation below so that an assistant can continue it.
+Keep the user's questions, the answers given, facts and figures still relevant, and open requests.
+Answer in at most {max_words} words.
+----------------
+{messages}
+"""
+
+
+class SummarizeAndTruncatePolicy(ContextPolicy):
+    """Like `TokenBudgetPolicy`, but folds the messages that no longer fit into a summary message.
+
+    The summary replaces the folded messages in the history, so each message is summarized once.
+    Folding keeps `keep_tokens` of the budget for the newest messages, so it only happens again
+    after the history has grown by the remaining part of the budget.
+    """
+
+    def __init__(self, max_tokens: int = 6000, keep_tokens: int = 3000, summary_max_words: int = 200) -> None:
+        self._max_tokens = max_tokens
+        self._keep_tokens = keep_tokens
+        self._summary_max_words = summary_max_words
+
+    async def prepare(self, history, system_message, model_client, cancellation_token=None) -> List[LLMMessage]:
+        budget = self._max_tokens - message_tokens(system_message)
+        if _fit(history, budget) > 0:
+            start = _fit(history, min(self._keep_tokens, budget))
+            lines = [f"{getattr(message, 'source', 'system')}: {message.content}" for message in history.messages[:start]]
+            with linked_token(cancellation_token) as call_token:
+                completion = await model_client.create(
+                    [SystemMessage(content=SUMMARY_PROMPT.format(max_words=self._summary_max_words, messages="\n".join(lines)))],
+                    cancellation_token=call_token,
+                )
+            assert isinstance(completion.content, str)
+            history.fold(start, UserMessage(content=f"Summary of the earlier conversation: {completion.content}", source="system"))
+        start = _fit(history, budget)
+        return [system_message] + history.messages[start:]
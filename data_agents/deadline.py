@@ -0,0 +1,124 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Counter as CounterType, Dict, Iterator, Optional
+import asyncio
+import contextlib
+from autogen_core import CancellationToken
+
+
+class DeadlineToken(CancellationToken):
+    """Cancellation token of a session's run, also cancelled when its deadline passes.
+
+    The engine publishes the run's messages with it and every agent passes on the token of the
+    message it handles, so model calls and tools of the run are all cancelled with it. Deadlines
+    are on the event loop's clock.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.deadline: Optional[float] = None
+        self.expired = False
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def expire_after(self, seconds: float) -> None:
+        loop = asyncio.get_running_loop()
+        if self._timer is not None:
+            self._timer.cancel()
+        self.deadline = loop.time() + seconds
+        self._timer = loop.call_at(self.deadline, self._expire)
+
+    def _expire(self) -> None:
+        if not self.is_cancelled():
+            self.expired = True
+            self.cancel()
+
+    def cancel(self) -> None:
+        super().cancel()
+        # The timer would keep the run's callbacks alive until the deadline.
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def remove_callback(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+@contextlib.contextmanager
+def linked_token(parent: Optional[CancellationToken]) -> Iterator[DeadlineToken]:
+    """A token for one call or turn, cancelled with `parent` and sharing its deadline.
+
+    The link is dropped on exit, so a token that lives as long as the session does not collect a
+    callback per call. Tokens other than a `DeadlineToken` cannot drop one, they keep it.
+    """
+    child = DeadlineToken()
+    child.deadline = getattr(parent, "deadline", None)
+    if parent is not None:
+        parent.add_callback(child.cancel)
+    try:
+        yield child
+    finally:
+        if isinstance(parent, DeadlineToken):
+            parent.remove_callback(child.cancel)
+
+
+def time_left(token: Optional[CancellationToken], timeout: Optional[float]) -> Optional[float]:
+    """Seconds a stage may take: its `timeout`, cut to the deadline of `token` if it has one."""
+    deadline = getattr(token, "deadline", None)
+    if deadline is None:
+        return timeout
+    remaining = max(deadline - asyncio.get_running_loop().time(), 0.0)
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+def past_deadline(token: Optional[CancellationToken]) -> bool:
+    """Whether the deadline of `token` has passed, a stage cut short by it is left to the run's termination."""
+    deadline = getattr(token, "deadline", None)
+    return deadline is not None and asyncio.get_running_loop().time() >= deadline
+
+
+class StageTimeoutError(TimeoutError):
+    """A stage of a turn ran out of time."""
+
+    def __init__(self, stage: str, timeout: Optional[float]) -> None:
+        super().__init__(f"{stage} timed out after {timeout}s")
+        self.stage = stage
+
+
+@dataclass
+class StageTimeouts:
+    """Seconds each stage may take, None for no limit, and the default deadline of a `run_stream`.
+
+    - `routing`: a speaker decision of the group chat manager, the selector call and summary refresh.
+    - `model`: one model call of an assistant.
+    - `turn`: an assistant's answer, tool loop included, the turn is retried once on the
+      on-premise deployment when it runs out.
+    - `user_input`: the wait for the user's input.
+    - `session`: a `run_stream`, from the user's message to the end of its output.
+
+    Tool calls are bounded by `ToolLoopPolicy.call_timeout`. Every stage is also cut to what is
+    left of the run's deadline.
+    """
+    routing: Optional[float] = 60.0
+    model: Optional[float] = 120.0
+    turn: Optional[float] = 300.0
+    user_input: Optional[float] = None
+    session: Optional[float] = None
+
+
+@dataclass
+class TimeoutStats:
+    """Timeouts per stage and the fallbacks taken, shared by the agents of an engine."""
+    timeouts: CounterType[str] = field(default_factory=Counter)
+    # "<stage>/<fallback>", e.g. "turn/on_premise" or "routing/terminate".
+    fallbacks: CounterType[str] = field(default_factory=Counter)
+
+    def timed_out(self, stage: str) -> None:
+        self.timeouts[stage] += 1
+
+    def fell_back(self, stage: str, fallback: str) -> None:
+        self.fallbacks[f"{stage}/{fallback}"] += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"timeouts": dict(self.timeouts), "fallbacks": dict(self.fallbacks)}
@@ -0,0 +1,646 @@
+from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
+import asyncio
+from dataclasses import dataclass, field
+from autogen_core.tools import Tool
+from autogen_core.tool_agent import ToolAgent
+from typing import List, Any, AsyncGenerator, Optional, Callable, Dict, Mapping
+from autogen_core import (
+    SingleThreadedAgentRuntime,
+    TopicId,
+    TypeSubscription,
+    AgentId,
+    AgentInstantiationContext,
+    CancellationToken,
+)
+from autogen_core.models import (
+    ChatCompletionClient,
+    UserMessage,
+)
+from autogen_core.base.intervention import DefaultInterventionHandler, DropMessage, InterventionHandler
+from data_agents.messages import GroupChatMessage, InputRequest, StreamChunk, TerminateMessage
+from data_agents.utils.tools.hr import hr_rules_and_regulations, employee_info
+from data_agents.utils.tools.generic import weather
+from data_agents.utils.tools.cached import CachedTool, ToolCachePolicy
+from data_agents.utils.tools.threaded import ThreadedFunctionTool
+from data_agents.tool_loop import ToolLoopPolicy, ToolLoopStats
+from concurrent.futures import ThreadPoolExecutor
+from data_agents.user_agent import UserAgent
+from data_agents.groupchat_manager import GroupChatManager
+from data_agents.agents.hr_agent import HRAssistant
+from data_agents.agents.generic_assitant_agent import GenericAssistant
+from data_agents.sensitivity import SensitivityDetector, label_of
+from data_agents.context_policy import ContextPolicy
+from data_agents.cache import TTLCache
+from data_agents.speculation import SpeculationStats
+from data_agents.twins import TwinBalancer
+from data_agents.transcript import Transcript
+from data_agents.session_cache import ResidentSession, SessionCache, estimate_bytes
+from data_agents.runtime_internals import adopt_agents, forget_topics, release_agents
+from data_agents.intent_router import IntentRouter
+from data_agents.routing_stats import RoutingStats
+from data_agents.deadline import DeadlineToken, StageTimeouts, TimeoutStats
+from data_agents.models.cached_client import CachedChatCompletionClient, CompletionCache
+from data_agents.models.pool import EndpointPool
+from data_agents.models.traced_client import TracedChatCompletionClient
+from data_agents import telemetry
+from data_agents.persistence.base import AsyncPersistence
+from data_agents.persistence.localfile import LocalFilePersistence
+from data_agents.constants import WORKSPACE_DEFAULT
+import uuid
+import os
+import pathlib
+
+
+GROUP_CHAT_TOPIC_TYPE = "group_chat"
+GROUP_CHAT_MANAGER_TYPE = "group_chat_manager"
+USER_TOPIC_TYPE = "User"
+HR_ONPREMISE_TOPIC_TYPE = "HR_onpre"
+HR_PUBLIC_TOPIC_TYPE = "HR_public"
+GENERIC_ASSISTANT_ONPREMISE_TOPIC_TYPE = "generic_assistant_onpre"
+GENERIC_ASSISTANT_PUBLIC_TOPIC_TYPE = "generic_assistant_public"
+
+USER_DESCRIPTION = "User for providing final approval or further requirement, if question already be resolved, pick the role for final approve or further question"
+HR_ONPREMISE_DESCRIPTION = "A agent to answer HR-related questions, including general rules and regulations, as well as potentially sensitive employee information. label: on-premise"
+HR_PUBLIC_DESCRIPTION = "A agent to answer HR-related questions, including general rules and regulations, as well as potentially sensitive employee information. label: public"
+GENERIC_ASSISTANT_ONPREMISE_DESCRIPTION = "Assistant for Handling General Inquiries. label: on-premise"
+GENERIC_ASSISTANT_PUBLIC_DESCRIPTION = "Assistant for Handling General Inquiries. label: public"
+
+PARTICIPANT_TOPIC_TYPES = [HR_ONPREMISE_TOPIC_TYPE, HR_PUBLIC_TOPIC_TYPE, USER_TOPIC_TYPE,
+                           GENERIC_ASSISTANT_ONPREMISE_TOPIC_TYPE, GENERIC_ASSISTANT_PUBLIC_TOPIC_TYPE]
+PARTICIPANT_DESCRIPTIONS = [HR_ONPREMISE_DESCRIPTION, HR_PUBLIC_DESCRIPTION, USER_DESCRIPTION,
+                            GENERIC_ASSISTANT_ONPREMISE_DESCRIPTION, GENERIC_ASSISTANT_PUBLIC_DESCRIPTION]
+
+# Typical user messages per participant, the profiles the local intent router matches against.
+HR_EXAMPLES = [
+    "What's the company's annual leave policy?", "How many vacation days do I get per year?",
+    "How early do I need to notify my line manager before taking leave?", "Does unused annual leave carry over?",
+    "Can part-time staff take parental leave?", "How many sick days are covered without a doctor's note?",
+    "What is the salary of employee 1234?", "Show me the employee information of my team.",
+    "What is the notice period for resignation?", "What are the working hours and overtime rules?",
+    "How does the performance review work?", "Which benefits and insurance does the company offer?",
+    "When is payroll paid each month?", "How do I request remote work from home?",
+]
+GENERIC_ASSISTANT_EXAMPLES = [
+    "What's the weather in Berlin today?", "Will it rain in London tomorrow?", "How hot is it in Tokyo?",
+    "Translate this sentence into French.", "Write a short poem about the sea.", "Summarize this article for me.",
+    "What is the capital of Australia?", "Explain how a neural network works.", "Recommend a good book to read.",
+    "Tell me a joke.", "How do I convert Celsius to Fahrenheit?", "Help me write an email to a customer.",
+]
+PARTICIPANT_EXAMPLES = {
+    HR_ONPREMISE_TOPIC_TYPE: HR_EXAMPLES,
+    HR_PUBLIC_TOPIC_TYPE: HR_EXAMPLES,
+    GENERIC_ASSISTANT_ONPREMISE_TOPIC_TYPE: GENERIC_ASSISTANT_EXAMPLES,
+    GENERIC_ASSISTANT_PUBLIC_TOPIC_TYPE: GENERIC_ASSISTANT_EXAMPLES,
+}
+
+
+def create_default_intent_router(**kwargs: Any) -> IntentRouter:
+    """An `IntentRouter` over the router's participants and their example messages."""
+    return IntentRouter(PARTICIPANT_TOPIC_TYPES, PARTICIPANT_DESCRIPTIONS, examples=PARTICIPANT_EXAMPLES, **kwargs)
+
+
+def create_default_model_client() -> ChatCompletionClient:
+    return AzureOpenAIChatCompletionClient(
+        azure_deployment="csg-gpt4",
+        model="gpt-4-0613",
+        api_version="2024-02-15-preview",
+        azure_endpoint="your endpoint",
+        api_key="your api key",
+    )
+
+
+@dataclass
+class RouterConfig:
+    """Behaviour of a `RouterEngine`, the components it is built from are passed to the engine itself.
+
+    - `streaming`: stream the assistants' answers to the user as `StreamChunk`s ahead of each full message.
+    - `output_queue_size`: messages a session may buffer for a slow consumer before its agents wait, 0 is unbounded.
+    - `speculative`: start the predicted assistant's turn while the selector decides.
+    - `balance_twins`: with endpoint pools, move a turn to the twin of the selected participant when that
+      one is expected to answer first, to a public twin only while the conversation is not sensitive.
+    - `suspend_at_user_turn`: save and release a session while it waits for the user, see `RouterEngine.run_stream`.
+    - `tool_threads`: threads running the synchronous tool functions, off the event loop.
+    - `tool_loop_policy`: concurrency, timeout and iteration limits of the assistants' tool loops.
+    - `stage_timeouts`: seconds routing, model calls, turns, the user's input and a run may take.
+    - `max_rounds`: speaker selections after which a conversation terminates, a suspended conversation
+      keeps counting across its runs.
+    """
+    streaming: bool = False
+    output_queue_size: int = 0
+    speculative: bool = False
+    balance_twins: bool = True
+    suspend_at_user_turn: bool = False
+    tool_threads: int = 8
+    tool_loop_policy: ToolLoopPolicy = field(default_factory=ToolLoopPolicy)
+    stage_timeouts: StageTimeouts = field(default_factory=StageTimeouts)
+    max_rounds: int = 100
+
+
+@dataclass
+class RouterSession:
+    """Per-session resources of a conversation running on a shared `RouterEngine`."""
+    session_id: str
+    workspace: str
+    input_func: Optional[Callable] = None
+    output_message_queue: asyncio.Queue[UserMessage | StreamChunk | InputRequest | None] = field(default_factory=asyncio.Queue)
+    agent_ids: List[AgentId] = field(default_factory=list)
+    terminate_message: TerminateMessage | None = None
+    # Cancelled when the session is closed, its consumer goes away or its run's deadline passes.
+    cancellation_token: DeadlineToken = field(default_factory=DeadlineToken)
+    # Messages of the conversation, stored once for the manager and all assistants.
+    transcript: Transcript = field(default_factory=Transcript)
+    # Set when the output ended at the user's turn, the session is checkpointed until the reply.
+    suspended: bool = False
+
+    def _end_output(self) -> None:
+        # Signal the output message queue is complete, behind the messages still waiting for room.
+        if self.output_message_queue.full():
+            self.cancellation_token.link_future(asyncio.ensure_future(self.output_message_queue.put(None)))
+        else:
+            self.output_message_queue.put_nowait(None)
+
+    def terminate(self, message: TerminateMessage) -> None:
+        if self.terminate_message is None and not self.suspended:
+            self.terminate_message = message
+            self._end_output()
+
+    def suspend(self) -> None:
+        if self.terminate_message is None and not self.suspended:
+            self.suspended = True
+            self._end_output()
+
+    @property
+    def is_terminated(self) -> bool:
+        return self.terminate_message is not None
+
+    @property
+    def termination_msg(self) -> str | None:
+        if self.terminate_message is None:
+            return None
+        return self.terminate_message.content
+
+
+class SessionTerminationHandler(DefaultInterventionHandler):
+    """Route a `TerminateMessage` to the session of the agent that published it.
+
+    Messages published by agents of a session that is already closed are dropped, so work that
+    was in flight when the client went away does not bring the session's agents back.
+    """
+
+    def __init__(self, sessions: Dict[str, RouterSession]):
+        self._sessions = sessions
+
+    async def on_publish(self, message: Any, *, sender: AgentId | None) -> Any:
+        if isinstance(message, TerminateMessage) and sender is not None:
+            session = self._sessions.get(sender.key)
+            if session is not None:
+                session.terminate(message)
+            # No agent handles it, and delivering it could outlive the session it ended.
+            return DropMessage
+        if sender is not None and sender.key not in self._sessions:
+            return DropMessage
+        return message
+
+
+class RouterEngine:
+    """Long-lived router topology.
+
+    The runtime, the agent registrations, the subscriptions and the model client are
+    built once by `start`. Every conversation is then opened as a session whose id is
+    used as the agent key, so each session gets its own agent instances on the shared runtime.
+
+    With `config.suspend_at_user_turn` a session is not held while the user thinks: `run_stream` ends
+    after the `InputRequest`, the session is saved and its agents are released. The reply, as the
+    `task` of the user's next `run_stream`, resumes the session from the saved state.
+
+    With a `session_cache` the agents of a closed session stay resident, so its next `run_stream`
+    continues without loading the saved state, until the session is evicted from the cache.
+
+    Every message of a run carries the session's cancellation token, which expires at the run's
+    deadline. Routing, model calls, turns and the user's input have their own `config.stage_timeouts`, cut
+    to that deadline: a late selector hands the turn to the predicted speaker, a late turn is retried
+    on the on-premise deployment, and when no fallback is left the conversation terminates cleanly.
+    """
+
+    def __init__(
+        self,
+        model_client: ChatCompletionClient | None = None,
+        model_clients: Mapping[str, ChatCompletionClient] | None = None,
+        persistence: AsyncPersistence | None = None,
+        sensitivity_detector: SensitivityDetector | None = None,
+        context_policy: ContextPolicy | None = None,
+        routing_cache: TTLCache | None = None,
+        completion_cache: CompletionCache | None = None,
+        session_cache: SessionCache | None = None,
+        intent_router: IntentRouter | None = None,
+        intervention_handlers: List[InterventionHandler] | None = None,
+        config: RouterConfig | None = None,
+    ) -> None:
+        self.config = config or RouterConfig()
+        # Per deployment label, e.g. an `EndpointPool` each. The selector reads the whole history,
+        # sensitive parts included, so it runs on the on-premise client unless `model_client` is given.
+        self._model_clients = dict(model_clients or {})
+        if model_client is None and self._model_clients:
+            if "on-premise" not in self._model_clients:
+                raise ValueError("`model_clients` needs an 'on-premise' client for the selector.")
+            model_client = self._model_clients["on-premise"]
+        # Assistants get their clients per session, check their labels up front.
+        missing = {label_of(description) for description in PARTICIPANT_DESCRIPTIONS} - set(self._model_clients)
+        if self._model_clients and missing:
+            raise ValueError(f"No model client for the {', '.join(sorted(missing))} label.")
+        self._model_client = model_client or create_default_model_client()
+        self._persistence = persistence or LocalFilePersistence()
+        self._sensitivity_detector = sensitivity_detector or SensitivityDetector()
+        self._context_policy = context_policy
+        # Opt-in, speaker decisions shared by the sessions, keyed by the question, the candidates and
+        # whether the session has seen sensitive data.
+        self.routing_cache = routing_cache
+        # Opt-in, answers are cached per deployment label of the assistant.
+        self.completion_cache = completion_cache
+        self._stream_topic_type = USER_TOPIC_TYPE if self.config.streaming else None
+        self._output_queue_size = self.config.output_queue_size
+        self.speculation_stats = SpeculationStats() if self.config.speculative else None
+        self.twin_balancer = TwinBalancer(
+            PARTICIPANT_TOPIC_TYPES, PARTICIPANT_DESCRIPTIONS,
+            telemetry=lambda label: self.pools[label].telemetry() if label in self.pools else None,
+        ) if self.pools and self.config.balance_twins else None
+        self.tools: Dict[str, CachedTool] = {}
+        self._tool_loop_policy = self.config.tool_loop_policy
+        self.tool_loop_stats = ToolLoopStats()
+        self._tool_executor = ThreadPoolExecutor(max_workers=self.config.tool_threads, thread_name_prefix="tool")
+        self._suspend_at_user_turn = self.config.suspend_at_user_turn
+        # Opt-in, sessions kept resident between their `run_stream`s, see `SessionCache`.
+        self.session_cache = session_cache
+        # Opt-in, e.g. `create_default_intent_router()`, users' messages it can tell apart skip the selector call.
+        self.intent_router = intent_router
+        self.routing_stats = RoutingStats()
+        self._stage_timeouts = self.config.stage_timeouts
+        self.timeout_stats = TimeoutStats()
+        self._sessions: Dict[str, RouterSession] = {}
+        self._runtime = SingleThreadedAgentRuntime(
+            intervention_handlers=[SessionTerminationHandler(self._sessions), *(intervention_handlers or [])])
+        self._agent_types: List[str] = []
+        self._started = False
+        self._start_lock = asyncio.Lock()
+
+    @property
+    def runtime(self) -> SingleThreadedAgentRuntime:
+        return self._runtime
+
+    @property
+    def sessions(self) -> Dict[str, RouterSession]:
+        return self._sessions
+
+    async def start(self) -> None:
+        async with self._start_lock:
+            if self._started:
+                return
+            await self._register_agents()
+            self._runtime.start()
+            for pool in self.pools.values():
+                pool.start_health_checks()
+            self._started = True
+
+    async def stop(self) -> None:
+        async with self._start_lock:
+            if not self._started:
+                return
+            await self._runtime.stop()
+            for pool in self.pools.values():
+                await pool.stop_health_checks()
+            self._tool_executor.shutdown(wait=False)
+            self._started = False
+        await self._persistence.aflush()
+
+    def _session_factory(self, factory: Callable[[RouterSession], Any]) -> Callable[[], Any]:
+        # Agents are created lazily by the runtime the first time a session key is addressed,
+        # resolve the per-session resources from that key.
+        def wrapper() -> Any:
+            agent_id = AgentInstantiationContext.current_agent_id()
+            session = self._sessions[agent_id.key]
+            session.agent_ids.append(agent_id)
+            return factory(session)
+        return wrapper
+
+    async def _register(self, agent_cls: Any, agent_type: str, factory: Callable[[RouterSession], Any],
+                        topic_types: List[str]) -> None:
+        await agent_cls.register(self._runtime, agent_type, self._session_factory(factory))
+        self._agent_types.append(agent_type)
+        for topic_type in topic_types:
+            await self._runtime.add_subscription(TypeSubscription(topic_type=topic_type, agent_type=agent_type))
+
+    def _cached_tool(self, tool: Tool, policy: ToolCachePolicy) -> CachedTool:
+        cached_tool = CachedTool(tool, policy)
+        self.tools[tool.name] = cached_tool
+        return cached_tool
+
+    @property
+    def pools(self) -> Dict[str, EndpointPool]:
+        return {label: client for label, client in self._model_clients.items() if isinstance(client, EndpointPool)}
+
+    def pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {label: pool.stats() for label, pool in self.pools.items()}
+
+    def tool_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: tool.stats.as_dict() for name, tool in self.tools.items()}
+
+    def _assistant_model_client(self, description: str, session: RouterSession) -> ChatCompletionClient:
+        return self._labelled_model_client(label_of(description), session)
+
+    def _fallback_model_client(self, description: str, session: RouterSession) -> ChatCompletionClient | None:
+        """The on-premise client a late turn is retried on, None if the assistant already uses it."""
+        if not self._model_clients or self._model_clients.get(label_of(description)) is self._model_client:
+            return None
+        return self._labelled_model_client("on-premise", session)
+
+    def _labelled_model_client(self, label: str, session: RouterSession) -> ChatCompletionClient:
+        model_client = self._model_clients[label] if self._model_clients else self._model_client
+        if self.completion_cache is not None:
+            # On-premise conversations carry sensitive data, their answers are not shared between sessions.
+            scope = session.session_id if label == "on-premise" else None
+            model_client = CachedChatCompletionClient(model_client, self.completion_cache, label, scope)
+        return TracedChatCompletionClient(model_client, label)
+
+    async def _register_agents(self) -> None:
+        llm_client = TracedChatCompletionClient(self._model_client, "on-premise")
+
+        # Registe hr assistants
+        hr_tools: List[Tool] = [
+            self._cached_tool(ThreadedFunctionTool(
+                hr_rules_and_regulations, description="General rules and regulations that do not involve sensitive data.",
+                executor=self._tool_executor),
+                ToolCachePolicy(mode="ttl", ttl=3600)),
+            # Personal information, not shared between the sessions and users of the engine.
+            self._cached_tool(ThreadedFunctionTool(employee_info,
+                                                   description="Employees information, may include PI.",
+                                                   executor=self._tool_executor),
+                              ToolCachePolicy(mode="none")),
+        ]
+        for topic_type, description, tool_agent_type in [
+                (HR_ONPREMISE_TOPIC_TYPE, HR_ONPREMISE_DESCRIPTION, "tool_executor_agent_4_hr_onpre"),
+                (HR_PUBLIC_TOPIC_TYPE, HR_PUBLIC_DESCRIPTION, "tool_executor_agent_4_hr_public")]:
+            await self._register(ToolAgent, tool_agent_type,
+                                 lambda session: ToolAgent("tool executor agent", hr_tools), [])
+            await self._register(
+                HRAssistant,
+                topic_type,
+                lambda session, description=description, tool_agent_type=tool_agent_type: HRAssistant(
+                    description=description,
+                    group_chat_topic_type=GROUP_CHAT_TOPIC_TYPE,
+                    model_client=self._assistant_model_client(description, session),
+                    tool_schema=[tool.schema for tool in hr_tools],
+                    tool_agent_type=tool_agent_type,
+                    workspace=session.workspace,
+                    context_policy=self._context_policy,
+                    stream_topic_type=self._stream_topic_type,
+                    speculation_stats=self.speculation_stats,
+                    tool_loop_policy=self._tool_loop_policy,
+                    tool_loop_stats=self.tool_loop_stats,
+                    transcript=session.transcript,
+                    stage_timeouts=self._stage_timeouts,
+                    timeout_stats=self.timeout_stats,
+                    fallback_model_client=self._fallback_model_client(description, session),
+                ),
+                [topic_type, GROUP_CHAT_TOPIC_TYPE],
+            )
+
+        # Registe generic assistants
+        generic_tools: List[Tool] = [
+            self._cached_tool(ThreadedFunctionTool(weather,
+                                                   description="Provide urban weather conditions.",
+                                                   executor=self._tool_executor),
+                              ToolCachePolicy(mode="ttl", ttl=600)),
+        ]
+        for topic_type, description, tool_agent_type in [
+                (GENERIC_ASSISTANT_ONPREMISE_TOPIC_TYPE, GENERIC_ASSISTANT_ONPREMISE_DESCRIPTION,
+                 "tool_executor_agent_4_generic_assitant_onpre"),
+                (GENERIC_ASSISTANT_PUBLIC_TOPIC_TYPE, GENERIC_ASSISTANT_PUBLIC_DESCRIPTION,
+                 "tool_executor_agent_4_generic_assitant_public")]:
+            await self._register(ToolAgent, tool_agent_type,
+                                 lambda session: ToolAgent("tool executor agent", generic_tools), [])
+            await self._register(
+                GenericAssistant,
+                topic_type,
+                lambda session, description=description, tool_agent_type=tool_agent_type: GenericAssistant(
+                    description=description,
+                    group_chat_topic_type=GROUP_CHAT_TOPIC_TYPE,
+                    model_client=self._assistant_model_client(description, session),
+                    tool_schema=[tool.schema for tool in generic_tools],
+                    tool_agent_type=tool_agent_type,
+                    context_policy=self._context_policy,
+                    stream_topic_type=self._stream_topic_type,
+                    speculation_stats=self.speculation_stats,
+                    tool_loop_policy=self._tool_loop_policy,
+                    tool_loop_stats=self.tool_loop_stats,
+                    transcript=session.transcript,
+                    stage_timeouts=self._stage_timeouts,
+                    timeout_stats=self.timeout_stats,
+                    fallback_model_client=self._fallback_model_client(description, session),
+                ),
+                [topic_type, GROUP_CHAT_TOPIC_TYPE],
+            )
+
+        # Registe User assistant
+        await self._register(
+            UserAgent,
+            USER_TOPIC_TYPE,
+            lambda session: UserAgent(
+                description=USER_DESCRIPTION,
+                group_chat_topic_type=GROUP_CHAT_TOPIC_TYPE,
+                input_func=session.input_func,
+                output_message_queue=session.output_message_queue,
+                cancellation_token=session.cancellation_token,
+                suspend=session.suspend if self._suspend_at_user_turn else None,
+                input_timeout=self._stage_timeouts.user_input,
+                timeout_stats=self.timeout_stats,
+            ),
+            [USER_TOPIC_TYPE, GROUP_CHAT_TOPIC_TYPE],
+        )
+
+        # Registe groupchat manager assistant
+        await self._register(
+            GroupChatManager,
+            GROUP_CHAT_MANAGER_TYPE,
+            lambda session: GroupChatManager(
+                participant_topic_types=PARTICIPANT_TOPIC_TYPES,
+                model_client=llm_client,
+                participant_descriptions=PARTICIPANT_DESCRIPTIONS,
+                group_chat_topic_type=GROUP_CHAT_TOPIC_TYPE,
+                sensitivity_detector=self._sensitivity_detector,
+                routing_cache=self.routing_cache,
+                speculation_stats=self.speculation_stats,
+                twin_balancer=self.twin_balancer,
+                transcript=session.transcript,
+                intent_router=self.intent_router,
+                routing_stats=self.routing_stats,
+                stage_timeouts=self._stage_timeouts,
+                timeout_stats=self.timeout_stats,
+                max_rounds=self.config.max_rounds,
+            ),
+            [GROUP_CHAT_TOPIC_TYPE],
+        )
+
+    async def open_session(
+            self,
+            user_id: str,
+            user_name: str,
+            user_token: str,
+            input_func: Optional[Callable] = None
+    ) -> RouterSession:
+        await self.start()
+
+        user_info = user_id + "~" + user_name + "~" + user_token
+        session_id = await self._persistence.aget_uuid(user_info)
+        if not session_id:
+            session_id = user_info + "~" + str(uuid.uuid4())
+        if session_id in self._sessions:
+            raise RuntimeError(f"Session {session_id} is already open.")
+
+        # create temp workspace
+        base_dir = pathlib.Path().resolve()
+        workspace_path = os.path.join(base_dir, WORKSPACE_DEFAULT, session_id)
+        if not os.path.exists(workspace_path):
+            os.makedirs(workspace_path)
+
+        resident = self.session_cache.take(session_id) if self.session_cache is not None else None
+        if resident is not None and self._persistence.conflicted(session_id):
+            # Another replica saved the session since, continue from its saved state.
+            resident = None
+        session = RouterSession(session_id=session_id, workspace=workspace_path, input_func=input_func,
+                                output_message_queue=asyncio.Queue(maxsize=self._output_queue_size),
+                                transcript=resident.transcript if resident is not None else Transcript())
+        self._sessions[session_id] = session
+        telemetry.start_session(session_id, user_id=user_id, resident=resident is not None)
+
+        if resident is not None:
+            # Its agents continue where they stopped, the user agent is created anew for this run.
+            session.agent_ids.extend(resident.agents)
+            adopt_agents(self._runtime, resident.agents)
+            return session
+        prefetched = self.session_cache.take_prefetched(session_id) if self.session_cache is not None else None
+        state = await (prefetched if prefetched is not None else self._persistence.aload_content(uuid=session_id))
+        if state:
+            await self._load_session_state(session, state)
+        return session
+
+    async def prefetch(self, user_id: str, user_name: str, user_token: str) -> None:
+        """Start loading the user's hibernated session ahead of their next message, e.g. when they reconnect."""
+        if self.session_cache is None:
+            return
+        session_id = await self._persistence.aget_uuid(user_id + "~" + user_name + "~" + user_token)
+        if not session_id or session_id in self._sessions or session_id in self.session_cache \
+                or self.session_cache.is_prefetching(session_id):
+            return
+        self.session_cache.prefetch(session_id, self._persistence.aload_content(uuid=session_id))
+
+    async def _load_session_state(self, session: RouterSession, state: Mapping[str, Any]) -> None:
+        for agent_id_str, agent_state in state.items():
+            agent_type = AgentId.from_str(agent_id_str).type
+            if agent_type in self._agent_types:
+                await self._runtime.agent_load_state(AgentId(agent_type, session.session_id), agent_state)
+
+    async def _save_session_state(self, session: RouterSession) -> Mapping[str, Any]:
+        state: Dict[str, Any] = {}
+        for agent_id in session.agent_ids:
+            state[str(agent_id)] = dict(await self._runtime.agent_save_state(agent_id))
+        return state
+
+    async def close_session(self, session: RouterSession) -> None:
+        saved = False
+        try:
+            manager_id = AgentId(GROUP_CHAT_MANAGER_TYPE, session.session_id)
+            if not session.suspended and manager_id in session.agent_ids:
+                # Only a suspended conversation continues, the user's next message starts a new one.
+                manager = await self._runtime.try_get_underlying_agent_instance(manager_id, GroupChatManager)
+                manager.end_conversation()
+            state_to_persist = await self._save_session_state(session)
+            await self._persistence.asave_content(uuid=session.session_id, content=state_to_persist)
+            saved = True
+        finally:
+            self._sessions.pop(session.session_id, None)
+            # Release agents still waiting on the session, e.g. for room in its output queue.
+            session.cancellation_token.cancel()
+            # The runtime has no public API to drop agent instances, release the ones of this session
+            # so a long-lived runtime does not keep every finished conversation in memory.
+            agents = release_agents(self._runtime, session.agent_ids)
+            if self.session_cache is not None:
+                # Only a session that stopped at the user's turn or its end is consistent, the user agent
+                # holds the resources of this run.
+                if saved and (session.suspended or session.is_terminated):
+                    self.session_cache.put(session.session_id, ResidentSession(
+                        agents={agent_id: agent for agent_id, agent in agents.items()
+                                if agent is not None and agent_id.type != USER_TOPIC_TYPE},
+                        transcript=session.transcript,
+                        nbytes=estimate_bytes(session.transcript)))
+                else:
+                    self.session_cache.pop(session.session_id)
+            # Likewise the recipients it resolved for the session's topics, rebuilt on the next publish.
+            forget_topics(self._runtime, session.session_id)
+            telemetry.end_session(session.session_id, terminated=session.is_terminated, suspended=session.suspended)
+
+    async def run_stream(
+            self,
+            user_id: str,
+            user_name: str,
+            user_token: str,
+            task: str,
+            cancellation_token: CancellationToken | None = None,
+            input_func: Optional[Callable] = None,
+            timeout: float | None = None,
+    ) -> AsyncGenerator[UserMessage | StreamChunk | InputRequest | TerminateMessage, None]:
+        """Run the user's `task` in their session and yield its output.
+
+        The run ends within `timeout` seconds, by default the `session` stage timeout: past its
+        deadline the run's work is cancelled and the output ends with a `TerminateMessage`.
+        """
+        session = await self.open_session(user_id, user_name, user_token, input_func=input_func)
+        if cancellation_token is not None:
+            cancellation_token.add_callback(session.cancellation_token.cancel)
+        timeout = timeout if timeout is not None else self._stage_timeouts.session
+        if timeout is not None:
+            session.cancellation_token.expire_after(timeout)
+        try:
+            await self._runtime.publish_message(
+                GroupChatMessage(
+                    body=UserMessage(
+                        content=task,
+                        source="User",
+                    )
+                ),
+                TopicId(type=GROUP_CHAT_TOPIC_TYPE, source=session.session_id),
+                cancellation_token=session.cancellation_token,
+            )
+
+            # Linked once, a token keeps every callback, a linked future per message would pile up for the session.
+            closed = asyncio.get_running_loop().create_future()
+            session.cancellation_token.link_future(closed)
+            # Yield the messsages until the queue is empty.
+            while True:
+                queue = session.output_message_queue
+                if not queue.empty():
+                    message = queue.get_nowait()
+                else:
+                    message_future = asyncio.ensure_future(queue.get())
+                    # Wait for the next message, this will raise an exception if the task is cancelled.
+                    await asyncio.wait({message_future, closed}, return_when=asyncio.FIRST_COMPLETED)
+                    if not message_future.done():
+                        message_future.cancel()
+                        if not session.cancellation_token.expired:
+                            raise asyncio.CancelledError()
+                        self.timeout_stats.timed_out("session")
+                        self.timeout_stats.fell_back("session", "terminate")
+                        session.terminate_message = TerminateMessage(
+                            content="RouterEngine (termination condition): Deadline exceeded.")
+                        break
+                    message = message_future.result()
+                if message is None:
+                    break
+                yield message
+
+            # Suspended at the user's turn, the next `run_stream` of the user resumes with the reply as task.
+            if session.suspended:
+                return
+            # Yield the termination.
+            yield TerminateMessage(content=f"Conversation Terminated - {session.termination_msg}")
+        finally:
+            await self.close_session(session)
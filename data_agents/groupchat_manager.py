@@ -1,6 +1,7 @@
 import string
 from typing import List, Mapping, Any
 from autogen_core import (
+    CancellationToken,
     DefaultTopicId,
     MessageContext,
     RoutedAgent,
@@ -8,12 +9,66 @@ from autogen_core import (
 )
 from autogen_core.models import (
     ChatCompletionClient,
+    CreateResult,
     SystemMessage,
     UserMessage,
 )
-from data_agents.messages import GroupChatMessage, RequestToSpeak, TerminateMessage
-from autogen_core.model_context import BufferedChatCompletionContext
+from data_agents.messages import CancelSpeculation, GroupChatMessage, RequestToSpeak, SpeculateToSpeak, TerminateMessage
+from data_agents.sensitivity import SensitivityDetector, is_public
+from data_agents.selector_history import SelectorHistory
+from data_agents.cache import TTLCache
+from data_agents.speculation import SpeculationStats
+from data_agents.twins import TwinBalancer
+from data_agents.transcript import Transcript
+from data_agents.intent_router import IntentRouter
+from data_agents.routing_stats import RoutingStats
+from data_agents.deadline import StageTimeouts, TimeoutStats, linked_token, past_deadline, time_left
+from data_agents import telemetry
+import asyncio
+import re
+import logging
 import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+SELECTOR_PROMPT = """You are in a role play game. The following roles are available:
+{roles}.
+Read the following conversation. Then select the next role from {participants} to play. Only return the role.
+HISTORY:
+{history}
+----------------
+QUESTION/RESULT:
+{question}
+
+Read the above conversation. Then select the next role from {participants} to play. Only return the role, 
+When making a selection, in addition to matching intent and capability, it is crucial to determine whether the subsequent task could lead to data leakage(PI or enterprise sensitive info). If there is a risk, please choose the role with the on-premise label rather than the public label. 
+Make sure to check the content in HISTORY, DONOT select role with public label if there is sensitive information(for example: employee information .etc) in HISTORY!!!
+Make only one selection for the same question, if the question resolved, turn to User role.
+"""
+
+SUMMARY_PROMPT = """Summarize the conversation below for someone who has to pick the next speaker.
+Keep the questions asked, which roles answered them, what is still open, and whether any PI or enterprise sensitive information appeared.
+Answer in at most {max_words} words.
+PREVIOUS SUMMARY:
+{summary}
+----------------
+NEW MESSAGES:
+{messages}
+"""
+
+
+def routing_cache_key(question: str, candidates: List[str], sensitive: bool) -> tuple:
+    # Case, punctuation and spacing do not change the intent of a question.
+    normalized = " ".join(re.sub(r"[^\w\s:]", " ", question.lower()).split())
+    return normalized, tuple(candidates), sensitive
+
+
+def message_text(message: UserMessage) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return ", ".join(item for item in message.content if isinstance(item, str))
+
 
 class GroupChatManager(RoutedAgent):
     def __init__(
@@ -24,6 +79,18 @@ class GroupChatManager(RoutedAgent):
         group_chat_topic_type: str,
         max_rounds: int = 100,
         max_time: float = float("inf"),
+        sensitivity_detector: SensitivityDetector | None = None,
+        history_token_budget: int | None = 4000,
+        summary_refresh_every: int = 10,
+        summary_max_words: int = 200,
+        routing_cache: TTLCache | None = None,
+        speculation_stats: SpeculationStats | None = None,
+        twin_balancer: TwinBalancer | None = None,
+        transcript: Transcript | None = None,
+        intent_router: IntentRouter | None = None,
+        routing_stats: RoutingStats | None = None,
+        stage_timeouts: StageTimeouts | None = None,
+        timeout_stats: TimeoutStats | None = None,
     ) -> None:
         super().__init__("Group chat manager")
         self._participant_topic_types = participant_topic_types
@@ -31,16 +98,146 @@ class GroupChatManager(RoutedAgent):
         self._participant_descriptions = participant_descriptions
         self._previous_participant_topic_type: str | None = None
         self._group_chat_topic_type = group_chat_topic_type
-        self._model_context = BufferedChatCompletionContext(buffer_size=100)
+        # Shared with the assistants of the session, every group chat message is stored once.
+        self._transcript = transcript if transcript is not None else Transcript()
         self._max_rounds = max_rounds
         self._max_time = max_time
         self._num_rounds = 0
         self._start_time: float = -1.0
+        self._sensitivity_detector = sensitivity_detector or SensitivityDetector()
+        # Sticky, once sensitive data shows up public-labeled participants are out for the session.
+        self._sensitive = False
+        self._public_topic_types = {
+            topic_type for topic_type, description in zip(participant_topic_types, participant_descriptions, strict=True)
+            if is_public(description)
+        }
+        self._history = SelectorHistory(token_budget=history_token_budget, summary_refresh_every=summary_refresh_every)
+        self._summary_max_words = summary_max_words
+        # Shared by the sessions of an engine, decisions are keyed by what the selector sees.
+        self._routing_cache = routing_cache
+        # Opt-in, the predicted speaker starts its turn while the selector is deciding.
+        self._speculation_stats = speculation_stats
+        self._last_assistant: str | None = None
+        # Optional, moves a turn to the twin of the selected participant when that one is expected to answer
+        # first, to a public twin only while the conversation is not sensitive.
+        self._twin_balancer = twin_balancer
+        # Optional, shared by the sessions of an engine, decides the users' messages it can tell apart locally.
+        self._intent_router = intent_router
+        self._routing_stats = routing_stats
+        self._stage_timeouts = stage_timeouts or StageTimeouts()
+        self._timeout_stats = timeout_stats
+
+    def _track_sensitivity(self, message: UserMessage) -> None:
+        if self._sensitive:
+            return
+        found = self._sensitivity_detector.detect(message_text(message))
+        if found:
+            self._sensitive = True
+            logger.info(f"{self.id}: sensitive data ({found}) from {message.source}, public roles excluded.")
+
+    def _candidate_topic_types(self) -> List[str]:
+        return [
+            topic_type
+            for topic_type in self._participant_topic_types
+            # previous speacker is not condidate
+            if topic_type != self._previous_participant_topic_type
+            and not (self._sensitive and topic_type in self._public_topic_types)
+        ]
+
+    def _build_selector_prompt(self, candidates: List[str]) -> str:
+        history, question = self._history.render()
+        roles = "\n".join(
+            [
+                f"{topic_type}: {description}".strip()
+                for topic_type, description in zip(
+                    self._participant_topic_types, self._participant_descriptions, strict=True
+                )
+                if topic_type in candidates
+            ]
+        )
+        return SELECTOR_PROMPT.format(
+            roles=roles,
+            history=history,
+            question=question,
+            participants=str(candidates),
+        )
+
+    async def _refresh_summary(self, cancellation_token: CancellationToken | None) -> None:
+        prompt = SUMMARY_PROMPT.format(
+            max_words=self._summary_max_words,
+            summary=self._history.summary or "(none)",
+            messages="\n".join(self._history.pending),
+        )
+        with linked_token(cancellation_token) as call_token:
+            completion = await self._model_client.create([SystemMessage(content=prompt)], cancellation_token=call_token)
+        assert isinstance(completion.content, str)
+        self._history.set_summary(completion.content.strip())
+
+    def end_conversation(self) -> None:
+        """Reset the round count, the timer and the last speaker, the history is kept for the next conversation."""
+        self._num_rounds = 0
+        self._start_time = -1.0
+        self._previous_participant_topic_type = None
+
+    def _balance(self, topic_type: str, candidates: List[str]) -> str:
+        if self._twin_balancer is None:
+            return topic_type
+        return self._twin_balancer.choose(topic_type, candidates, self._sensitive)
+
+    async def _select(self, topic_type: str, cancellation_token: CancellationToken,
+                      speculation_id: str | None = None) -> None:
+        telemetry.annotate(topic_type=topic_type)
+        if topic_type == "User":
+            telemetry.end_round(self.id.key, topic_type=self._last_assistant or "User", outcome="answered")
+        else:
+            telemetry.set_round_attributes(self.id.key, topic_type=topic_type)
+        self._previous_participant_topic_type = topic_type
+        if topic_type != "User":
+            self._last_assistant = topic_type
+        self._num_rounds += 1  # Call before sending the message
+        await self.publish_message(RequestToSpeak(speculation_id=speculation_id), DefaultTopicId(type=topic_type),
+                                   cancellation_token=cancellation_token)
+
+    def _predict_speaker(self, message: UserMessage, candidates: List[str]) -> str | None:
+        """The assistant likely to answer a user message: the one that answered last, or the only one left."""
+        if message.source != "User":
+            return None
+        if self._last_assistant in candidates:
+            return self._last_assistant
+        assistants = [topic_type for topic_type in candidates if topic_type != "User"]
+        return assistants[0] if len(assistants) == 1 else None
+
+    def _fallback_speaker(self, message: UserMessage, candidates: List[str]) -> str | None:
+        """Speaker when the selector does not decide in time: the user after an answer, else the predicted assistant."""
+        if message.source != "User":
+            return "User" if "User" in candidates else None
+        return self._predict_speaker(message, candidates)
+
+    async def _speculate(self, message: UserMessage, candidates: List[str],
+                         cancellation_token: CancellationToken) -> tuple[str, str] | None:
+        if self._speculation_stats is None:
+            return None
+        predicted = self._predict_speaker(message, candidates)
+        if predicted is None:
+            return None
+        speculation_id = uuid.uuid4().hex
+        self._speculation_stats.attempts += 1
+        await self.publish_message(SpeculateToSpeak(speculation_id=speculation_id), DefaultTopicId(type=predicted),
+                                   cancellation_token=cancellation_token)
+        return predicted, speculation_id
+
+    async def _cancel_speculation(self, speculation: tuple[str, str], cancellation_token: CancellationToken) -> None:
+        predicted, speculation_id = speculation
+        self._speculation_stats.misses += 1
+        await self.publish_message(CancelSpeculation(speculation_id=speculation_id), DefaultTopicId(type=predicted),
+                                   cancellation_token=cancellation_token)
 
     @message_handler
     async def handle_message(self, message: GroupChatMessage, ctx: MessageContext) -> None:
         assert isinstance(message.body, UserMessage)
-        await self._model_context.add_message(message.body)
+        self._transcript.add(message.body)
+        self._history.append(message.body)
+        self._track_sensitivity(message.body)
 
         # First broadcast sets the timer
         if self._start_time < 0:
@@ -51,17 +248,21 @@ class GroupChatManager(RoutedAgent):
         if message.body.source == "User":
             assert isinstance(message.body.content, str)
             if message.body.content.lower().strip(string.punctuation).endswith("approve"):
+                telemetry.end_round(self.id.key, outcome="approved")
                 # Send termination message to tell runtime stop and save history
                 await self.publish_message(
                     TerminateMessage(f"{self.id.type} (termination condition): User terminated"),
                     topic_id=DefaultTopicId(type=self._group_chat_topic_type),
+                    cancellation_token=ctx.cancellation_token,
                 )
                 return
+            telemetry.start_round(self.id.key)
 
         if self._num_rounds >= self._max_rounds:
             await self.publish_message(
                 TerminateMessage(f"{self.id.type} (termination condition): Max rounds ({self._max_rounds}) reached."),
                 topic_id=DefaultTopicId(type=self._group_chat_topic_type),
+                cancellation_token=ctx.cancellation_token,
             )
             return
 
@@ -69,81 +270,147 @@ class GroupChatManager(RoutedAgent):
             await self.publish_message(
                 TerminateMessage(f"{self.id.type} (termination condition): Max time ({self._max_time}s) reached."),
                 topic_id=DefaultTopicId(type=self._group_chat_topic_type),
+                cancellation_token=ctx.cancellation_token,
             )
             return
         
-        # Format message history.
-        # TODO, when items in history is too long and the history may exceed the context length of llm.
-        messages: List[str] = []
-        for msg in (await self._model_context.get_messages()):
-            if isinstance(msg.content, str):
-                messages.append(f"{msg.source}: {msg.content}")
-            elif isinstance(msg.content, list):
-                line: List[str] = []
-                for item in msg.content:
-                    if isinstance(item, str):
-                        line.append(item)
-                messages.append(f"{msg.source}: {', '.join(line)}")
-        history = "\n".join(messages)
-
-
-        # Format roles.
-        roles = "\n".join(
-            [
-                f"{topic_type}: {description}".strip()
-                for topic_type, description in zip(
-                    self._participant_topic_types, self._participant_descriptions, strict=True
-                )
-                # previous speacker is not condidate
-                if topic_type != self._previous_participant_topic_type
-            ]
-        )
-        selector_prompt = """You are in a role play game. The following roles are available:
-{roles}.
-Read the following conversation. Then select the next role from {participants} to play. Only return the role.
-HISTORY:
-{history}
-----------------
-QUESTION/RESULT:
-{question}
+        candidates = self._candidate_topic_types()
+        started = time.perf_counter()
+        with telemetry.stage("routing", session_id=self.id.key, candidates=candidates, sensitive=self._sensitive):
+            decided_by = await self._route(message.body, candidates, ctx)
+            telemetry.annotate(decided_by=decided_by)
+        if self._routing_stats is not None:
+            self._routing_stats.record(decided_by, time.perf_counter() - started)
 
-Read the above conversation. Then select the next role from {participants} to play. Only return the role, 
-When making a selection, in addition to matching intent and capability, it is crucial to determine whether the subsequent task could lead to data leakage(PI or enterprise sensitive info). If there is a risk, please choose the role with the on-premise label rather than the public label. 
-Make sure to check the content in HISTORY, DONOT select role with public label if there is sensitive information(for example: employee information .etc) in HISTORY!!!
-Make only one selection for the same question, if the question resolved, turn to User role.
-"""
+    async def _route(self, message: UserMessage, candidates: List[str], ctx: MessageContext) -> str:
+        """Select the next speaker, return what decided it."""
+        if len(candidates) == 1:
+            # Nothing to decide, skip the selector call.
+            await self._select(candidates[0], ctx.cancellation_token)
+            return "single_candidate"
 
-        system_message = SystemMessage(
-            content=selector_prompt.format(
-                roles=roles,
-                history=history[:-1],
-                question=history[-1],
-                participants=str(
-                    [
-                        topic_type
-                        for topic_type in self._participant_topic_types
-                        if topic_type != self._previous_participant_topic_type
-                    ]
-                ),
-            )
-        )
-        completion = await self._model_client.create([system_message], cancellation_token=ctx.cancellation_token)
+        cache_key = None
+        if self._routing_cache is not None:
+            cache_key = routing_cache_key(self._history.render()[1], candidates, self._sensitive)
+            cached = self._routing_cache.get(cache_key)
+            if cached is not None:
+                # A cached answer is validated like a fresh one.
+                selected_topic_type = self._match_candidate(cached, candidates)
+                if selected_topic_type is not None:
+                    await self._select(self._balance(selected_topic_type, candidates), ctx.cancellation_token)
+                    return "cache"
+                self._routing_cache.pop(cache_key)
+
+        # Only a user's message carries an intent to match, whether an answer resolved it is left to the selector.
+        if self._intent_router is not None and message.source == "User":
+            selected_topic_type = await self._intent_router.route(message_text(message), candidates)
+            if selected_topic_type is not None:
+                await self._select(self._balance(selected_topic_type, candidates), ctx.cancellation_token)
+                return "local"
+
+        speculation = await self._speculate(message, candidates, ctx.cancellation_token)
+        timeout = time_left(ctx.cancellation_token, self._stage_timeouts.routing)
+        try:
+            completion = await asyncio.wait_for(self._ask_selector(candidates, ctx.cancellation_token), timeout=timeout)
+            selected_topic_type = self._match_candidate(completion.content, candidates)
+            if selected_topic_type is None:
+                raise ValueError(f"Invalid role selected: {completion.content}")
+        except asyncio.TimeoutError:
+            if past_deadline(ctx.cancellation_token):
+                return "timeout"
+            logger.warning(f"{self.id}: no speaker selected within {timeout}s.")
+            return await self._route_without_selector(message, candidates, speculation, ctx.cancellation_token)
+        except BaseException:
+            if speculation is not None:
+                await self._cancel_speculation(speculation, ctx.cancellation_token)
+            raise
+        if cache_key is not None:
+            self._routing_cache.put(cache_key, completion.content)
+        selected_topic_type = self._balance(selected_topic_type, candidates)
+
+        if speculation is not None:
+            predicted, speculation_id = speculation
+            if predicted == selected_topic_type:
+                self._speculation_stats.hits += 1
+                await self._select(selected_topic_type, ctx.cancellation_token, speculation_id=speculation_id)
+                return "selector"
+            await self._cancel_speculation(speculation, ctx.cancellation_token)
+        await self._select(selected_topic_type, ctx.cancellation_token)
+        return "selector"
+
+    async def _ask_selector(self, candidates: List[str], cancellation_token: CancellationToken) -> CreateResult:
+        if self._history.needs_summary:
+            await self._refresh_summary(cancellation_token)
+        system_message = SystemMessage(content=self._build_selector_prompt(candidates))
+        with linked_token(cancellation_token) as call_token:
+            completion = await self._model_client.create([system_message], cancellation_token=call_token)
         assert isinstance(completion.content, str)
-        selected_topic_type: str
-        for topic_type in self._participant_topic_types:
-            if topic_type.lower() in completion.content.lower():
-                selected_topic_type = topic_type
-                self._previous_participant_topic_type = selected_topic_type
-                self._num_rounds += 1  # Call before sending the message
-                await self.publish_message(RequestToSpeak(), DefaultTopicId(type=selected_topic_type))
-                return
-        raise ValueError(f"Invalid role selected: {completion.content}")
-    
+        return completion
+
+    async def _route_without_selector(self, message: UserMessage, candidates: List[str],
+                                      speculation: tuple[str, str] | None,
+                                      cancellation_token: CancellationToken) -> str:
+        """Hand the turn to the fallback speaker, or end the conversation cleanly if there is none."""
+        if self._timeout_stats is not None:
+            self._timeout_stats.timed_out("routing")
+        fallback = self._fallback_speaker(message, candidates)
+        label = "user" if fallback == "User" else "predicted"
+        if speculation is not None:
+            predicted, speculation_id = speculation
+            if predicted == fallback:
+                # The predicted assistant is already answering.
+                if self._timeout_stats is not None:
+                    self._timeout_stats.fell_back("routing", label)
+                await self._select(fallback, cancellation_token, speculation_id=speculation_id)
+                return "timeout"
+            await self._cancel_speculation(speculation, cancellation_token)
+        if fallback is None:
+            if self._timeout_stats is not None:
+                self._timeout_stats.fell_back("routing", "terminate")
+            await self.publish_message(
+                TerminateMessage(f"{self.id.type} (termination condition): No speaker selected in time."),
+                topic_id=DefaultTopicId(type=self._group_chat_topic_type),
+                cancellation_token=cancellation_token,
+            )
+            return "timeout"
+        if self._timeout_stats is not None:
+            self._timeout_stats.fell_back("routing", label)
+        await self._select(self._balance(fallback, candidates), cancellation_token)
+        return "timeout"
+
+    @staticmethod
+    def _match_candidate(content: str, candidates: List[str]) -> str | None:
+        for topic_type in candidates:
+            if topic_type.lower() in content.lower():
+                return topic_type
+        return None
+
     async def save_state(self) -> Mapping[str, Any]:
         return {
-            "memory": self._model_context.save_state(),
+            # Layout of the buffered model context the state was saved from before.
+            "memory": {"messages": self._transcript.copy_messages(), "buffer_size": 100},
+            "sensitive": self._sensitive,
+            "summary": self._history.summary,
+            "folded": self._history.folded,
+            "last_assistant": self._last_assistant,
+            "previous_participant": self._previous_participant_topic_type,
+            "num_rounds": self._num_rounds,
+            # Elapsed rather than the start, the state may be loaded on another host.
+            "elapsed": time.time() - self._start_time if self._start_time >= 0 else None,
         }
 
     async def load_state(self, state: Mapping[str, Any]) -> None:
-        self._model_context.load_state({**state["memory"], "messages": [m for m in state["memory"]["messages"]]})
+        self._transcript.load(state["memory"]["messages"])
+        self._history.load(state["memory"]["messages"], summary=state.get("summary", ""), folded=state.get("folded", 0))
+        self._last_assistant = state.get("last_assistant")
+        self._previous_participant_topic_type = state.get("previous_participant")
+        self._num_rounds = state.get("num_rounds", 0)
+        if state.get("elapsed") is not None:
+            self._start_time = time.time() - state["elapsed"]
+        if "sensitive" in state:
+            self._sensitive = state["sensitive"]
+        else:
+            # Saved before the flag existed, scan the history once.
+            for message in state["memory"]["messages"]:
+                self._track_sensitivity(message)
 
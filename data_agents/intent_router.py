@@ -0,0 +1,180 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Mapping, Optional, Sequence, Tuple
+import asyncio
+import math
+import re
+import statistics
+import numpy as np
+from data_agents.sensitivity import label_of
+from data_agents.twins import capability_of
+
+_WORD = re.compile(r"[a-z0-9]+")
+# Words that carry no intent, they would only dilute the vectors.
+STOPWORDS = frozenset(
+    "a an and are as at be by can could do does for from has have how i in is it its me my of on or "
+    "our please should that the their this to was what when where which who why will with would you your".split()
+)
+
+
+def terms(text: str) -> List[str]:
+    """Words of `text` and their bigrams, lowercased and without stopwords."""
+    words = [word for word in _WORD.findall(text.lower()) if word not in STOPWORDS]
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+class TfidfVectorizer:
+    """TF-IDF vectors over the vocabulary of the documents it is fitted on.
+
+    Terms outside that vocabulary are dropped, a message is compared on what the participants'
+    profiles can tell apart. Vectors are L2 normalized, a message without known terms is all zeros.
+    """
+
+    def __init__(self, documents: Sequence[str]) -> None:
+        document_terms = [set(terms(document)) for document in documents]
+        self.vocabulary: Dict[str, int] = {}
+        for document in document_terms:
+            for term in sorted(document):
+                self.vocabulary.setdefault(term, len(self.vocabulary))
+        frequencies = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for document in document_terms:
+            for term in document:
+                frequencies[self.vocabulary[term]] += 1
+        self.idf = (np.log((1 + len(documents)) / (1 + frequencies)) + 1).astype(np.float32)
+
+    def transform(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for term in terms(text):
+                column = self.vocabulary.get(term)
+                if column is not None:
+                    vectors[row, column] += 1
+        np.log1p(vectors, out=vectors)
+        vectors *= self.idf
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+@dataclass
+class IntentRouterStats:
+    requests: int = 0
+    decided: int = 0
+    deferred: int = 0
+    batches: int = 0
+    # Requests scored by each matrix multiply.
+    batch_sizes: Deque[int] = field(default_factory=lambda: deque(maxlen=1000))
+
+    @property
+    def decided_rate(self) -> float:
+        return self.decided / self.requests if self.requests else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "decided": self.decided,
+            "deferred": self.deferred,
+            "decided_rate": self.decided_rate,
+            "batches": self.batches,
+            "batch_size_mean": statistics.mean(self.batch_sizes) if self.batch_sizes else None,
+            "batch_size_max": max(self.batch_sizes, default=None),
+        }
+
+
+class IntentRouter:
+    """Local first stage of speaker selection: cosine similarity of a message to the participants.
+
+    Each participant has a profile, its description plus optional `examples` of messages it answers,
+    embedded once as TF-IDF vectors. Twins, participants that differ only by their deployment label,
+    share a profile: a message is scored against each capability, as the best match among its profile
+    vectors. The top capability is decided locally when its score is at least `min_score` and leads
+    the runner-up by `margin`, otherwise the LLM selector decides. The router makes no judgement on
+    whether a message could leak data, so it hands the turn to the on-premise twin when there is one.
+
+    Requests of all sessions that arrive within `batch_window` seconds, by default the same event
+    loop iteration, are scored together by one matrix multiply.
+    """
+
+    def __init__(
+        self,
+        participant_topic_types: List[str],
+        participant_descriptions: List[str],
+        examples: Mapping[str, Sequence[str]] | None = None,
+        margin: float = 0.15,
+        min_score: float = 0.3,
+        batch_window: float = 0.0,
+    ) -> None:
+        examples = examples or {}
+        self.margin = margin
+        self.min_score = min_score
+        self._batch_window = batch_window
+        self._topic_types = list(participant_topic_types)
+        capabilities: Dict[str, List[str]] = {}
+        self._capability: Dict[str, int] = {}
+        self._on_premise = {topic_type for topic_type, description
+                            in zip(participant_topic_types, participant_descriptions, strict=True)
+                            if label_of(description) == "on-premise"}
+        for topic_type, description in zip(participant_topic_types, participant_descriptions, strict=True):
+            documents = capabilities.setdefault(capability_of(description), [capability_of(description)])
+            documents.extend(example for example in examples.get(topic_type, ()) if example not in documents)
+            self._capability[topic_type] = list(capabilities).index(capability_of(description))
+        documents = [document for profile in capabilities.values() for document in profile]
+        self._vectorizer = TfidfVectorizer(documents)
+        # Profile vectors as columns, grouped by capability, and where each capability's group starts.
+        self._profiles = np.ascontiguousarray(self._vectorizer.transform(documents).T)
+        self._starts = np.cumsum([0] + [len(profile) for profile in capabilities.values()][:-1])
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_scheduled = False
+        self.stats = IntentRouterStats()
+
+    def scores(self, texts: Sequence[str]) -> np.ndarray:
+        """Cosine similarity of each text to each capability, texts by capabilities."""
+        similarities = self._vectorizer.transform(texts) @ self._profiles
+        return np.maximum.reduceat(similarities, self._starts, axis=1)
+
+    def decide(self, scores: np.ndarray, candidates: List[str]) -> Optional[str]:
+        """The candidate of the leading capability, its on-premise one first, None if the lead is too small to tell."""
+        ranked = sorted({self._capability[topic_type] for topic_type in candidates},
+                        key=lambda capability: scores[capability], reverse=True)
+        best = scores[ranked[0]]
+        runner_up = scores[ranked[1]] if len(ranked) > 1 else 0.0
+        if best < self.min_score or best - runner_up < self.margin:
+            return None
+        matches = [topic_type for topic_type in candidates if self._capability[topic_type] == ranked[0]]
+        return next((topic_type for topic_type in matches if topic_type in self._on_premise), matches[0])
+
+    async def route(self, text: str, candidates: List[str]) -> Optional[str]:
+        """Candidate to answer `text`, None to leave the decision to the LLM selector."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future))
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            loop = asyncio.get_running_loop()
+            if self._batch_window > 0:
+                loop.call_later(self._batch_window, self._flush)
+            else:
+                loop.call_soon(self._flush)
+        selected = self.decide(await future, candidates)
+        self.stats.requests += 1
+        if selected is None:
+            self.stats.deferred += 1
+        else:
+            self.stats.decided += 1
+        return selected
+
+    def _flush(self) -> None:
+        pending, self._pending = self._pending, []
+        self._flush_scheduled = False
+        try:
+            scores = self.scores([text for text, _ in pending])
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.stats.batches += 1
+        self.stats.batch_sizes.append(len(pending))
+        for row, (_, future) in enumerate(pending):
+            # A request whose session went away meanwhile is cancelled.
+            if not future.done():
+                future.set_result(scores[row])
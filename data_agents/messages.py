@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 from pydantic import BaseModel
 from autogen_core.models import (
     UserMessage,
@@ -14,7 +15,34 @@ class GroupChatMessage(BaseModel):
 
 
 class RequestToSpeak(BaseModel):
-    pass 
+    # Set when the manager confirms the speculative turn of that id.
+    speculation_id: Optional[str] = None
+
+
+class SpeculateToSpeak(BaseModel):
+    """Start a turn ahead of the selector's decision, it is kept only if a matching `RequestToSpeak` follows."""
+    speculation_id: str
+
+
+class CancelSpeculation(BaseModel):
+    speculation_id: str
+
+
+class InputRequest(BaseModel):
+    """The user's turn, emitted to the output stream right before `input_func` is called."""
+    prompt: str
+
+
+class StreamChunk(BaseModel):
+    """Part of an answer streamed from the model, the whole answer still follows as a GroupChatMessage."""
+    source: str
+    content: str
+    # Position of the chunk in the answer, and seconds since the agent was asked to speak.
+    index: int
+    elapsed: float
+    # Set on the first chunk of an attempt that replaces one which already streamed, e.g. the on-premise
+    # retry of a turn that ran out of time: the chunks of `source` received so far are void.
+    restart: bool = False
 
 @dataclass
 class TerminateMessage:
@@ -0,0 +1,150 @@
+from typing import Any, AsyncGenerator, Dict, Mapping, Optional, Sequence, Union
+import hashlib
+import json
+from autogen_core import CancellationToken, FunctionCall
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    LLMMessage,
+    ModelCapabilities,
+    RequestUsage,
+)
+from autogen_core.tools import Tool, ToolSchema
+from data_agents.cache import TTLCache
+
+
+def completion_key(messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema], scope: Optional[str] = None) -> str:
+    """Stable hash of the messages and tool schema of a request, and of the scope it may be shared in."""
+    payload = {
+        "scope": scope,
+        "messages": [message.model_dump() for message in messages],
+        "tools": [tool.schema if isinstance(tool, Tool) else tool for tool in tools],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class CompletionCache:
+    """Final answers partitioned by deployment label, a partition is only ever read by clients of its label."""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 3600.0) -> None:
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._partitions: Dict[str, TTLCache] = {}
+
+    def partition(self, label: str) -> TTLCache:
+        if label not in self._partitions:
+            self._partitions[label] = TTLCache(maxsize=self._maxsize, ttl=self._ttl)
+        return self._partitions[label]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {label: partition.stats() for label, partition in self._partitions.items()}
+
+
+class CachedChatCompletionClient:
+    """`ChatCompletionClient` that answers repeated questions from a `CompletionCache` partition.
+
+    The key is the whole request: the system message, the history window sent by the agent's
+    context policy, the tool calls and results of the current tool loop and the tool schema. Final
+    answers and tool calls are stored, so a repeated question replays the model's tool calls while
+    the tools still run, and reuses the answer only when they returned the same results. With a
+    `scope`, e.g. the session of an on-premise client, entries are only shared within it.
+    """
+
+    def __init__(self, model_client: ChatCompletionClient, cache: CompletionCache, label: str,
+                 scope: Optional[str] = None) -> None:
+        self._model_client = model_client
+        self._label = label
+        self._scope = scope
+        self._cache = cache.partition(label)
+
+    @property
+    def label(self) -> str:
+        return self._label
+
+    def _key(self, messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema]) -> str:
+        return completion_key(messages, tools, self._scope)
+
+    def _cached_result(self, key: str) -> Optional[CreateResult]:
+        cached = self._cache.get(key)
+        if cached is None:
+            return None
+        finish_reason, content = cached
+        return CreateResult(
+            finish_reason=finish_reason,
+            content=content,
+            usage=RequestUsage(prompt_tokens=0, completion_tokens=0),
+            cached=True,
+        )
+
+    def _store(self, key: str, result: CreateResult) -> None:
+        if (isinstance(result.content, str) and result.finish_reason == "stop") or (
+                result.finish_reason == "function_calls"
+                and all(isinstance(call, FunctionCall) for call in result.content)):
+            self._cache.put(key, (result.finish_reason, result.content))
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        key = self._key(messages, tools)
+        cached = self._cached_result(key)
+        if cached is not None:
+            return cached
+
+        result = await self._model_client.create(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+        self._store(key, result)
+        return result
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        # A cached answer is streamed as a single chunk.
+        key = self._key(messages, tools)
+        cached = self._cached_result(key)
+        if cached is not None:
+            if isinstance(cached.content, str):
+                yield cached.content
+            yield cached
+            return
+
+        async for item in self._model_client.create_stream(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        ):
+            if isinstance(item, CreateResult):
+                self._store(key, item)
+            yield item
+
+    def actual_usage(self) -> RequestUsage:
+        return self._model_client.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self._model_client.total_usage()
+
+    def count_tokens(self, messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._model_client.count_tokens(messages, tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._model_client.remaining_tokens(messages, tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:
+        return self._model_client.capabilities
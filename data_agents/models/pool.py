@@ -0,0 +1,474 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Awaitable, Callable, Deque, Dict, List, Literal, Mapping, Optional, Sequence, Set, Union
+import asyncio
+import logging
+import random
+import time
+from autogen_core import CancellationToken
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    LLMMessage,
+    ModelCapabilities,
+    RequestUsage,
+)
+from autogen_core.tools import Tool, ToolSchema
+from openai import APIConnectionError
+
+logger = logging.getLogger(__name__)
+
+LABELS = ("on-premise", "public")
+
+
+class NoHealthyEndpointError(RuntimeError):
+    """Every endpoint of a pool has an open circuit."""
+
+
+def is_retriable(error: BaseException) -> bool:
+    """Transport failures, timeouts, throttling and server errors are worth another endpoint."""
+    if isinstance(error, NoHealthyEndpointError):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    return isinstance(error, (ConnectionError, TimeoutError, APIConnectionError))
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures, lets one probe through after `reset_timeout`."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> Literal["closed", "open", "half-open"]:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allows(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self._probing)
+
+    def on_start(self) -> None:
+        if self.state == "half-open":
+            self._probing = True
+
+    def on_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def on_failure(self) -> None:
+        self._failures += 1
+        self._probing = False
+        if self._opened_at is not None or self._failures >= self.failure_threshold:
+            self._opened_at = self._clock()
+
+    def trip(self) -> None:
+        self._probing = False
+        self._opened_at = self._clock()
+
+
+@dataclass
+class Endpoint:
+    """One deployment behind a pool, `health_check` is an optional cheap liveness probe."""
+    name: str
+    client: ChatCompletionClient
+    label: str
+    max_concurrency: int = 16
+    health_check: Optional[Callable[[], Awaitable[bool]]] = None
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+    outstanding: int = 0
+    queued: int = 0
+    requests: int = 0
+    errors: int = 0
+    # Exponentially weighted moving average of the latency, None until the first response.
+    ewma: Optional[float] = None
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=256))
+    # Success of the most recent requests, for the error rate.
+    outcomes: Deque[bool] = field(default_factory=lambda: deque(maxlen=100))
+
+    def __post_init__(self) -> None:
+        if self.label not in LABELS:
+            raise ValueError(f"Unknown label {self.label!r} of endpoint {self.name}, expected one of {LABELS}.")
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+
+    @property
+    def load(self) -> int:
+        return self.outstanding + self.queued
+
+    def as_dict(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        return {
+            "label": self.label,
+            "state": self.breaker.state,
+            "outstanding": self.outstanding,
+            "queued": self.queued,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ewma_ms": self.ewma * 1e3 if self.ewma is not None else None,
+            "p50_ms": percentile(latencies, 0.5) * 1e3 if latencies else None,
+            "p95_ms": percentile(latencies, 0.95) * 1e3 if latencies else None,
+        }
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """`q` percentile of sorted `values`."""
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+@dataclass
+class BackendTelemetry:
+    """Live load and latency of a pool, what the router needs to pick between twins."""
+    label: str
+    queue_depth: int
+    # Requests the healthy endpoints run at once.
+    capacity: int
+    p50: Optional[float]
+    p95: Optional[float]
+    error_rate: float
+    healthy: bool
+
+
+class EndpointPool:
+    """`ChatCompletionClient` spreading requests over the endpoints of one deployment label.
+
+    - Balancing: "least_outstanding" picks the endpoint with the fewest requests in flight or
+      waiting, "ewma" the lowest latency EWMA weighted by that load. Each endpoint has its own
+      concurrency limit, requests over it wait for a slot.
+    - Failures: retriable errors are retried on another endpoint, up to `retries` times after a
+      jittered exponential backoff. Consecutive failures open an endpoint's circuit breaker.
+    - Hedging: with `hedge_percentile`, a request still running after that percentile of the
+      pool's recent latencies is also sent to a second endpoint, the first answer wins.
+
+    Every endpoint must carry the pool's label, so on-premise traffic can not reach a public
+    endpoint whatever the balancing does.
+    """
+
+    def __init__(
+        self,
+        label: str,
+        endpoints: Sequence[Endpoint],
+        strategy: Literal["least_outstanding", "ewma"] = "least_outstanding",
+        retries: int = 2,
+        backoff_base: float = 0.1,
+        backoff_max: float = 2.0,
+        hedge_percentile: Optional[float] = None,
+        hedge_min_samples: int = 20,
+        ewma_alpha: float = 0.3,
+        retriable: Callable[[BaseException], bool] = is_retriable,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        if not endpoints:
+            raise ValueError(f"A pool needs at least one endpoint, got none for {label!r}.")
+        for endpoint in endpoints:
+            if endpoint.label != label:
+                raise ValueError(f"Endpoint {endpoint.name} is labeled {endpoint.label!r}, "
+                                 f"it can not serve the {label!r} pool.")
+        self.label = label
+        self.endpoints = list(endpoints)
+        self._strategy = strategy
+        self._retries = retries
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._hedge_percentile = hedge_percentile
+        self._hedge_min_samples = hedge_min_samples
+        self._ewma_alpha = ewma_alpha
+        self._retriable = retriable
+        self._random = rng or random.Random()
+        self._latencies: Deque[float] = deque(maxlen=512)
+        self._health_task: Optional[asyncio.Task] = None
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.retries = 0
+
+    # Balancing
+
+    def _pick(self, exclude: Set[str]) -> Endpoint:
+        available = [endpoint for endpoint in self.endpoints if endpoint.breaker.allows()]
+        if not available:
+            raise NoHealthyEndpointError(f"No healthy {self.label} endpoint.")
+        # Prefer endpoints this request has not failed on yet.
+        fresh = [endpoint for endpoint in available if endpoint.name not in exclude] or available
+        if self._strategy == "ewma":
+            return min(fresh, key=lambda endpoint: ((endpoint.ewma or 0.0) * (endpoint.load + 1), endpoint.load))
+        return min(fresh, key=lambda endpoint: (endpoint.load / endpoint.max_concurrency, endpoint.ewma or 0.0))
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter.
+        return self._random.uniform(0, min(self._backoff_max, self._backoff_base * 2 ** attempt))
+
+    def _hedge_delay(self) -> Optional[float]:
+        if self._hedge_percentile is None or len(self._latencies) < self._hedge_min_samples:
+            return None
+        return percentile(sorted(self._latencies), self._hedge_percentile)
+
+    # Bookkeeping around one request on one endpoint
+
+    async def _acquire(self, endpoint: Endpoint) -> None:
+        endpoint.queued += 1
+        try:
+            await endpoint._slots.acquire()
+        finally:
+            endpoint.queued -= 1
+        endpoint.outstanding += 1
+        endpoint.requests += 1
+        endpoint.breaker.on_start()
+
+    def _release(self, endpoint: Endpoint, started: float, error: Optional[BaseException]) -> None:
+        endpoint.outstanding -= 1
+        endpoint._slots.release()
+        if isinstance(error, asyncio.CancelledError):
+            # Abandoned, e.g. the losing side of a hedge, says nothing about the endpoint.
+            return
+        if error is None:
+            latency = time.perf_counter() - started
+            endpoint.latencies.append(latency)
+            self._latencies.append(latency)
+            endpoint.ewma = latency if endpoint.ewma is None else \
+                self._ewma_alpha * latency + (1 - self._ewma_alpha) * endpoint.ewma
+            endpoint.outcomes.append(True)
+            endpoint.breaker.on_success()
+        else:
+            endpoint.errors += 1
+            endpoint.outcomes.append(False)
+            if self._retriable(error):
+                endpoint.breaker.on_failure()
+
+    async def _call(self, endpoint: Endpoint, messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema],
+                    json_output: Optional[bool], extra_create_args: Mapping[str, Any],
+                    cancellation_token: CancellationToken) -> CreateResult:
+        await self._acquire(endpoint)
+        started = time.perf_counter()
+        error: Optional[BaseException] = None
+        try:
+            return await endpoint.client.create(messages, tools=tools, json_output=json_output,
+                                                extra_create_args=extra_create_args,
+                                                cancellation_token=cancellation_token)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._release(endpoint, started, error)
+
+    async def _attempt(self, exclude: Set[str], *args: Any) -> CreateResult:
+        """One attempt, hedged on a second endpoint when the first is slow."""
+        primary_endpoint = self._pick(exclude)
+        exclude.add(primary_endpoint.name)
+        tokens = [CancellationToken()]
+        primary = asyncio.ensure_future(self._call(primary_endpoint, *args, tokens[0]))
+        running = {primary}
+        try:
+            delay = self._hedge_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait(running, timeout=delay)
+                if not done:
+                    try:
+                        secondary_endpoint = self._pick(exclude)
+                    except NoHealthyEndpointError:
+                        secondary_endpoint = None
+                    if secondary_endpoint is not None and secondary_endpoint is not primary_endpoint:
+                        exclude.add(secondary_endpoint.name)
+                        self.hedges += 1
+                        tokens.append(CancellationToken())
+                        running.add(asyncio.ensure_future(self._call(secondary_endpoint, *args, tokens[1])))
+            # The first answer wins, a failure only counts once nothing else is running.
+            error: Optional[BaseException] = None
+            while running:
+                done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                # Retrieve every outcome first, a failure left unread beside a winner is logged as never retrieved.
+                outcomes = [(task, task.exception()) for task in done]
+                for task, task_error in outcomes:
+                    if task_error is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = error or task_error
+            assert error is not None
+            raise error
+        finally:
+            for token in tokens:
+                token.cancel()
+            for task in running:
+                task.cancel()
+
+    # ChatCompletionClient
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        exclude: Set[str] = set()
+        for attempt in range(self._retries + 1):
+            if attempt:
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt))
+            work = asyncio.ensure_future(self._attempt(exclude, messages, tools, json_output, extra_create_args))
+            if cancellation_token is not None:
+                cancellation_token.link_future(work)
+            try:
+                return await work
+            except Exception as error:
+                if attempt == self._retries or not self._retriable(error):
+                    raise
+                logger.info(f"{self.label} pool: attempt {attempt + 1} failed ({error!r}), retrying.")
+        raise AssertionError("unreachable")
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        # Streams are not hedged, and only retried while nothing has been yielded yet.
+        exclude: Set[str] = set()
+        for attempt in range(self._retries + 1):
+            if attempt:
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt))
+            endpoint = self._pick(exclude)
+            exclude.add(endpoint.name)
+            await self._acquire(endpoint)
+            started = time.perf_counter()
+            error: Optional[BaseException] = None
+            yielded = False
+            try:
+                async for item in endpoint.client.create_stream(
+                        messages, tools=tools, json_output=json_output, extra_create_args=extra_create_args,
+                        cancellation_token=cancellation_token):
+                    yielded = True
+                    yield item
+                return
+            except BaseException as e:
+                error = e
+                if yielded or attempt == self._retries or not isinstance(e, Exception) or not self._retriable(e):
+                    raise
+                logger.info(f"{self.label} pool: stream attempt {attempt + 1} failed ({e!r}), retrying.")
+            finally:
+                self._release(endpoint, started, error)
+
+    def actual_usage(self) -> RequestUsage:
+        usages = [endpoint.client.actual_usage() for endpoint in self.endpoints]
+        return RequestUsage(prompt_tokens=sum(usage.prompt_tokens for usage in usages),
+                            completion_tokens=sum(usage.completion_tokens for usage in usages))
+
+    def total_usage(self) -> RequestUsage:
+        usages = [endpoint.client.total_usage() for endpoint in self.endpoints]
+        return RequestUsage(prompt_tokens=sum(usage.prompt_tokens for usage in usages),
+                            completion_tokens=sum(usage.completion_tokens for usage in usages))
+
+    def count_tokens(self, messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self.endpoints[0].client.count_tokens(messages, tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return min(endpoint.client.remaining_tokens(messages, tools) for endpoint in self.endpoints)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:
+        return self.endpoints[0].client.capabilities
+
+    # Health
+
+    async def check_health(self) -> None:
+        """Probe the endpoints that have a health check, a failed probe opens the circuit."""
+        async def probe(endpoint: Endpoint) -> None:
+            try:
+                healthy = await endpoint.health_check()
+            except Exception:
+                healthy = False
+            if not healthy:
+                endpoint.breaker.trip()
+            elif endpoint.breaker.state != "closed":
+                endpoint.breaker.on_success()
+
+        await asyncio.gather(*[probe(endpoint) for endpoint in self.endpoints if endpoint.health_check])
+
+    def start_health_checks(self, interval: float = 10.0) -> None:
+        async def run() -> None:
+            while True:
+                await self.check_health()
+                await asyncio.sleep(interval)
+
+        if self._health_task is None:
+            self._health_task = asyncio.ensure_future(run())
+
+    async def stop_health_checks(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+
+    # Telemetry
+
+    def telemetry(self) -> BackendTelemetry:
+        latencies = sorted(self._latencies)
+        outcomes = [outcome for endpoint in self.endpoints for outcome in endpoint.outcomes]
+        return BackendTelemetry(
+            label=self.label,
+            queue_depth=sum(endpoint.load for endpoint in self.endpoints),
+            capacity=sum(endpoint.max_concurrency for endpoint in self.endpoints if endpoint.breaker.allows()),
+            p50=percentile(latencies, 0.5) if latencies else None,
+            p95=percentile(latencies, 0.95) if latencies else None,
+            error_rate=outcomes.count(False) / len(outcomes) if outcomes else 0.0,
+            healthy=any(endpoint.breaker.allows() for endpoint in self.endpoints),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "label": self.label,
+            "strategy": self._strategy,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "retries": self.retries,
+            "endpoints": {endpoint.name: endpoint.as_dict() for endpoint in self.endpoints},
+        }
+
+
+def pools_from_config(config: Mapping[str, Any]) -> Dict[str, EndpointPool]:
+    """Build a pool per label from a config like
+
+        {"on-premise": {"endpoints": [{"name": "vllm-1", "kind": "openai", "base_url": "...", "model": "...",
+                                       "max_concurrency": 8}],
+                        "strategy": "ewma", "hedge_percentile": 0.95},
+         "public": {"endpoints": [{"name": "azure-eu", "kind": "azure", "azure_endpoint": "...",
+                                   "azure_deployment": "...", "model": "...", "api_version": "...",
+                                   "api_key": "..."}]}}
+
+    "openai" endpoints are any OpenAI compatible server, e.g. an on-premise vLLM.
+    """
+    from autogen_ext.models.openai import AzureOpenAIChatCompletionClient, OpenAIChatCompletionClient
+
+    pools: Dict[str, EndpointPool] = {}
+    for label, pool_config in config.items():
+        pool_config = dict(pool_config)
+        endpoints = []
+        for endpoint_config in pool_config.pop("endpoints"):
+            endpoint_config = dict(endpoint_config)
+            name = endpoint_config.pop("name")
+            kind = endpoint_config.pop("kind", "azure")
+            max_concurrency = endpoint_config.pop("max_concurrency", 16)
+            if kind == "azure":
+                client = AzureOpenAIChatCompletionClient(**endpoint_config)
+            elif kind == "openai":
+                client = OpenAIChatCompletionClient(**endpoint_config)
+            else:
+                raise ValueError(f"Unknown endpoint kind {kind!r} of {name}.")
+            endpoints.append(Endpoint(name=name, client=client, label=label, max_concurrency=max_concurrency))
+        pools[label] = EndpointPool(label, endpoints, **pool_config)
+    return pools
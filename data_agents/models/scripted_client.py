@@ -0,0 +1,245 @@
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Callable, Deque, List, Mapping, Optional, Sequence, Tuple, Union
+from collections import deque
+import ast
+import asyncio
+import itertools
+import json
+import random
+import re
+from autogen_core import CancellationToken, FunctionCall
+from autogen_core.models import (
+    CreateResult,
+    FunctionExecutionResultMessage,
+    LLMMessage,
+    ModelCapabilities,
+    RequestUsage,
+)
+from autogen_core.tools import Tool, ToolSchema
+from data_agents.context_policy import message_tokens
+from data_agents.groupchat_manager import SUMMARY_PROMPT
+from data_agents.utils.utils import count_tokens
+
+
+@dataclass
+class ScriptedResponse:
+    """A response of `ScriptedChatCompletionClient`, fields left to None use the client's defaults."""
+    content: Union[str, List[FunctionCall]]
+    latency: Optional[float] = None
+    completion_tokens: Optional[int] = None
+
+
+Response = Union[str, List[FunctionCall], ScriptedResponse]
+# A rule looks at a request and answers it, or returns None to leave it to the next rule.
+ScriptRule = Callable[[Sequence[LLMMessage], Sequence[Tool | ToolSchema]], Optional[Response]]
+
+
+def _text(message: LLMMessage) -> str:
+    return message.content if isinstance(message.content, str) else ""
+
+
+def _tool_name(tool: Tool | ToolSchema) -> str:
+    return tool.name if isinstance(tool, Tool) else tool["name"]
+
+
+def summary_rule(summary: str = "The user asked a question, it was answered.") -> ScriptRule:
+    """Answer the selector's summary requests."""
+    marker = SUMMARY_PROMPT.splitlines()[0]
+
+    def rule(messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema]) -> Optional[Response]:
+        return summary if messages and _text(messages[0]).startswith(marker) else None
+    return rule
+
+
+def route_rule(route: str) -> ScriptRule:
+    """Answer selector prompts: a message of the user goes to `route`, any other back to the user."""
+    participants = re.compile(r"select the next role from (\[.*?\]) to play")
+
+    def rule(messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema]) -> Optional[Response]:
+        prompt = _text(messages[0]) if messages else ""
+        if "QUESTION/RESULT:" not in prompt:
+            return None
+        candidates = ast.literal_eval(participants.search(prompt).group(1))
+        speaker = prompt.split("QUESTION/RESULT:", 1)[1].strip().split(":", 1)[0]
+        selected = route if speaker == "User" else "User"
+        return selected if selected in candidates else candidates[0]
+    return rule
+
+
+def tool_call_rule(calls: Sequence[Tuple[str, Mapping[str, Any]]]) -> ScriptRule:
+    """Call the tools in `calls` that the request offers, once per tool loop."""
+    ids = itertools.count()
+
+    def rule(messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema]) -> Optional[Response]:
+        if not tools or any(isinstance(message, FunctionExecutionResultMessage) for message in messages):
+            return None
+        offered = {_tool_name(tool) for tool in tools}
+        function_calls = [
+            FunctionCall(id=f"call_{next(ids)}", name=name, arguments=json.dumps(arguments))
+            for name, arguments in calls if name in offered
+        ]
+        return function_calls or None
+    return rule
+
+
+def router_rules(
+    route: str = "HR_onpre",
+    tool_calls: Sequence[Tuple[str, Mapping[str, Any]]] = (("hr_rules_and_regulations", {"query": "annual leave"}),),
+) -> List[ScriptRule]:
+    """Rules that play every model role of the router: summaries, routing and assistants calling tools."""
+    return [summary_rule(), route_rule(route), tool_call_rule(tool_calls)]
+
+
+class ScriptedChatCompletionClient:
+    """Deterministic, local `ChatCompletionClient` for tests and benchmarks.
+
+    A request is answered by the next entry of `script` while there is one, then by the first of
+    `rules` that answers it, then with `default`. Responses take `latency` seconds to the first
+    token plus `latency_per_token` per completion token, a `tail_rate` share of them `tail_latency`
+    more. A `failure_rate` share of requests fail with `ConnectionError`, like an unreachable
+    endpoint; draws come from a generator seeded with `seed`. Token counts are the repo's own
+    estimate unless `prompt_tokens` / `completion_tokens` fix them.
+    """
+
+    def __init__(
+        self,
+        script: Sequence[Response] = (),
+        rules: Sequence[ScriptRule] = (),
+        default: str = "OK",
+        latency: float = 0.0,
+        latency_per_token: float = 0.0,
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: Optional[int] = None,
+        chunk_words: int = 3,
+        max_tokens: int = 128000,
+        tail_latency: float = 0.0,
+        tail_rate: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        self._script: Deque[Response] = deque(script)
+        self._rules = list(rules)
+        self._default = default
+        self._latency = latency
+        self._latency_per_token = latency_per_token
+        self._prompt_tokens = prompt_tokens
+        self._completion_tokens = completion_tokens
+        self._chunk_words = chunk_words
+        self._max_tokens = max_tokens
+        self._tail_latency = tail_latency
+        self._tail_rate = tail_rate
+        self._failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._total_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self.calls = 0
+
+    def _respond(self, messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema]) -> ScriptedResponse:
+        response: Optional[Response] = None
+        if self._script:
+            response = self._script.popleft()
+        else:
+            for rule in self._rules:
+                response = rule(messages, tools)
+                if response is not None:
+                    break
+        if response is None:
+            response = self._default
+        if not isinstance(response, ScriptedResponse):
+            response = ScriptedResponse(content=response)
+        return response
+
+    def _first_token_latency(self, response: ScriptedResponse) -> float:
+        latency = response.latency if response.latency is not None else self._latency
+        if self._tail_rate and self._random.random() < self._tail_rate:
+            latency += self._tail_latency
+        return latency
+
+    def _usage(self, messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema],
+               response: ScriptedResponse) -> RequestUsage:
+        if response.completion_tokens is not None:
+            completion_tokens = response.completion_tokens
+        elif self._completion_tokens is not None:
+            completion_tokens = self._completion_tokens
+        elif isinstance(response.content, str):
+            completion_tokens = count_tokens(response.content)
+        else:
+            completion_tokens = sum(count_tokens(call.name + call.arguments) for call in response.content)
+        prompt_tokens = self._prompt_tokens if self._prompt_tokens is not None else self.count_tokens(messages, tools)
+        return RequestUsage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def _result(self, response: ScriptedResponse, usage: RequestUsage) -> CreateResult:
+        self.calls += 1
+        self._total_usage = RequestUsage(
+            prompt_tokens=self._total_usage.prompt_tokens + usage.prompt_tokens,
+            completion_tokens=self._total_usage.completion_tokens + usage.completion_tokens,
+        )
+        finish_reason = "stop" if isinstance(response.content, str) else "function_calls"
+        return CreateResult(finish_reason=finish_reason, content=response.content, usage=usage, cached=False)
+
+    async def _sleep(self, seconds: float, cancellation_token: Optional[CancellationToken]) -> None:
+        if seconds <= 0:
+            return
+        sleep = asyncio.ensure_future(asyncio.sleep(seconds))
+        if cancellation_token is not None:
+            cancellation_token.link_future(sleep)
+        await sleep
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        response = self._respond(messages, tools)
+        usage = self._usage(messages, tools, response)
+        latency = self._first_token_latency(response)
+        failed = self._failure_rate and self._random.random() < self._failure_rate
+        await self._sleep(latency + self._latency_per_token * usage.completion_tokens, cancellation_token)
+        if failed:
+            raise ConnectionError("Scripted endpoint failure.")
+        return self._result(response, usage)
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        response = self._respond(messages, tools)
+        usage = self._usage(messages, tools, response)
+        latency = self._first_token_latency(response)
+        failed = self._failure_rate and self._random.random() < self._failure_rate
+        await self._sleep(latency, cancellation_token)
+        if failed:
+            raise ConnectionError("Scripted endpoint failure.")
+        if isinstance(response.content, str):
+            words = re.findall(r"\S+\s*", response.content)
+            chunks = ["".join(words[i:i + self._chunk_words]) for i in range(0, len(words), self._chunk_words)]
+            for chunk in chunks:
+                await self._sleep(self._latency_per_token * usage.completion_tokens / len(chunks), cancellation_token)
+                yield chunk
+        else:
+            await self._sleep(self._latency_per_token * usage.completion_tokens, cancellation_token)
+        yield self._result(response, usage)
+
+    def actual_usage(self) -> RequestUsage:
+        return self._total_usage
+
+    def total_usage(self) -> RequestUsage:
+        return self._total_usage
+
+    def count_tokens(self, messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema] = []) -> int:
+        schema_tokens = sum(
+            count_tokens(json.dumps(tool.schema if isinstance(tool, Tool) else tool, sort_keys=True)) for tool in tools)
+        return sum(message_tokens(message) for message in messages) + schema_tokens
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._max_tokens - self.count_tokens(messages, tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:
+        return ModelCapabilities(vision=False, function_calling=True, json_output=True)
@@ -0,0 +1,91 @@
+from typing import Any, AsyncGenerator, Mapping, Optional, Sequence, Union
+from autogen_core import CancellationToken
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    LLMMessage,
+    ModelCapabilities,
+    RequestUsage,
+)
+from autogen_core.tools import Tool, ToolSchema
+from opentelemetry.trace import Span
+from data_agents import telemetry
+
+
+class TracedChatCompletionClient:
+    """`ChatCompletionClient` recording a "model" span per call, with its token usage.
+
+    The span inherits the session and topic type of the stage the call is made from, e.g. the
+    manager's routing decision or an assistant's turn.
+    """
+
+    def __init__(self, model_client: ChatCompletionClient, label: str) -> None:
+        self._model_client = model_client
+        self._label = label
+
+    def _record(self, span: Span, result: CreateResult) -> None:
+        span.set_attributes({
+            "gen_ai.usage.input_tokens": result.usage.prompt_tokens,
+            "gen_ai.usage.output_tokens": result.usage.completion_tokens,
+            "gen_ai.response.finish_reasons": [result.finish_reason],
+            "cached": bool(result.cached),
+        })
+        attributes = {"label": self._label}
+        telemetry.model_tokens.add(result.usage.prompt_tokens, {**attributes, "type": "prompt"})
+        telemetry.model_tokens.add(result.usage.completion_tokens, {**attributes, "type": "completion"})
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        with telemetry.stage("model", label=self._label, messages=len(messages), tools=len(tools)) as span:
+            result = await self._model_client.create(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            )
+            self._record(span, result)
+            return result
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        with telemetry.stage("model", label=self._label, messages=len(messages), tools=len(tools),
+                             stream=True) as span:
+            async for item in self._model_client.create_stream(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            ):
+                if isinstance(item, CreateResult):
+                    self._record(span, item)
+                yield item
+
+    def actual_usage(self) -> RequestUsage:
+        return self._model_client.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self._model_client.total_usage()
+
+    def count_tokens(self, messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._model_client.count_tokens(messages, tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._model_client.remaining_tokens(messages, tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:
+        return self._model_client.capabilities
@@ -1,11 +1,24 @@
-from typing import Mapping, Any
+from typing import Mapping, Any, Dict, Optional
 from abc import ABC, abstractmethod
+import asyncio
+import logging
+from data_agents import telemetry
+
+logger = logging.getLogger(__name__)
+
+
+class PersistenceError(Exception):
+    """A save of a session did not reach the storage."""
+
+
+class SessionConflictError(PersistenceError):
+    """A session was saved by another replica since this one loaded or saved it."""
 
 
 class Persistence(ABC):
     def __init__(self):
         pass
-    
+
     @abstractmethod
     def load_content(self, userid) -> Mapping[str, Any]:
         pass
@@ -16,4 +29,135 @@ class Persistence(ABC):
 
     @abstractmethod
     def get_uuid(self, userid) -> str:
-        pass
\ No newline at end of file
+        pass
+
+
+class AsyncPersistence(ABC):
+    """Async variant of `Persistence`, safe to await on the event loop."""
+
+    @abstractmethod
+    async def aload_content(self, uuid) -> Mapping[str, Any]:
+        pass
+
+    @abstractmethod
+    async def asave_content(self, uuid, content: Mapping[str, Any]) -> None:
+        pass
+
+    @abstractmethod
+    async def aget_uuid(self, userid) -> str:
+        pass
+
+    async def aflush(self) -> None:
+        """Wait until every accepted save is durable, raises `PersistenceError` if one could not be written."""
+        pass
+
+    def conflicted(self, uuid) -> bool:
+        """Whether the last save of the session lost to another replica's, it has to be loaded again."""
+        return False
+
+
+class ThreadedPersistence(Persistence, AsyncPersistence):
+    """Implements `AsyncPersistence` on top of the sync methods of a `Persistence`.
+
+    I/O and serialization run in a worker thread. Saves are write-behind: `asave_content`
+    returns once the content is queued, and while a session is being written later saves
+    of the same session replace the queued content, so only the latest one is written.
+
+    A write that fails is retried `retries` times. If it still fails, the failure is kept and
+    raised as `PersistenceError` by the next `asave_content` of the session, whose content then
+    replaces the unsaved one, or by `aflush`, which retries the unsaved contents first. A failure
+    that `_retryable` rejects drops its content and the next save of the session is refused, e.g.
+    a `SessionConflictError`: the session is then loaded again, which clears the failure.
+    """
+
+    retries = 2
+    # Seconds before the first retry, doubled for every further one.
+    retry_delay = 0.1
+
+    def __init__(self):
+        super().__init__()
+        self._pending: Dict[str, Mapping[str, Any]] = {}
+        self._writers: Dict[str, asyncio.Task] = {}
+        # uuid -> why its last write failed, and the content it could not write.
+        self._failures: Dict[str, Exception] = {}
+        self._unsaved: Dict[str, Mapping[str, Any]] = {}
+
+    async def aload_content(self, uuid) -> Mapping[str, Any]:
+        # Read after write: let queued saves of the session land first.
+        writer = self._writers.get(uuid)
+        with telemetry.stage("persistence", session_id=uuid, operation="load"):
+            if writer is not None:
+                await asyncio.shield(writer)
+            if uuid in self._unsaved:
+                # Newer than what the storage holds.
+                return self._unsaved[uuid]
+            content = await asyncio.to_thread(self.load_content, uuid)
+        if self.conflicted(uuid):
+            logger.warning(f"Session {uuid} was saved by another replica, continuing from its saved state.")
+            self._failures.pop(uuid, None)
+        return content
+
+    async def asave_content(self, uuid, content: Mapping[str, Any]) -> None:
+        failure = self._failures.pop(uuid, None)
+        if failure is not None and not self._retryable(failure):
+            raise PersistenceError(f"The last save of session {uuid} failed, this one is refused.") from failure
+        self._unsaved.pop(uuid, None)
+        self._queue(uuid, content)
+        if failure is not None:
+            raise PersistenceError(f"The last save of session {uuid} failed, this one is queued.") from failure
+
+    def _queue(self, uuid, content: Mapping[str, Any]) -> None:
+        self._pending[uuid] = content
+        if uuid not in self._writers:
+            self._writers[uuid] = asyncio.create_task(self._write_behind(uuid))
+
+    async def aget_uuid(self, userid) -> str:
+        with telemetry.stage("persistence", operation="lookup"):
+            return await asyncio.to_thread(self.get_uuid, userid)
+
+    async def aflush(self) -> None:
+        unsaved, self._unsaved = self._unsaved, {}
+        for uuid, content in unsaved.items():
+            self._failures.pop(uuid, None)
+            self._queue(uuid, content)
+        while self._writers:
+            await asyncio.gather(*self._writers.values(), return_exceptions=True)
+        if self._failures:
+            failures, self._failures = self._failures, {}
+            raise PersistenceError(f"Failed to persist sessions {sorted(failures)}.") from next(iter(failures.values()))
+
+    def conflicted(self, uuid) -> bool:
+        return isinstance(self._failures.get(uuid), SessionConflictError)
+
+    def _retryable(self, error: Exception) -> bool:
+        """Whether a failed write may be written again later, or its content is obsolete."""
+        return not isinstance(error, SessionConflictError)
+
+    async def _write_behind(self, uuid) -> None:
+        try:
+            while uuid in self._pending:
+                content = self._pending.pop(uuid)
+                failure = await self._write(uuid, content)
+                if failure is None:
+                    self._failures.pop(uuid, None)
+                    self._unsaved.pop(uuid, None)
+                elif uuid not in self._pending:
+                    # A newer content replaces this one, otherwise it is kept for a retry.
+                    self._failures[uuid] = failure
+                    if self._retryable(failure):
+                        self._unsaved[uuid] = content
+        finally:
+            del self._writers[uuid]
+
+    async def _write(self, uuid, content: Mapping[str, Any]) -> Optional[Exception]:
+        for attempt in range(self.retries + 1):
+            try:
+                with telemetry.stage("persistence", session_id=uuid, operation="save"):
+                    await asyncio.to_thread(self.save_content, uuid, content)
+                return None
+            except Exception as e:
+                if attempt == self.retries or not self._retryable(e):
+                    logger.exception(f"Failed to persist session {uuid}")
+                    return e
+                logger.warning(f"Failed to persist session {uuid}, retrying: {e!r}")
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
@@ -1,8 +1,13 @@
-from .base import Persistence
-from typing import Mapping, Any
+from .base import ThreadedPersistence
+from .snapshot import SnapshotCodec, train_dictionary
+from typing import Mapping, Any, Dict, Optional, Sequence
+import hashlib
 import os
 import json
 import pathlib
+import sqlite3
+import tempfile
+import threading
 from dataclasses import dataclass
 from autogen_core.models import (
     UserMessage,
@@ -10,51 +15,203 @@ from autogen_core.models import (
 import glob
 
 PERSISTANCE_DIR = 'configs/persistances'
+INDEX_FILE = 'index.sqlite3'
+SNAPSHOT_SUFFIX = '.snap'
+# Trained zstd dictionaries, `snapshot.<dictionary id>.dict`, the newest one is used for writing.
+DICTIONARY_PATTERN = 'snapshot.*.dict'
 
 @dataclass
 class Record:
     content: str
     source: str
 
-class LocalFilePersistence(Persistence):
-    def load_content(self, uuid) -> Mapping[str, Any]:
+
+def user_of(uuid: str) -> str:
+    # session id is `<user_id>~<user_name>~<user_token>~<uuid4>`
+    return uuid.rsplit("~", 1)[0]
+
+
+def to_records(messages) -> list:
+    return [{"content": item.content, "source": item.source} for item in messages]
+
+
+def to_messages(records) -> list:
+    return [UserMessage(content=item["content"], source=item["source"]) for item in records]
+
+
+def fingerprint(messages: Sequence[Any], count: int) -> str:
+    """Digest of the `count`th message, tells whether a history still starts with what is on disk."""
+    if count == 0:
+        return ""
+    record = json.dumps(to_records([messages[count - 1]])[0], sort_keys=True, default=str)
+    return hashlib.sha1(record.encode()).hexdigest()[:16]
+
+
+def write_atomic(path: str, data: str | bytes) -> None:
+    # Write to a temp file and rename it over the target, a crash never leaves a truncated file.
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, "wb" if isinstance(data, bytes) else "w") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class SessionIndex:
+    """Exact-match index from user identity to session id, kept in a sqlite file next to the sessions."""
+
+    def __init__(self, persistance_path: str, patterns=('*.json',)) -> None:
+        self._persistance_path = persistance_path
+        self._patterns = patterns
+        self._lock = threading.Lock()
+        os.makedirs(persistance_path, exist_ok=True)
+        index_path = os.path.join(persistance_path, INDEX_FILE)
+        created = not os.path.exists(index_path)
+        self._conn = sqlite3.connect(index_path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS sessions (user TEXT PRIMARY KEY, uuid TEXT NOT NULL)")
+        self._conn.commit()
+        if created:
+            # Index sessions saved before the index existed.
+            self.rebuild()
+
+    def get(self, user: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT uuid FROM sessions WHERE user = ?", (user,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, user: str, uuid: str) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO sessions (user, uuid) VALUES (?, ?)", (user, uuid))
+            self._conn.commit()
+
+    def rebuild(self) -> int:
+        """Re-create the index from the session files in the directory, the newest file of a user wins."""
+        session_files = [file for pattern in self._patterns
+                         for file in glob.glob(os.path.join(self._persistance_path, pattern))]
+        session_files.sort(key=os.path.getmtime)
+        latest = {}
+        for file in session_files:
+            uuid = os.path.splitext(os.path.basename(file))[0]
+            latest[user_of(uuid)] = uuid
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions")
+            self._conn.executemany("INSERT INTO sessions (user, uuid) VALUES (?, ?)", latest.items())
+            self._conn.commit()
+        return len(latest)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class LocalFilePersistence(ThreadedPersistence):
+    """Session persistence as one snapshot file per session, see `snapshot` for the format.
+
+    Sessions saved as `<uuid>.json` by earlier versions are read as well, and replaced by a
+    `<uuid>.snap` snapshot the next time they are saved.
+    """
+
+    # Files a session may be stored in, used to rebuild the index.
+    index_patterns = ('*.json', '*' + SNAPSHOT_SUFFIX)
+
+    def __init__(self, persistance_dir: str = PERSISTANCE_DIR, compression: str = "zstd"):
+        super().__init__()
         base_dir = pathlib.Path().resolve()
-        persistance_path = os.path.join(base_dir, PERSISTANCE_DIR, uuid + '.json')
+        self._persistance_path = os.path.join(base_dir, persistance_dir)
+        self.index = SessionIndex(self._persistance_path, self.index_patterns)
+        dictionary_files = sorted(glob.glob(os.path.join(self._persistance_path, DICTIONARY_PATTERN)),
+                                  key=os.path.getmtime)
+        dictionaries = []
+        for dictionary_file in dictionary_files:
+            with open(dictionary_file, "rb") as file:
+                dictionaries.append(file.read())
+        self.codec = SnapshotCodec(compression, dictionaries=dictionaries if compression == "zstd" else ())
+
+    def _read_snapshot(self, uuid) -> Optional[Dict[str, Any]]:
+        """Content of the session's snapshot, in either format, with its messages as message objects."""
         try:
-            with open(persistance_path) as file:
+            with open(os.path.join(self._persistance_path, uuid + SNAPSHOT_SUFFIX), "rb") as file:
+                return self.codec.decode(file.read())
+        except FileNotFoundError:
+            pass
+        try:
+            with open(os.path.join(self._persistance_path, uuid + '.json')) as file:
                 content = json.load(file)
         except FileNotFoundError:
             return None
-        
-        def to_obj(value):
-            value["memory"]["messages"] = [UserMessage(content=item["content"], source=item["source"]) for item in value["memory"]["messages"]]
-            return value
-
-        content = {key: to_obj(value) for key, value in content.items()}
+        for value in content.values():
+            value["memory"]["messages"] = to_messages(value["memory"]["messages"])
         return content
 
-    def save_content(self, uuid, content: Mapping[str, Any]) -> None:
-        base_dir = pathlib.Path().resolve()
-        persistance_path = os.path.join(base_dir, PERSISTANCE_DIR, uuid + '.json')
+    def _write_snapshot(self, uuid, content: Mapping[str, Any]) -> None:
+        write_atomic(os.path.join(self._persistance_path, uuid + SNAPSHOT_SUFFIX), self.codec.encode(content))
+        # Migrated, the snapshot supersedes the JSON file of earlier versions.
+        try:
+            os.unlink(os.path.join(self._persistance_path, uuid + '.json'))
+        except FileNotFoundError:
+            pass
+
+    def _snapshot_size(self, uuid) -> int:
+        for suffix in (SNAPSHOT_SUFFIX, '.json'):
+            try:
+                return os.path.getsize(os.path.join(self._persistance_path, uuid + suffix))
+            except FileNotFoundError:
+                pass
+        return 0
 
-        def to_dict(value):
-            value["memory"]["messages"] = [{"content": item.content, "source": item.source} for item in value["memory"]["messages"]]
-            return value
+    def load_content(self, uuid) -> Mapping[str, Any]:
+        return self._read_snapshot(uuid)
 
-        content = {key: to_dict(value) for key, value in content.items() if value != {}}
+    def save_content(self, uuid, content: Mapping[str, Any]) -> None:
+        content = {key: value for key, value in content.items() if value != {}}
         if content:
-            with open(persistance_path, "w") as file:
-                file.write(json.dumps(content))
+            self._write_snapshot(uuid, content)
+            self.index.put(user_of(uuid), uuid)
 
     def get_uuid(self, userid) -> str:
-        base_dir = pathlib.Path().resolve()
-        persistance_path = os.path.join(base_dir, PERSISTANCE_DIR, '*.json')
-        json_files = glob.glob(persistance_path)
-        for file in json_files:
-            file_name = os.path.basename(file)
-            if userid in file_name:
-                return os.path.splitext(file_name)[0]
-            
-        return None
-
-        
\ No newline at end of file
+        return self.index.get(userid)
+
+    async def aget_uuid(self, userid) -> str:
+        # A session still queued for its first write is not in the index yet.
+        for uuid in [*self._pending, *self._writers, *self._unsaved]:
+            if user_of(uuid) == userid:
+                return uuid
+        return await super().aget_uuid(userid)
+
+    def rebuild_index(self) -> int:
+        return self.index.rebuild()
+
+    def train_dictionary(self, size: int = 32 * 1024) -> str:
+        """Train a zstd dictionary on the saved sessions and write snapshots with it from now on.
+
+        Earlier dictionaries are kept, the snapshots written with them still need them to load.
+        """
+        uuids = {os.path.splitext(os.path.basename(file))[0]
+                 for pattern in self.index_patterns
+                 for file in glob.glob(os.path.join(self._persistance_path, pattern))}
+        contents = [content for content in map(self.load_content, sorted(uuids)) if content]
+        dictionary = train_dictionary(contents, size)
+        dictionary_id = self.codec.add_dictionary(dictionary)
+        path = os.path.join(self._persistance_path, DICTIONARY_PATTERN.replace('*', str(dictionary_id)))
+        write_atomic(path, dictionary)
+        return path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintain the session index of a local persistence directory.")
+    parser.add_argument("command", choices=["rebuild-index", "train-dictionary"])
+    parser.add_argument("--dir", default=PERSISTANCE_DIR, help="persistence directory")
+    parser.add_argument("--dictionary-size", type=int, default=32 * 1024, help="bytes of a trained dictionary")
+    args = parser.parse_args()
+    persistence = LocalFilePersistence(args.dir)
+    if args.command == "train-dictionary":
+        print(f"trained {persistence.train_dictionary(args.dictionary_size)}")
+    else:
+        count = persistence.rebuild_index()
+        print(f"indexed {count} sessions in {args.dir}")
@@ -0,0 +1,197 @@
+from .localfile import LocalFilePersistence, PERSISTANCE_DIR, fingerprint, to_messages, to_records, user_of
+from typing import Mapping, Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+import os
+import json
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentLogPersistence(LocalFilePersistence):
+    """Session persistence as a snapshot plus an append-only log.
+
+    The snapshot is the one of `LocalFilePersistence`, `<uuid>.snap` or the `<uuid>.json` of earlier versions.
+    `<uuid>.log` holds one JSON record per line and agent, appended by every save:
+
+        {"agent": <agent id>, "offset": <n>, "messages": [<messages from n on>], "state": {<rest of the state>}}
+
+    A state without `memory.messages`, e.g. an assistant's, is logged whole as {"agent": ..., "state": {...}}.
+
+    Replay truncates the agent's messages at `offset` and extends them, so a save only writes the
+    messages added since the previous one, and replaying a record twice is harmless. A history whose
+    stored part changed, i.e. whose last stored message is no longer the same, is written from the start.
+    Once the log has `compact_every` records, or outgrows the snapshot, a background task folds it into
+    a new snapshot, off the event loop and off the save path.
+    """
+
+    index_patterns = LocalFilePersistence.index_patterns + ('*.log',)
+
+    def __init__(self, persistance_dir: str = PERSISTANCE_DIR, compact_every: int = 64, compression: str = "zstd"):
+        super().__init__(persistance_dir, compression)
+        self._compact_every = compact_every
+        # uuid -> agent id -> number of messages on disk and the fingerprint of the last one, and uuid ->
+        # number of records in the log, as of the last durable write.
+        self._stored: Dict[str, Dict[str, Tuple[int, str]]] = {}
+        self._log_records: Dict[str, int] = {}
+        # Saves and compactions of a session run in different threads, they take turns on its files.
+        self._locks: Dict[str, threading.Lock] = {}
+        # Sessions whose log is due for compaction, and the compactions running.
+        self._compact_due: Set[str] = set()
+        self._compactions: Dict[str, asyncio.Task] = {}
+
+    def _log_path(self, uuid) -> str:
+        return os.path.join(self._persistance_path, uuid + '.log')
+
+    def _replay(self, uuid) -> Dict[str, Any] | None:
+        # Messages of a binary snapshot stay encoded until read, the log only truncates and extends them.
+        content = self._read_snapshot(uuid)
+
+        records = 0
+        try:
+            with open(self._log_path(uuid)) as file:
+                lines = file.readlines()
+        except FileNotFoundError:
+            lines = []
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Only the last append can be torn by a crash.
+                break
+            content = content if content is not None else {}
+            if "messages" not in record:
+                content[record["agent"]] = record["state"]
+                records += 1
+                continue
+            value = content.setdefault(record["agent"], {"memory": {"messages": []}})
+            messages = value["memory"]["messages"]
+            del messages[record["offset"]:]
+            messages.extend(to_messages(record["messages"]))
+            for key, item in record["state"].items():
+                if key == "memory":
+                    value["memory"].update(item)
+                else:
+                    value[key] = item
+            records += 1
+
+        if content is not None:
+            self._stored[uuid] = {
+                key: (len(value["memory"]["messages"]),
+                      fingerprint(value["memory"]["messages"], len(value["memory"]["messages"])))
+                for key, value in content.items() if "messages" in value.get("memory", {})}
+            self._log_records[uuid] = records
+        return content
+
+    def _lock(self, uuid) -> threading.Lock:
+        return self._locks.setdefault(uuid, threading.Lock())
+
+    def load_content(self, uuid) -> Mapping[str, Any]:
+        with self._lock(uuid):
+            return self._replay(uuid)
+
+    def save_content(self, uuid, content: Mapping[str, Any]) -> None:
+        with self._lock(uuid):
+            self._append(uuid, content)
+
+    def _append(self, uuid, content: Mapping[str, Any]) -> None:
+        if uuid not in self._stored:
+            self._replay(uuid)
+        stored = dict(self._stored.get(uuid, {}))
+
+        records: List[str] = []
+        for key, value in content.items():
+            if value == {}:
+                continue
+            if "messages" not in value.get("memory", {}):
+                records.append(json.dumps({"agent": key, "state": value}))
+                continue
+            messages = value["memory"]["messages"]
+            offset, last = stored.get(key, (0, ""))
+            if offset > len(messages) or fingerprint(messages, offset) != last:
+                # The history was rewritten, e.g. folded, write it from the start.
+                offset = 0
+            state = {k: v for k, v in value.items() if k != "memory"}
+            state["memory"] = {k: v for k, v in value["memory"].items() if k != "messages"}
+            records.append(json.dumps({
+                "agent": key,
+                "offset": offset,
+                "messages": to_records(messages[offset:]),
+                "state": state,
+            }))
+            stored[key] = (len(messages), fingerprint(messages, len(messages)))
+        if not records:
+            return
+
+        with open(self._log_path(uuid), "a") as file:
+            size = file.tell()
+            try:
+                file.write("\n".join(records) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            except BaseException:
+                # A torn record would swallow the next append, the offsets stay where the log is durable.
+                file.truncate(size)
+                raise
+        self._stored[uuid] = stored
+        self._log_records[uuid] = self._log_records.get(uuid, 0) + len(records)
+        self.index.put(user_of(uuid), uuid)
+        if self._should_compact(uuid):
+            self._compact_due.add(uuid)
+
+    async def _write(self, uuid, content: Mapping[str, Any]) -> Optional[Exception]:
+        failure = await super()._write(uuid, content)
+        if uuid in self._compact_due and uuid not in self._compactions:
+            self._compact_due.discard(uuid)
+            task = asyncio.create_task(self._compact_in_background(uuid))
+            self._compactions[uuid] = task
+            task.add_done_callback(lambda _, uuid=uuid: self._compactions.pop(uuid, None))
+        return failure
+
+    async def _compact_in_background(self, uuid) -> None:
+        try:
+            await asyncio.to_thread(self.compact, uuid)
+        except Exception:
+            # The log stays as it is, the next save tries again.
+            logger.exception(f"Failed to compact session {uuid}")
+
+    async def aflush(self) -> None:
+        try:
+            await super().aflush()
+        finally:
+            while self._compactions:
+                await asyncio.gather(*self._compactions.values())
+
+    def _should_compact(self, uuid) -> bool:
+        if self._log_records.get(uuid, 0) >= self._compact_every:
+            return True
+        return os.path.getsize(self._log_path(uuid)) > max(self._snapshot_size(uuid), 64 * 1024)
+
+    def compact_due(self) -> None:
+        """Compact the logs due for it, for callers of the sync methods, the async ones compact in the background."""
+        while self._compact_due:
+            self.compact(self._compact_due.pop())
+
+    def compact(self, uuid) -> None:
+        """Fold the log of a session into its snapshot."""
+        with self._lock(uuid):
+            content = self._replay(uuid)
+            if content is None:
+                return
+            self._write_snapshot(uuid, content)
+            # A crash before the truncation replays the log over the new snapshot, which yields the same state.
+            with open(self._log_path(uuid), "w"):
+                pass
+            self._log_records[uuid] = 0
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintain a segment log persistence directory.")
+    parser.add_argument("command", choices=["rebuild-index"])
+    parser.add_argument("--dir", default=PERSISTANCE_DIR, help="persistence directory")
+    args = parser.parse_args()
+    count = SegmentLogPersistence(args.dir).rebuild_index()
+    print(f"indexed {count} sessions in {args.dir}")
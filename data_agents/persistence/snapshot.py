@@ -0,0 +1,274 @@
+"""Versioned binary snapshot of a session's saved state.
+
+    header  magic "DASN", version (u8), codec (u8), zstd dictionary id (u32), body size (u32)
+    body    compressed with the codec:
+            meta size (u32), meta JSON: {"sources": [...], "agents": [[key, state, count], ...]}
+            per agent with `count` messages:
+                source of each message, index into "sources"  u32 * count
+                kind of each message, 0 text, 1 JSON list     u8 * count
+                offset of each message in the blob            u32 * (count + 1)
+                blob of UTF-8 contents
+
+`state` is the agent's state without `memory.messages`, a count of -1 marks a state that has none.
+Messages decode one at a time, on first access, so a resumed session can start before its older
+turns are materialized. Integers are little-endian.
+"""
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+import json
+import struct
+import sys
+from autogen_core.models import (
+    LLMMessage,
+    UserMessage,
+)
+
+MAGIC = b"DASN"
+VERSION = 1
+HEADER = struct.Struct("<4sBBII")
+CODECS = {"none": 0, "zstd": 1, "lz4": 2}
+_TEXT, _LIST = 0, 1
+
+
+def is_snapshot(data: bytes) -> bool:
+    return data[:len(MAGIC)] == MAGIC
+
+
+def _little_endian(values: array) -> array:
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+class LazyMessages(Sequence):
+    """Messages of a snapshot, each decoded on first access and kept from then on.
+
+    Supports what a growing history needs: appending and truncating its tail.
+    """
+
+    def __init__(self, sources: List[str], source_ids: array, kinds: bytes, offsets: array, blob: bytes) -> None:
+        self._sources = sources
+        self._source_ids = source_ids
+        self._kinds = kinds
+        self._offsets = offsets
+        self._blob = blob
+        self._decoded: List[Optional[LLMMessage]] = [None] * len(source_ids)
+        # Encoded messages still part of the sequence, and the messages added after them.
+        self._count = len(source_ids)
+        self._tail: List[LLMMessage] = []
+
+    def raw(self, index: int) -> Tuple[str, int, bytes]:
+        """Source, kind and encoded content of one of the first `encoded` messages."""
+        return (self._sources[self._source_ids[index]], self._kinds[index],
+                self._blob[self._offsets[index]:self._offsets[index + 1]])
+
+    @property
+    def encoded(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of the encoded contents, those of the messages in the tail are not counted."""
+        return self._offsets[self._count]
+
+    def _decode(self, index: int) -> LLMMessage:
+        message = self._decoded[index]
+        if message is None:
+            source, kind, content = self.raw(index)
+            text = content.decode("utf-8")
+            message = UserMessage(content=text if kind == _TEXT else json.loads(text), source=source)
+            self._decoded[index] = message
+        return message
+
+    def __len__(self) -> int:
+        return self._count + len(self._tail)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._decode(i) if i < self._count else self._tail[i - self._count]
+                    for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("message index out of range")
+        if index < self._count:
+            return self._decode(index)
+        return self._tail[index - self._count]
+
+    def __iter__(self) -> Iterator[LLMMessage]:
+        decoded = self._decoded
+        for index in range(self._count):
+            yield decoded[index] or self._decode(index)
+        yield from self._tail
+
+    def __delitem__(self, index) -> None:
+        if not isinstance(index, slice) or index.stop is not None or index.step not in (None, 1):
+            raise TypeError("only the tail of the messages can be deleted, e.g. del messages[n:]")
+        start, _, _ = index.indices(len(self))
+        if start >= self._count:
+            del self._tail[start - self._count:]
+        else:
+            self._count = start
+            self._tail = []
+
+    def append(self, message: LLMMessage) -> None:
+        self._tail.append(message)
+
+    def extend(self, messages: Iterable[LLMMessage]) -> None:
+        self._tail.extend(messages)
+
+    def copy(self) -> "LazyMessages":
+        """A copy sharing the encoded and decoded messages, later changes of either do not show in the other."""
+        messages = LazyMessages.__new__(LazyMessages)
+        messages.__dict__.update(self.__dict__)
+        messages._tail = list(self._tail)
+        return messages
+
+
+def _encode_messages(messages: Sequence[LLMMessage], sources: Dict[str, int]) -> List[bytes]:
+    source_ids = array("I")
+    kinds = bytearray()
+    offsets = array("I", [0])
+    blob = bytearray()
+    # Messages still encoded are copied as they are.
+    encoded = messages.encoded if isinstance(messages, LazyMessages) else 0
+    for index in range(len(messages)):
+        if index < encoded:
+            source, kind, content = messages.raw(index)
+        else:
+            message = messages[index]
+            source = message.source
+            if isinstance(message.content, str):
+                kind, content = _TEXT, message.content.encode("utf-8")
+            else:
+                kind, content = _LIST, json.dumps(message.content).encode("utf-8")
+        source_ids.append(sources.setdefault(source, len(sources)))
+        kinds.append(kind)
+        blob += content
+        offsets.append(len(blob))
+    return [_little_endian(source_ids).tobytes(), bytes(kinds), _little_endian(offsets).tobytes(), bytes(blob)]
+
+
+def encode_body(content: Mapping[str, Any]) -> bytes:
+    """Uncompressed body of a snapshot, also the samples a dictionary is trained on."""
+    sources: Dict[str, int] = {}
+    agents = []
+    parts: List[bytes] = []
+    for key, value in content.items():
+        memory = value.get("memory")
+        if not isinstance(memory, Mapping) or "messages" not in memory:
+            agents.append([key, value, -1])
+            continue
+        state = {k: v for k, v in value.items() if k != "memory"}
+        state["memory"] = {k: v for k, v in memory.items() if k != "messages"}
+        agents.append([key, state, len(memory["messages"])])
+        parts += _encode_messages(memory["messages"], sources)
+    meta = json.dumps({"sources": list(sources), "agents": agents}).encode("utf-8")
+    return b"".join([struct.pack("<I", len(meta)), meta, *parts])
+
+
+def decode_body(body: bytes) -> Dict[str, Any]:
+    (meta_size,) = struct.unpack_from("<I", body)
+    position = 4 + meta_size
+    meta = json.loads(body[4:position])
+    sources = meta["sources"]
+    content: Dict[str, Any] = {}
+    for key, state, count in meta["agents"]:
+        if count < 0:
+            content[key] = state
+            continue
+        source_ids = array("I")
+        source_ids.frombytes(body[position:position + 4 * count])
+        position += 4 * count
+        kinds = body[position:position + count]
+        position += count
+        offsets = array("I")
+        offsets.frombytes(body[position:position + 4 * (count + 1)])
+        position += 4 * (count + 1)
+        _little_endian(source_ids)
+        _little_endian(offsets)
+        blob = body[position:position + offsets[-1]]
+        position += offsets[-1]
+        state["memory"]["messages"] = LazyMessages(sources, source_ids, kinds, offsets, blob)
+        content[key] = state
+    return content
+
+
+class SnapshotCodec:
+    """Encodes session content to snapshots, optionally compressed with zstd or lz4.
+
+    zstd can use trained dictionaries, see `train_dictionary`: snapshots are written with the last
+    of `dictionaries` and read with the one they were written with, keep the older ones for that.
+    The compression libraries are imported on first use.
+    """
+
+    def __init__(self, compression: str = "zstd", level: int = 3, dictionaries: Sequence[bytes] = ()) -> None:
+        if compression not in CODECS:
+            raise ValueError(f"Unknown compression {compression!r}, expected one of {', '.join(CODECS)}.")
+        self.compression = compression
+        self._level = level
+        self._dictionaries: Dict[int, Any] = {}
+        self._dictionary = None
+        for data in dictionaries:
+            self.add_dictionary(data)
+
+    def add_dictionary(self, data: bytes) -> int:
+        """Register a trained zstd dictionary and write with it from now on, return its id."""
+        import zstandard
+
+        dictionary = zstandard.ZstdCompressionDict(data)
+        dictionary.precompute_compress(level=self._level)
+        self._dictionaries[dictionary.dict_id()] = dictionary
+        self._dictionary = dictionary
+        return dictionary.dict_id()
+
+    def encode(self, content: Mapping[str, Any]) -> bytes:
+        body = encode_body(content)
+        dictionary_id = 0
+        if self.compression == "zstd":
+            import zstandard
+
+            if self._dictionary is not None:
+                dictionary_id = self._dictionary.dict_id()
+                compressor = zstandard.ZstdCompressor(level=self._level, dict_data=self._dictionary)
+            else:
+                compressor = zstandard.ZstdCompressor(level=self._level)
+            body = compressor.compress(body)
+        elif self.compression == "lz4":
+            import lz4.frame
+
+            body = lz4.frame.compress(body)
+        return HEADER.pack(MAGIC, VERSION, CODECS[self.compression], dictionary_id, len(body)) + body
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        magic, version, codec, dictionary_id, size = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a session snapshot.")
+        if version > VERSION:
+            raise ValueError(f"Snapshot version {version} is newer than the supported version {VERSION}.")
+        body = data[HEADER.size:HEADER.size + size]
+        if codec == CODECS["zstd"]:
+            import zstandard
+
+            if dictionary_id and dictionary_id not in self._dictionaries:
+                raise ValueError(f"Snapshot compressed with zstd dictionary {dictionary_id}, which is not loaded.")
+            decompressor = zstandard.ZstdDecompressor(dict_data=self._dictionaries.get(dictionary_id))
+            body = decompressor.decompress(body)
+        elif codec == CODECS["lz4"]:
+            import lz4.frame
+
+            body = lz4.frame.decompress(body)
+        elif codec != CODECS["none"]:
+            raise ValueError(f"Unknown snapshot codec {codec}.")
+        return decode_body(body)
+
+
+def train_dictionary(contents: Iterable[Mapping[str, Any]], size: int = 32 * 1024) -> bytes:
+    """Train a zstd dictionary on the snapshot bodies of typical sessions.
+
+    zstd needs a few dozen samples at least, and far more than `size` bytes of them.
+    """
+    import zstandard
+
+    samples = [encode_body(content) for content in contents]
+    return zstandard.train_dictionary(size, samples).as_bytes()
@@ -0,0 +1,263 @@
+from .base import SessionConflictError, ThreadedPersistence
+from .localfile import fingerprint, user_of
+from typing import Mapping, Any, Dict, List, Optional, Set, Tuple
+import hashlib
+import json
+import time
+from autogen_core.models import (
+    UserMessage,
+)
+from sqlalchemy import (
+    Column,
+    Float,
+    Index,
+    Integer,
+    MetaData,
+    SmallInteger,
+    String,
+    Table,
+    Text,
+    create_engine,
+    delete,
+    event,
+    insert,
+    select,
+    update,
+)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+
+_TEXT, _LIST = 0, 1
+
+metadata = MetaData()
+
+# Session ids, user infos and agent keys embed the user's token, e.g. a JWT, of any length. Rows are
+# keyed on `key_of` them, and the values themselves are kept in Text columns.
+KEY_LENGTH = 64
+
+sessions = Table(
+    "sessions", metadata,
+    Column("session_key", String(KEY_LENGTH), primary_key=True),
+    Column("uuid", Text, nullable=False),
+    # `<user_id>~<user_name>~<user_token>`, what sessions are looked up by.
+    Column("user_key", String(KEY_LENGTH), nullable=False),
+    Column("user_info", Text, nullable=False),
+    # Incremented by every save, a save must name the version it builds on.
+    Column("version", Integer, nullable=False),
+    Column("updated", Float, nullable=False),
+    Index("ix_sessions_user_key_updated", "user_key", "updated"),
+)
+
+agent_states = Table(
+    "agent_states", metadata,
+    Column("session_key", String(KEY_LENGTH), primary_key=True),
+    Column("agent_key", String(KEY_LENGTH), primary_key=True),
+    Column("agent", Text, nullable=False),
+    # The agent's state without `memory.messages`, as JSON.
+    Column("state", Text, nullable=False),
+    # -1 for a state without `memory.messages`, e.g. an assistant's.
+    Column("messages", Integer, nullable=False),
+)
+
+messages = Table(
+    "messages", metadata,
+    Column("session_key", String(KEY_LENGTH), primary_key=True),
+    Column("agent_key", String(KEY_LENGTH), primary_key=True),
+    Column("position", Integer, primary_key=True),
+    Column("source", String(255), nullable=False),
+    # 0 for text, 1 for a JSON list.
+    Column("kind", SmallInteger, nullable=False),
+    Column("content", Text, nullable=False),
+)
+
+
+def key_of(value: str) -> str:
+    """Fixed-length key of a session id, user info or agent key."""
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+class SQLPersistence(ThreadedPersistence):
+    """Session persistence in a SQL database, shared by the replicas of the router.
+
+    Every message is a row, a save inserts the messages added since the previous one in batches
+    of `batch_size`, and rewrites an agent's messages only when the stored ones changed, i.e. its
+    history shrank or no longer ends the stored part with the same message. Sessions carry
+    a version: a save names the version the session was loaded or last saved with, and raises
+    `SessionConflictError` if another replica saved it in between, rather than overwrite its turns.
+    Saves of a session that conflicted are refused until it is loaded again.
+
+    `url` is any SQLAlchemy database URL, e.g. `postgresql+psycopg2://...` in production or
+    `sqlite:///sessions.sqlite3` locally. Connections are pooled, the async methods of
+    `ThreadedPersistence` run the queries in worker threads.
+    """
+
+    def __init__(self, url: str = "sqlite:///sessions.sqlite3", batch_size: int = 500, pool_size: int = 8,
+                 max_overflow: int = 8, engine: Optional[Engine] = None):
+        super().__init__()
+        if engine is None:
+            engine = create_engine(url, pool_size=pool_size, max_overflow=max_overflow, pool_pre_ping=True)
+        self._engine = engine
+        if engine.dialect.name == "sqlite":
+            event.listen(engine, "connect", _configure_sqlite)
+        self._batch_size = batch_size
+        # uuid -> version, and uuid -> agent -> number of messages in the database and the fingerprint of
+        # the last one, None if not known, as of the last load or save.
+        self._versions: Dict[str, int] = {}
+        self._counts: Dict[str, Dict[str, Tuple[int, Optional[str]]]] = {}
+        self._conflicted: Set[str] = set()
+        metadata.create_all(engine)
+
+    def load_content(self, uuid) -> Mapping[str, Any]:
+        session_key = key_of(uuid)
+        with self._engine.connect() as conn:
+            version = conn.execute(select(sessions.c.version).where(sessions.c.session_key == session_key)).scalar()
+            if version is None:
+                self._versions[uuid] = 0
+                self._counts[uuid] = {}
+                self._conflicted.discard(uuid)
+                return None
+            states = conn.execute(select(agent_states.c.agent_key, agent_states.c.agent, agent_states.c.state,
+                                         agent_states.c.messages)
+                                  .where(agent_states.c.session_key == session_key)).all()
+            rows = conn.execute(select(messages.c.agent_key, messages.c.position, messages.c.source,
+                                       messages.c.kind, messages.c.content)
+                                .where(messages.c.session_key == session_key)
+                                .order_by(messages.c.agent_key, messages.c.position)).all()
+
+        content: Dict[str, Any] = {}
+        counts: Dict[str, int] = {}
+        agents: Dict[str, str] = {}
+        for agent_key, agent, state, count in states:
+            value = json.loads(state)
+            if count >= 0:
+                value.setdefault("memory", {})["messages"] = []
+            content[agent] = value
+            counts[agent] = count
+            agents[agent_key] = agent
+        for agent_key, position, source, kind, text in rows:
+            agent = agents.get(agent_key)
+            if agent is not None and position < counts[agent]:
+                content[agent]["memory"]["messages"].append(
+                    UserMessage(content=text if kind == _TEXT else json.loads(text), source=source))
+        self._versions[uuid] = version
+        self._counts[uuid] = {
+            agent: (count, fingerprint(content[agent]["memory"]["messages"], count) if count >= 0 else "")
+            for agent, count in counts.items()}
+        self._conflicted.discard(uuid)
+        return content
+
+    def save_content(self, uuid, content: Mapping[str, Any]) -> None:
+        content = {key: value for key, value in content.items() if value != {}}
+        if not content:
+            return
+        if uuid in self._conflicted:
+            raise SessionConflictError(f"Session {uuid} conflicted with another replica, load it before saving.")
+        try:
+            with self._engine.begin() as conn:
+                version, counts = self._bump_version(conn, uuid)
+                for agent, value in content.items():
+                    counts[agent] = self._save_agent(conn, uuid, agent, value, counts.get(agent))
+        except SessionConflictError:
+            # Never build on a version read after the conflict, that would overwrite the other replica's turns.
+            self._conflicted.add(uuid)
+            self._versions.pop(uuid, None)
+            self._counts.pop(uuid, None)
+            raise
+        # On other errors the transaction rolled back, or, if it committed after all, the next save conflicts.
+        self._versions[uuid] = version
+        self._counts[uuid] = counts
+
+    def _bump_version(self, conn: Connection, uuid) -> tuple:
+        expected = self._versions.get(uuid)
+        counts = dict(self._counts.get(uuid, {}))
+        session_key = key_of(uuid)
+        if expected is None:
+            # Never loaded here, build on whatever the database holds.
+            expected = conn.execute(select(sessions.c.version)
+                                    .where(sessions.c.session_key == session_key)).scalar() or 0
+            # Whether the stored messages still start the histories is not known, they are rewritten.
+            counts = {agent: (count, None) for agent, count in conn.execute(
+                select(agent_states.c.agent, agent_states.c.messages)
+                .where(agent_states.c.session_key == session_key)).all()}
+        now = time.time()
+        if expected == 0:
+            user_info = user_of(uuid)
+            try:
+                conn.execute(insert(sessions).values(session_key=session_key, uuid=uuid, user_key=key_of(user_info),
+                                                     user_info=user_info, version=1, updated=now))
+            except IntegrityError:
+                raise SessionConflictError(f"Session {uuid} was created by another replica.") from None
+        else:
+            result = conn.execute(update(sessions)
+                                  .where(sessions.c.session_key == session_key, sessions.c.version == expected)
+                                  .values(version=expected + 1, updated=now))
+            if result.rowcount != 1:
+                raise SessionConflictError(f"Session {uuid} was saved by another replica since version {expected}.")
+        return expected + 1, counts
+
+    def _save_agent(self, conn: Connection, uuid, agent: str, value: Mapping[str, Any],
+                    stored: Optional[Tuple[int, Optional[str]]]) -> Tuple[int, str]:
+        if "messages" not in value.get("memory", {}):
+            self._save_state(conn, uuid, agent, {"state": json.dumps(value), "messages": -1}, stored)
+            return -1, ""
+        history = value["memory"]["messages"]
+        session_key, agent_key = key_of(uuid), key_of(agent)
+        count, last = stored if stored is not None else (0, "")
+        offset = max(count, 0)
+        if offset > len(history) or fingerprint(history, offset) != last:
+            # The stored messages changed, e.g. the history shrank, rewrite it from the start.
+            offset = 0
+        if stored is not None and offset < count:
+            conn.execute(delete(messages).where(messages.c.session_key == session_key,
+                                                messages.c.agent_key == agent_key, messages.c.position >= offset))
+        rows: List[Dict[str, Any]] = []
+        for position in range(offset, len(history)):
+            message = history[position]
+            text = message.content if isinstance(message.content, str) else json.dumps(message.content)
+            rows.append({"session_key": session_key, "agent_key": agent_key, "position": position, "source": message.source,
+                         "kind": _TEXT if isinstance(message.content, str) else _LIST, "content": text})
+        for start in range(0, len(rows), self._batch_size):
+            conn.execute(insert(messages), rows[start:start + self._batch_size])
+
+        state = {k: v for k, v in value.items() if k != "memory"}
+        state["memory"] = {k: v for k, v in value["memory"].items() if k != "messages"}
+        self._save_state(conn, uuid, agent, {"state": json.dumps(state), "messages": len(history)}, stored)
+        return len(history), fingerprint(history, len(history))
+
+    @staticmethod
+    def _save_state(conn: Connection, uuid, agent: str, values: Dict[str, Any], stored: Optional[tuple]) -> None:
+        session_key, agent_key = key_of(uuid), key_of(agent)
+        if stored is None:
+            conn.execute(insert(agent_states).values(session_key=session_key, agent_key=agent_key, agent=agent,
+                                                     **values))
+        else:
+            conn.execute(update(agent_states)
+                         .where(agent_states.c.session_key == session_key, agent_states.c.agent_key == agent_key)
+                         .values(**values))
+
+    def conflicted(self, uuid) -> bool:
+        return uuid in self._conflicted or super().conflicted(uuid)
+
+    def get_uuid(self, userid) -> str:
+        with self._engine.connect() as conn:
+            return conn.execute(select(sessions.c.uuid).where(sessions.c.user_key == key_of(userid))
+                                .order_by(sessions.c.updated.desc()).limit(1)).scalar()
+
+    async def aget_uuid(self, userid) -> str:
+        # A session still queued for its first write is not in the database yet.
+        for uuid in [*self._pending, *self._writers, *self._unsaved]:
+            if user_of(uuid) == userid:
+                return uuid
+        return await super().aget_uuid(userid)
+
+    def close(self) -> None:
+        self._engine.dispose()
+
+
+def _configure_sqlite(dbapi_connection, connection_record) -> None:
+    # Readers do not block the writer, and a locked database is waited for rather than an error.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
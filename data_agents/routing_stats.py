@@ -0,0 +1,47 @@
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Any, Counter as CounterType, Deque, Dict, List, Tuple
+
+# Decisions made without a call to the LLM selector.
+LOCAL_DECISIONS = ("single_candidate", "cache", "local")
+
+
+def percentiles(values: List[float]) -> Dict[str, Any]:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50_ms": values[len(values) // 2] * 1e3,
+        "p90_ms": values[min(len(values) - 1, int(len(values) * 0.9))] * 1e3,
+        "p99_ms": values[min(len(values) - 1, int(len(values) * 0.99))] * 1e3,
+    }
+
+
+@dataclass
+class RoutingStats:
+    """How the speaker of each round was decided, and how long it took, shared by the managers of an engine."""
+    decisions: CounterType[str] = field(default_factory=Counter)
+    # (decided by, seconds) of the most recent rounds.
+    latencies: Deque[Tuple[str, float]] = field(default_factory=lambda: deque(maxlen=10000))
+
+    def record(self, decided_by: str, seconds: float) -> None:
+        self.decisions[decided_by] += 1
+        self.latencies.append((decided_by, seconds))
+
+    @property
+    def llm_avoided_rate(self) -> float:
+        total = sum(self.decisions.values())
+        return sum(self.decisions[decided_by] for decided_by in LOCAL_DECISIONS) / total if total else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "rounds": sum(self.decisions.values()),
+            "decided_by": dict(self.decisions),
+            "llm_avoided_rate": self.llm_avoided_rate,
+            "latency": percentiles([seconds for _, seconds in self.latencies]),
+            "latency_by_decision": {
+                decided_by: percentiles([seconds for by, seconds in self.latencies if by == decided_by])
+                for decided_by in self.decisions
+            },
+        }
@@ -0,0 +1,34 @@
+"""The parts of `SingleThreadedAgentRuntime` the engine reaches past its public API for.
+
+The runtime can neither hand back nor drop the agent instances of a session, nor forget the
+recipients it resolved for a session's topics. Both live in private fields of the pinned
+autogen-core version, so every access goes through here and the import fails on any other version
+instead of silently touching fields that moved.
+"""
+from importlib.metadata import version
+from typing import Any, Dict, Iterable
+from autogen_core import AgentId, SingleThreadedAgentRuntime
+
+SUPPORTED_AUTOGEN_CORE = "0.4.0.dev10"
+
+_installed = version("autogen-core")
+assert _installed == SUPPORTED_AUTOGEN_CORE, \
+    f"data_agents.runtime_internals supports autogen-core {SUPPORTED_AUTOGEN_CORE}, found {_installed}."
+
+
+def release_agents(runtime: SingleThreadedAgentRuntime, agent_ids: Iterable[AgentId]) -> Dict[AgentId, Any]:
+    """Remove the agent instances from the runtime and return them, None for those never created."""
+    return {agent_id: runtime._instantiated_agents.pop(agent_id, None) for agent_id in agent_ids}
+
+
+def adopt_agents(runtime: SingleThreadedAgentRuntime, agents: Dict[AgentId, Any]) -> None:
+    """Hand instances taken with `release_agents` back to the runtime, which uses them instead of new ones."""
+    runtime._instantiated_agents.update(agents)
+
+
+def forget_topics(runtime: SingleThreadedAgentRuntime, source: str) -> None:
+    """Drop the recipients the runtime resolved for the topics of `source`, rebuilt on their next publish."""
+    subscriptions = runtime._subscription_manager
+    for topic in [topic for topic in subscriptions._seen_topics if topic.source == source]:
+        subscriptions._seen_topics.discard(topic)
+        subscriptions._subscribed_recipients.pop(topic, None)
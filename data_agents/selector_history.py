@@ -0,0 +1,124 @@
+from collections import deque
+from typing import Deque, List, Optional, Sequence, Tuple
+from autogen_core.models import (
+    UserMessage,
+)
+from data_agents.utils.utils import count_tokens
+
+
+def render_message(message: UserMessage) -> str:
+    if isinstance(message.content, str):
+        return f"{message.source}: {message.content}"
+    line: List[str] = [item for item in message.content if isinstance(item, str)]
+    return f"{message.source}: {', '.join(line)}"
+
+
+class SelectorHistory:
+    """Incrementally rendered transcript for the selector prompt.
+
+    Every message is rendered and its tokens counted once, when it arrives. With a `token_budget`
+    the newest messages are kept verbatim within the budget; older ones leave the window and wait
+    until `summary_refresh_every` of them can be folded into the rolling summary at once.
+    """
+
+    def __init__(self, token_budget: int | None = None, summary_refresh_every: int = 10) -> None:
+        self._token_budget = token_budget
+        self._summary_refresh_every = summary_refresh_every
+        self._window: Deque[Tuple[str, int]] = deque()
+        self._window_tokens = 0
+        self._pending: List[str] = []
+        # Older messages `load` left out of the window, rendered only when the summary needs them.
+        self._unloaded: Optional[Tuple[Sequence[UserMessage], int, int]] = None
+        self._rendered: Tuple[str, str] | None = None
+        self.summary = ""
+        self._summary_tokens = 0
+        # Number of messages covered by the summary.
+        self.folded = 0
+
+    def append(self, message: UserMessage) -> None:
+        line = render_message(message)
+        tokens = count_tokens(line)
+        self._window.append((line, tokens))
+        self._window_tokens += tokens
+        self._fit()
+        self._rendered = None
+
+    def _fit(self) -> None:
+        if self._token_budget is None:
+            return
+        # The latest message is the question, it always stays.
+        while len(self._window) > 1 and self._window_tokens + self._summary_tokens > self._token_budget:
+            line, tokens = self._window.popleft()
+            self._window_tokens -= tokens
+            self._pending.append(line)
+
+    @property
+    def _pending_count(self) -> int:
+        if self._unloaded is None:
+            return len(self._pending)
+        _, start, stop = self._unloaded
+        return stop - start + len(self._pending)
+
+    @property
+    def needs_summary(self) -> bool:
+        return self._pending_count >= self._summary_refresh_every
+
+    @property
+    def pending(self) -> Sequence[str]:
+        if self._unloaded is not None:
+            messages, start, stop = self._unloaded
+            self._pending[:0] = [render_message(messages[index]) for index in range(start, stop)]
+            self._unloaded = None
+        return self._pending
+
+    def set_summary(self, summary: str) -> None:
+        """Replace the summary by one that also covers the pending messages."""
+        self.folded += self._pending_count
+        self._pending = []
+        self._unloaded = None
+        self.summary = summary
+        self._summary_tokens = count_tokens(summary)
+        self._fit()
+        self._rendered = None
+
+    def load(self, messages: Sequence[UserMessage], summary: str = "", folded: int = 0) -> None:
+        """Start from a saved history, of which the first `folded` messages are covered by `summary`.
+
+        Only the newest messages that fit the budget are read, from the newest backwards, so the
+        older ones of a lazily decoded snapshot stay encoded.
+        """
+        self.summary = summary
+        self._summary_tokens = count_tokens(summary)
+        self.folded = folded
+        self._window.clear()
+        self._window_tokens = 0
+        self._pending = []
+        self._rendered = None
+        index = len(messages)
+        while index > folded:
+            line = render_message(messages[index - 1])
+            tokens = count_tokens(line)
+            # The latest message is the question, it always stays.
+            if self._window and self._token_budget is not None and \
+                    self._window_tokens + tokens + self._summary_tokens > self._token_budget:
+                break
+            self._window.appendleft((line, tokens))
+            self._window_tokens += tokens
+            index -= 1
+        self._unloaded = (messages, folded, index) if index > folded else None
+
+    def render(self) -> Tuple[str, str]:
+        """Return the history and the latest message."""
+        if self._rendered is None:
+            lines: List[str] = []
+            if self.summary:
+                lines.append(f"(summary of earlier conversation) {self.summary}")
+            if self._pending_count:
+                lines.append(f"({self._pending_count} earlier messages omitted)")
+            window = [line for line, _ in self._window]
+            self._rendered = ("\n".join(lines + window[:-1]), window[-1] if window else "")
+        return self._rendered
+
+    @property
+    def tokens(self) -> int:
+        return self._summary_tokens + self._window_tokens
@@ -0,0 +1,65 @@
+import re
+from typing import Iterable, List, Optional
+
+PUBLIC_LABEL = "label: public"
+
+# Shapes of PI and enterprise sensitive values.
+DEFAULT_PATTERNS = {
+    "employee_id": r"\b(?:employee|staff|emp)[\s_-]*(?:(?:id|no\.?|number)\s*[:=#]?\s*)?[A-Za-z]*\d+",
+    "id_assignment": r"\bid\s*[:=]\s*\d+",
+    "salary_amount": r"\bsalary\s*[:=]?\s*[$€£¥]?\s*\d",
+    "currency_amount": r"[$€£¥]\s?\d[\d,]*(?:\.\d+)?",
+    "email": r"\b[\w.+-]+@[\w-]+\.[\w.-]+\b",
+    "phone": r"(?<!\d)(?:\+?\d{1,3}[\s-])?(?:\(\d{2,4}\)|\d{2,4})[\s-]\d{3,4}[\s-]\d{3,4}(?!\d)",
+    "national_id": r"(?<!\d)(?:\d{3}-\d{2}-\d{4}|\d{17}[\dXx])(?!\d)",
+    "name_assignment": r"\bname\s*[:=]\s*['\"]?[A-Za-z]",
+}
+
+# Words that only show up when employee data is discussed.
+DEFAULT_KEYWORDS = [
+    "salary", "salaries", "payroll", "bonus", "compensation", "marital", "home address",
+    "date of birth", "birthday", "social security", "passport", "bank account", "medical record",
+    "performance review", "disciplinary", "employee info", "employee information", "employee id",
+    "analysisres",
+]
+
+
+def is_public(description: str) -> bool:
+    return description.strip().endswith(PUBLIC_LABEL)
+
+
+def label_of(description: str) -> str:
+    return "public" if is_public(description) else "on-premise"
+
+
+class SensitivityDetector:
+    """Local detector of PI or enterprise sensitive data in chat messages.
+
+    Patterns are compiled once, keywords (and known names, e.g. from the employee directory)
+    are matched by a single compiled alternation, so a message is scanned in one pass per automaton.
+    """
+
+    def __init__(
+        self,
+        patterns: Optional[dict] = None,
+        keywords: Optional[Iterable[str]] = None,
+        names: Iterable[str] = (),
+    ) -> None:
+        patterns = DEFAULT_PATTERNS if patterns is None else patterns
+        self._patterns = [(label, re.compile(pattern, re.IGNORECASE)) for label, pattern in patterns.items()]
+        words: List[str] = list(DEFAULT_KEYWORDS if keywords is None else keywords) + list(names)
+        # Longest first, so the alternation prefers the longest keyword at a position.
+        words = sorted({word.lower() for word in words if word}, key=len, reverse=True)
+        self._keywords = re.compile(r"\b(?:" + "|".join(re.escape(word) for word in words) + r")\b",
+                                    re.IGNORECASE) if words else None
+
+    def detect(self, text: str) -> str | None:
+        """Return what was found in `text`, None if nothing sensitive was found."""
+        if self._keywords is not None:
+            match = self._keywords.search(text)
+            if match:
+                return f"keyword: {match.group(0).lower()}"
+        for label, pattern in self._patterns:
+            if pattern.search(text):
+                return label
+        return None
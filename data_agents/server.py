@@ -0,0 +1,325 @@
+"""HTTP front end running many `run_stream` sessions on one event loop.
+
+    POST /sessions                  start a conversation, its messages are streamed back as server-sent events
+    POST /sessions/{id}/input       answer the user's turn of a conversation, or resume a suspended one
+    POST /sessions/prefetch         the user is back, start loading their session ahead of their message
+    DELETE /sessions/{id}           cancel a conversation
+    GET /stats                      admission, routing, cache, session cache, completion cache, endpoint pool,
+                                    speculation, twin choice and timeout counters
+
+The events of a conversation are `session` (its id), `chunk` (streamed part of an answer),
+`discard` (drop the chunks of `source` received so far, its answer is streamed again), `message`,
+`input` (the user's turn, answer it with POST /sessions/{id}/input) and `terminate`.
+
+With `--suspend` the stream of a conversation ends at its `input` event, and the conversation
+holds no resources until the user answers: POST /sessions/{id}/input then resumes it from its
+saved state and returns the events that follow as a new stream.
+
+With `--resident-sessions` the most recently used conversations stay in memory between their
+streams and continue without loading their saved state, the others hibernate in it.
+
+Run with:
+
+    python -m data_agents.server --port 8000
+"""
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Dict, Optional
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import uuid
+from autogen_core import CancellationToken
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from data_agents import telemetry
+from data_agents.cache import TTLCache
+from data_agents.deadline import StageTimeouts
+from data_agents.engine import RouterConfig, RouterEngine, create_default_intent_router
+from data_agents.messages import InputRequest, StreamChunk, TerminateMessage
+from data_agents.session_cache import SessionCache
+from data_agents.models.cached_client import CompletionCache
+from data_agents.models.pool import pools_from_config
+from data_agents.models.scripted_client import ScriptedChatCompletionClient, router_rules
+
+logger = logging.getLogger(__name__)
+
+
+class UserInfo(BaseModel):
+    user_id: str
+    user_name: str
+    user_token: str = ""
+
+
+class ChatRequest(UserInfo):
+    task: str
+
+
+class UserInput(BaseModel):
+    content: str
+
+
+def sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@dataclass
+class Conversation:
+    """A conversation served over HTTP, the user's turns are read from `inbox`."""
+    conversation_id: str
+    cancellation_token: CancellationToken = field(default_factory=CancellationToken)
+    inbox: asyncio.Queue[str] = field(default_factory=asyncio.Queue)
+
+    async def input_func(self, prompt: str = "", cancellation_token: Optional[CancellationToken] = None) -> str:
+        content = asyncio.ensure_future(self.inbox.get())
+        self.cancellation_token.link_future(content)
+        return await content
+
+
+class EventStreamResponse(StreamingResponse):
+    """Closes its event stream however the response ends, a client that went away cancels the conversation."""
+
+    def __init__(self, content: AsyncGenerator[str, None], on_close: Any) -> None:
+        super().__init__(content, media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+        self._on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            self._on_close()
+
+
+class RouterServer:
+    """Admission and per-conversation plumbing between HTTP clients and a shared `RouterEngine`."""
+
+    def __init__(self, engine: RouterEngine | None = None, max_sessions: int = 64,
+                 keepalive_interval: float = 15.0, suspended_ttl: float = 24 * 3600) -> None:
+        self.engine = engine or RouterEngine(config=RouterConfig(streaming=True, output_queue_size=64))
+        self.max_sessions = max_sessions
+        # Idle streams send a comment this often, writing is how a dropped client is noticed.
+        self.keepalive_interval = keepalive_interval
+        self.conversations: Dict[str, Conversation] = {}
+        # Requests of the conversations suspended at the user's turn, by conversation id, until the reply.
+        self.suspended = TTLCache(maxsize=1 << 20, ttl=suspended_ttl)
+        self.admitted = 0
+        self.rejected = 0
+
+    def admit(self, conversation_id: str | None = None) -> Conversation:
+        if len(self.conversations) >= self.max_sessions:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Too many concurrent sessions.",
+                                headers={"Retry-After": "1"})
+        conversation = Conversation(conversation_id=conversation_id or uuid.uuid4().hex)
+        self.conversations[conversation.conversation_id] = conversation
+        self.admitted += 1
+        return conversation
+
+    def release(self, conversation: Conversation) -> None:
+        conversation.cancellation_token.cancel()
+        self.conversations.pop(conversation.conversation_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "active": len(self.conversations),
+            "suspended": len(self.suspended),
+            "max_sessions": self.max_sessions,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+    async def events(self, conversation: Conversation, request: ChatRequest) -> AsyncGenerator[str, None]:
+        yield sse("session", {"conversation_id": conversation.conversation_id})
+
+        stream = self.engine.run_stream(
+            user_id=request.user_id,
+            user_name=request.user_name,
+            user_token=request.user_token,
+            task=request.task,
+            cancellation_token=conversation.cancellation_token,
+            input_func=conversation.input_func,
+        )
+        next_message = asyncio.ensure_future(stream.__anext__())
+        message = None
+        try:
+            while True:
+                done, _ = await asyncio.wait({next_message}, timeout=self.keepalive_interval)
+                if not done:
+                    yield ": keep-alive\n\n"
+                    continue
+                if next_message.cancelled():
+                    break
+                try:
+                    message = next_message.result()
+                except StopAsyncIteration:
+                    # Without a termination the session was suspended at the user's turn.
+                    if isinstance(message, InputRequest):
+                        self.suspended.put(conversation.conversation_id, request)
+                    break
+                if isinstance(message, StreamChunk):
+                    if message.restart:
+                        yield sse("discard", {"source": message.source})
+                    yield sse("chunk", {"source": message.source, "content": message.content, "index": message.index})
+                elif isinstance(message, InputRequest):
+                    yield sse("input", {"prompt": message.prompt})
+                elif isinstance(message, TerminateMessage):
+                    yield sse("terminate", {"content": message.content})
+                else:
+                    yield sse("message", {"source": message.source, "content": message.content})
+                next_message = asyncio.ensure_future(stream.__anext__())
+        finally:
+            conversation.cancellation_token.cancel()
+            # Cancelling the pending step runs the stream's cleanup, which closes the engine session.
+            next_message.cancel()
+            with contextlib.suppress(asyncio.CancelledError, StopAsyncIteration):
+                await next_message
+            await stream.aclose()
+
+
+def create_app(server: RouterServer | None = None) -> FastAPI:
+    server = server or RouterServer()
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await server.engine.start()
+        yield
+        await server.engine.stop()
+
+    app = FastAPI(title="llm-router", lifespan=lifespan)
+    app.state.server = server
+
+    @app.post("/sessions")
+    async def start_session(request: ChatRequest) -> StreamingResponse:
+        conversation = server.admit()
+        return EventStreamResponse(server.events(conversation, request),
+                                   on_close=lambda: server.release(conversation))
+
+    @app.post("/sessions/{conversation_id}/input", status_code=202)
+    async def send_input(conversation_id: str, user_input: UserInput) -> Dict[str, str]:
+        conversation = server.conversations.get(conversation_id)
+        if conversation is not None:
+            conversation.inbox.put_nowait(user_input.content)
+            return {"conversation_id": conversation_id}
+        request = server.suspended.get(conversation_id)
+        if request is None:
+            raise HTTPException(status_code=404, detail="Unknown session.")
+        conversation = server.admit(conversation_id)
+        server.suspended.pop(conversation_id)
+        return EventStreamResponse(server.events(conversation, request.model_copy(update={"task": user_input.content})),
+                                   on_close=lambda: server.release(conversation))
+
+    @app.post("/sessions/prefetch", status_code=202)
+    async def prefetch_session(user: UserInfo) -> Dict[str, str]:
+        await server.engine.prefetch(user.user_id, user.user_name, user.user_token)
+        return {"user_id": user.user_id}
+
+    @app.delete("/sessions/{conversation_id}", status_code=202)
+    async def cancel_session(conversation_id: str) -> Dict[str, str]:
+        conversation = server.conversations.get(conversation_id)
+        if conversation is None:
+            raise HTTPException(status_code=404, detail="Unknown session.")
+        conversation.cancellation_token.cancel()
+        return {"conversation_id": conversation_id}
+
+    @app.get("/stats")
+    async def stats() -> Dict[str, Any]:
+        speculation = server.engine.speculation_stats
+        twins = server.engine.twin_balancer
+        session_cache = server.engine.session_cache
+        routing_cache = server.engine.routing_cache
+        completion_cache = server.engine.completion_cache
+        intent_router = server.engine.intent_router
+        return {"sessions": server.stats(), "routing": server.engine.routing_stats.as_dict(),
+                "intent_router": intent_router.stats.as_dict() if intent_router is not None else None,
+                "routing_cache": routing_cache.stats() if routing_cache is not None else None,
+                "session_cache": session_cache.stats() if session_cache is not None else None,
+                "completion_cache": completion_cache.stats() if completion_cache is not None else None,
+                "tools": server.engine.tool_stats(),
+                "tool_loop": server.engine.tool_loop_stats.as_dict(), "pools": server.engine.pool_stats(),
+                "speculation": speculation.as_dict() if speculation else None,
+                "twins": twins.stats.as_dict() if twins else None,
+                "timeouts": server.engine.timeout_stats.as_dict()}
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the router over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-sessions", type=int, default=64)
+    parser.add_argument("--queue-size", type=int, default=64,
+                        help="Messages buffered per session for a slow client.")
+    parser.add_argument("--endpoints", help="JSON file of the endpoint pools per label, see `pools_from_config`.")
+    parser.add_argument("--model", choices=["azure", "scripted"], default="azure",
+                        help="'scripted' answers locally with a deterministic stand-in, for load tests.")
+    parser.add_argument("--scripted-latency", type=float, default=0.05,
+                        help="Seconds to the first token of the scripted model.")
+    parser.add_argument("--database",
+                        help="SQLAlchemy URL of a database the sessions are kept in, shared by the replicas of the router, "
+                             "sessions are kept in local files otherwise.")
+    parser.add_argument("--suspend", action="store_true",
+                        help="Save and release conversations while they wait for the user, see the module doc.")
+    parser.add_argument("--resident-sessions", type=int, default=0,
+                        help="Conversations kept in memory between their streams, 0 loads every one from its saved state.")
+    parser.add_argument("--resident-mb", type=float,
+                        help="Estimated memory the resident conversations may take, in MiB.")
+    parser.add_argument("--local-routing", action="store_true",
+                        help="Route the users' messages that clearly match one participant without the selector call.")
+    parser.add_argument("--routing-margin", type=float, default=0.15,
+                        help="Lead in cosine similarity the best participant needs over the next to be routed locally.")
+    parser.add_argument("--routing-cache-ttl", type=float,
+                        help="Cache speaker decisions for this many seconds, shared by the sessions.")
+    parser.add_argument("--completion-cache-ttl", type=float,
+                        help="Cache the assistants' answers for this many seconds, per deployment label, "
+                             "on-premise answers only within their session.")
+    parser.add_argument("--routing-timeout", type=float, default=60.0, help="Seconds a speaker selection may take.")
+    parser.add_argument("--turn-timeout", type=float, default=300.0,
+                        help="Seconds an assistant's answer may take before it is retried on the on-premise deployment.")
+    parser.add_argument("--input-timeout", type=float, help="Seconds the user may take to answer their turn.")
+    parser.add_argument("--session-timeout", type=float,
+                        help="Seconds a conversation's stream may take before it terminates.")
+    parser.add_argument("--telemetry", choices=["none", "console", "otlp"], default="none",
+                        help="Export OpenTelemetry spans and metrics, 'otlp' reads the standard OTEL_* variables.")
+    args = parser.parse_args()
+    if args.telemetry != "none":
+        telemetry.configure(args.telemetry)
+    model_client = None
+    model_clients = None
+    if args.endpoints:
+        with open(args.endpoints, encoding="utf-8") as f:
+            model_clients = pools_from_config(json.load(f))
+    elif args.model == "scripted":
+        model_client = ScriptedChatCompletionClient(rules=router_rules(), default="Employees get 10 days of annual leave.",
+                                                    latency=args.scripted_latency)
+    persistence = None
+    if args.database:
+        from data_agents.persistence.sql import SQLPersistence
+
+        persistence = SQLPersistence(args.database)
+    engine = RouterEngine(model_client=model_client, model_clients=model_clients, persistence=persistence,
+                          session_cache=SessionCache(
+                              maxsize=args.resident_sessions,
+                              max_bytes=int(args.resident_mb * 1024 * 1024) if args.resident_mb else None,
+                          ) if args.resident_sessions else None,
+                          routing_cache=TTLCache(maxsize=1024, ttl=args.routing_cache_ttl)
+                          if args.routing_cache_ttl else None,
+                          completion_cache=CompletionCache(ttl=args.completion_cache_ttl)
+                          if args.completion_cache_ttl else None,
+                          intent_router=create_default_intent_router(margin=args.routing_margin)
+                          if args.local_routing else None,
+                          config=RouterConfig(
+                              streaming=True, output_queue_size=args.queue_size, suspend_at_user_turn=args.suspend,
+                              stage_timeouts=StageTimeouts(routing=args.routing_timeout, turn=args.turn_timeout,
+                                                           user_input=args.input_timeout,
+                                                           session=args.session_timeout)))
+    uvicorn.run(create_app(RouterServer(engine, max_sessions=args.max_sessions)), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Dict, Mapping, Optional
+import asyncio
+from autogen_core import AgentId
+from data_agents.cache import TTLCache
+from data_agents.transcript import Transcript
+
+# Agent instances, their histories and the runtime's bookkeeping of a resident session, and the
+# per-message objects around a message's content, measured with `benchmarks.bench_memory --resident`.
+SESSION_OVERHEAD_BYTES = 22 * 1024
+MESSAGE_OVERHEAD_BYTES = 1280
+
+
+@dataclass
+class ResidentSession:
+    """Agents and transcript of a closed session, kept for its next `run_stream`."""
+    agents: Dict[AgentId, Any]
+    transcript: Transcript
+    nbytes: int
+
+
+def estimate_bytes(transcript: Transcript) -> int:
+    return SESSION_OVERHEAD_BYTES + MESSAGE_OVERHEAD_BYTES * len(transcript) + transcript.nbytes
+
+
+class SessionCache:
+    """Bounded LRU of the sessions kept resident between their `run_stream`s.
+
+    A session is checkpointed through the persistence backend whenever it closes, so evicting it
+    only releases its agents: it hibernates in its checkpoint and the next `run_stream` of the user
+    loads it from there. A resident session skips that load and the agents' `load_state`.
+
+    At most `maxsize` sessions, and if given `max_bytes` of their estimated size, are resident.
+    `prefetch` starts loading a hibernated session ahead of its next message, the load is kept
+    for `prefetch_ttl` seconds. Resident sessions are per process, a deployment with many replicas
+    sharing a database should route the messages of a user to the same replica.
+    """
+
+    def __init__(self, maxsize: int = 1024, max_bytes: Optional[int] = None, prefetch_ttl: float = 60.0) -> None:
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        # session id -> resident session, least recently used first.
+        self._sessions: "OrderedDict[str, ResidentSession]" = OrderedDict()
+        self._prefetched = TTLCache(maxsize=maxsize, ttl=prefetch_ttl)
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.prefetches = 0
+        self.prefetch_hits = 0
+
+    def take(self, session_id: str) -> Optional[ResidentSession]:
+        """Remove and return the resident session being opened, if any."""
+        resident = self._sessions.pop(session_id, None)
+        if resident is None:
+            self.misses += 1
+            return None
+        self.resident_bytes -= resident.nbytes
+        self.hits += 1
+        return resident
+
+    def put(self, session_id: str, resident: ResidentSession) -> None:
+        self.pop(session_id)
+        self._sessions[session_id] = resident
+        self.resident_bytes += resident.nbytes
+        while self._sessions and (len(self._sessions) > self.maxsize or
+                                  (self.max_bytes is not None and self.resident_bytes > self.max_bytes)):
+            _, evicted = self._sessions.popitem(last=False)
+            self.resident_bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def pop(self, session_id: str) -> None:
+        """Forget the session, e.g. once it changed since it was resident or prefetched."""
+        resident = self._sessions.pop(session_id, None)
+        if resident is not None:
+            self.resident_bytes -= resident.nbytes
+        self._prefetched.pop(session_id)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def prefetch(self, session_id: str, load: Awaitable[Optional[Mapping[str, Any]]]) -> None:
+        task = asyncio.ensure_future(load)
+        # Retrieved here if nobody opens the session, a failed prefetch is loaded again on open.
+        task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        self._prefetched.put(session_id, task)
+        self.prefetches += 1
+
+    def take_prefetched(self, session_id: str) -> Optional["asyncio.Future[Optional[Mapping[str, Any]]]"]:
+        task = self._prefetched.get(session_id)
+        if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+            return None
+        self._prefetched.pop(session_id)
+        self.prefetch_hits += 1
+        return task
+
+    def is_prefetching(self, session_id: str) -> bool:
+        return self._prefetched.get(session_id) is not None
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._sessions),
+            "resident_bytes": self.resident_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+            "prefetches": self.prefetches,
+            "prefetch_hits": self.prefetch_hits,
+        }
@@ -0,0 +1,32 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict
+import statistics
+
+
+@dataclass
+class SpeculationStats:
+    """Outcome of speculative turns, shared by the manager that starts them and the agents that run them."""
+    attempts: int = 0
+    hits: int = 0
+    misses: int = 0
+    # Seconds of each confirmed turn that overlapped with the selector call.
+    saved: Deque[float] = field(default_factory=lambda: deque(maxlen=1000))
+    # Seconds spent on turns that were cancelled.
+    discarded: Deque[float] = field(default_factory=lambda: deque(maxlen=1000))
+
+    @property
+    def hit_rate(self) -> float:
+        decided = self.hits + self.misses
+        return self.hits / decided if decided else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "attempts": self.attempts,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "saved_ms_total": sum(self.saved) * 1e3,
+            "saved_ms_p50": statistics.median(self.saved) * 1e3 if self.saved else None,
+            "discarded_ms_total": sum(self.discarded) * 1e3,
+        }
@@ -0,0 +1,213 @@
+"""OpenTelemetry spans and histograms of the routing pipeline.
+
+Instrumentation goes through the OpenTelemetry API and costs next to nothing until a provider is
+installed, with `configure` for local runs and tests or by the application for production.
+
+Spans, each with a `data_agents.<stage>.duration` histogram in seconds:
+
+    session         open_session to close_session
+    round           a user message to the next request for user input
+    routing         a speaker decision of the group chat manager
+    turn            an assistant's answer, tool loop included
+    model           one model call, with its token usage
+    tool            one tool call
+    user_input      wait for the user's input
+    persistence     load, save and lookup of session state
+
+Every span carries the `session_id` and, once known, the selected `topic_type`. Rounds and
+sessions span many message handlers, they are parented through a registry keyed by session id.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Literal, Mapping, Optional
+import time
+from opentelemetry import context as otel_context
+from opentelemetry import metrics, trace
+from opentelemetry.trace import Span
+
+STAGES = ("session", "round", "routing", "turn", "model", "tool", "user_input", "persistence")
+# Histograms are broken down by these, session ids would make their cardinality unbounded.
+HISTOGRAM_ATTRIBUTES = ("topic_type", "operation", "tool", "outcome")
+
+tracer = trace.get_tracer("data_agents")
+meter = metrics.get_meter("data_agents")
+histograms = {
+    stage: meter.create_histogram(f"data_agents.{stage}.duration", unit="s", description=f"Duration of {stage} spans.")
+    for stage in STAGES
+}
+model_tokens = meter.create_counter("data_agents.model.tokens", unit="{token}",
+                                    description="Tokens of model calls, by type (prompt or completion).")
+
+# Attributes inherited by the spans started below the current one, e.g. the session of a model call.
+_attributes: ContextVar[Mapping[str, Any]] = ContextVar("data_agents_telemetry_attributes", default={})
+
+
+@dataclass
+class _SessionTrace:
+    span: Span
+    started: float
+    attributes: Dict[str, Any]
+    round_span: Optional[Span] = None
+    round_started: float = 0.0
+    rounds: int = 0
+
+    @property
+    def context(self) -> otel_context.Context:
+        return trace.set_span_in_context(self.round_span or self.span)
+
+
+_sessions: Dict[str, _SessionTrace] = {}
+
+
+def _record(stage: str, started: float, attributes: Mapping[str, Any]) -> None:
+    histograms[stage].record(time.perf_counter() - started, {
+        key: value for key, value in attributes.items() if key in HISTOGRAM_ATTRIBUTES})
+
+
+def _end(span: Span, stage: str, started: float, attributes: Mapping[str, Any]) -> None:
+    _record(stage, started, attributes)
+    span.end()
+
+
+def start_session(session_id: str, **attributes: Any) -> None:
+    attributes = {"session_id": session_id, **attributes}
+    span = tracer.start_span("session", attributes=attributes)
+    _sessions[session_id] = _SessionTrace(span=span, started=time.perf_counter(), attributes=attributes)
+
+
+def end_session(session_id: str, **attributes: Any) -> None:
+    session = _sessions.pop(session_id, None)
+    if session is None:
+        return
+    _end_round(session, outcome="closed")
+    session.span.set_attributes({**attributes, "rounds": session.rounds})
+    _end(session.span, "session", session.started, session.attributes)
+
+
+def start_round(session_id: str, **attributes: Any) -> None:
+    session = _sessions.get(session_id)
+    if session is None:
+        return
+    _end_round(session, outcome="superseded")
+    session.rounds += 1
+    session.round_span = tracer.start_span(
+        "round", context=trace.set_span_in_context(session.span),
+        attributes={"session_id": session_id, "round": session.rounds, **attributes})
+    session.round_started = time.perf_counter()
+
+
+def end_round(session_id: str, **attributes: Any) -> None:
+    session = _sessions.get(session_id)
+    if session is not None:
+        _end_round(session, **attributes)
+
+
+def _end_round(session: _SessionTrace, **attributes: Any) -> None:
+    if session.round_span is None:
+        return
+    span, session.round_span = session.round_span, None
+    span.set_attributes(attributes)
+    _end(span, "round", session.round_started, {**session.attributes, **attributes})
+
+
+def set_round_attributes(session_id: str, **attributes: Any) -> None:
+    session = _sessions.get(session_id)
+    if session is not None and session.round_span is not None:
+        session.round_span.set_attributes(attributes)
+
+
+def annotate(**attributes: Any) -> None:
+    """Set attributes on the current span, e.g. the outcome of a stage."""
+    trace.get_current_span().set_attributes(attributes)
+
+
+@contextmanager
+def stage(name: str, session_id: Optional[str] = None, **attributes: Any) -> Iterator[Span]:
+    """Span and histogram of one stage, nested spans and histograms inherit its attributes.
+
+    With a `session_id` the span is parented to the session's open round, or the session itself,
+    otherwise to the current span.
+    """
+    inherited = dict(_attributes.get())
+    if session_id is not None:
+        inherited["session_id"] = session_id
+    inherited.update(attributes)
+    session = _sessions.get(session_id) if session_id is not None else None
+    parent = session.context if session is not None else None
+    started = time.perf_counter()
+    token = _attributes.set(inherited)
+    try:
+        with tracer.start_as_current_span(name, context=parent, attributes=inherited,
+                                          record_exception=True, set_status_on_exception=True) as span:
+            try:
+                yield span
+            finally:
+                # Attributes set on the span while it ran, e.g. the selected topic type, tag the histogram too.
+                recorded = getattr(span, "attributes", None) or {}
+                _record(name, started, {**inherited, **recorded})
+    finally:
+        try:
+            _attributes.reset(token)
+        except ValueError:
+            # A streaming generator finalized from another context, that context never saw the set.
+            pass
+
+
+@dataclass
+class TelemetrySetup:
+    """Providers installed by `configure`, the in-memory exporter and reader are set for "memory"."""
+    tracer_provider: Any
+    meter_provider: Any
+    span_exporter: Any = None
+    metric_reader: Any = None
+
+    def shutdown(self) -> None:
+        self.tracer_provider.shutdown()
+        self.meter_provider.shutdown()
+
+
+def configure(exporter: Literal["console", "memory", "otlp"] = "console", service_name: str = "llm-router",
+              export_interval: float = 10.0) -> TelemetrySetup:
+    """Install global SDK providers exporting to the console, to memory (tests) or over OTLP.
+
+    OpenTelemetry accepts global providers once per process, configure at startup.
+    """
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.metrics.export import (
+        ConsoleMetricExporter,
+        InMemoryMetricReader,
+        PeriodicExportingMetricReader,
+    )
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    resource = Resource.create({"service.name": service_name})
+    tracer_provider = TracerProvider(resource=resource)
+    if exporter == "memory":
+        span_exporter = InMemorySpanExporter()
+        tracer_provider.add_span_processor(SimpleSpanProcessor(span_exporter))
+        metric_reader = InMemoryMetricReader()
+    elif exporter == "console":
+        span_exporter = ConsoleSpanExporter()
+        tracer_provider.add_span_processor(BatchSpanProcessor(span_exporter))
+        metric_reader = PeriodicExportingMetricReader(ConsoleMetricExporter(),
+                                                      export_interval_millis=export_interval * 1e3)
+    elif exporter == "otlp":
+        from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+
+        span_exporter = OTLPSpanExporter()
+        tracer_provider.add_span_processor(BatchSpanProcessor(span_exporter))
+        metric_reader = PeriodicExportingMetricReader(OTLPMetricExporter(),
+                                                      export_interval_millis=export_interval * 1e3)
+    else:
+        raise ValueError(f"Unknown exporter {exporter!r}.")
+    meter_provider = MeterProvider(resource=resource, metric_readers=[metric_reader])
+    trace.set_tracer_provider(tracer_provider)
+    metrics.set_meter_provider(meter_provider)
+    return TelemetrySetup(tracer_provider=tracer_provider, meter_provider=meter_provider,
+                          span_exporter=span_exporter if exporter == "memory" else None,
+                          metric_reader=metric_reader if exporter == "memory" else None)
@@ -0,0 +1,186 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+import asyncio
+import contextlib
+import statistics
+import time
+from autogen_core import AgentId, BaseAgent, CancellationToken, FunctionCall
+from autogen_core.models import (
+    AssistantMessage,
+    ChatCompletionClient,
+    CreateResult,
+    FunctionExecutionResult,
+    FunctionExecutionResultMessage,
+    LLMMessage,
+)
+from autogen_core.tools import ToolSchema
+from autogen_core.tool_agent import ToolException
+from data_agents import telemetry
+from data_agents.deadline import StageTimeoutError, TimeoutStats, linked_token, time_left
+
+
+async def complete(
+    model_client: ChatCompletionClient,
+    messages: List[LLMMessage],
+    tool_schema: List[ToolSchema],
+    cancellation_token: Optional[CancellationToken] = None,
+    on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
+) -> CreateResult:
+    """One model call, streamed through `on_chunk` when it is given."""
+    if on_chunk is None:
+        return await model_client.create(messages, tools=tool_schema, cancellation_token=cancellation_token)
+    result: CreateResult | None = None
+    async for item in model_client.create_stream(messages, tools=tool_schema, cancellation_token=cancellation_token):
+        if isinstance(item, str):
+            await on_chunk(item)
+        else:
+            result = item
+    assert result is not None
+    return result
+
+
+@dataclass
+class ToolLoopPolicy:
+    """Limits of an assistant's tool loop.
+
+    - `max_concurrency`: tool calls an agent runs at once, across its turns.
+    - `call_timeout`: seconds a tool call may take once started, the model gets an error result after that,
+      cut to the deadline of the turn's cancellation token.
+    - `max_iterations`: rounds of tool calls per turn, the model then has to answer without tools.
+    """
+    max_concurrency: int = 4
+    call_timeout: Optional[float] = 30.0
+    max_iterations: int = 5
+
+
+@dataclass
+class ToolLoopStats:
+    """Tool use of assistants' turns, shared by the assistants of an engine."""
+    turns: int = 0
+    calls: int = 0
+    timeouts: int = 0
+    # Turns cut short by `max_iterations`.
+    truncated: int = 0
+    # Tool calls per turn, and per iteration for the widest iteration of a turn.
+    calls_per_turn: Deque[int] = field(default_factory=lambda: deque(maxlen=1000))
+    fan_out: Deque[int] = field(default_factory=lambda: deque(maxlen=1000))
+    # Seconds a turn spent waiting on tools.
+    wall_time: Deque[float] = field(default_factory=lambda: deque(maxlen=1000))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "turns": self.turns,
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "truncated": self.truncated,
+            "max_fan_out": max(self.fan_out, default=0),
+            "mean_calls_per_turn": statistics.mean(self.calls_per_turn) if self.calls_per_turn else None,
+            "wall_ms_p50": statistics.median(self.wall_time) * 1e3 if self.wall_time else None,
+        }
+
+
+async def tool_agent_caller_loop(
+    caller: BaseAgent,
+    tool_agent_id: AgentId,
+    model_client: ChatCompletionClient,
+    input_messages: List[LLMMessage],
+    tool_schema: List[ToolSchema],
+    cancellation_token: Optional[CancellationToken] = None,
+    caller_source: str = "assistant",
+    on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
+    policy: Optional[ToolLoopPolicy] = None,
+    slots: Optional[asyncio.Semaphore] = None,
+    stats: Optional[ToolLoopStats] = None,
+    model_timeout: Optional[float] = None,
+    timeout_stats: Optional[TimeoutStats] = None,
+) -> List[LLMMessage]:
+    """`autogen_core.tool_agent.tool_agent_caller_loop` whose model calls can stream.
+
+    Alternates between the model and the tool agent until the model stops calling tools. Text deltas
+    are passed to `on_chunk` as they arrive. A response that calls tools streams none: the client yields
+    text deltas only, and tool-call deltas carry no text. The calls of an iteration run concurrently,
+    at most as many at once as `slots` allows, within the limits of `policy`. A model call that takes
+    longer than `model_timeout` raises `StageTimeoutError`. Returns the messages generated in the loop.
+    """
+    policy = policy or ToolLoopPolicy()
+    generated_messages: List[LLMMessage] = []
+    calls = timeouts = fan_out = iterations = 0
+    wall_time = 0.0
+
+    async def call_model(messages: List[LLMMessage], tools: List[ToolSchema]) -> CreateResult:
+        timeout = time_left(cancellation_token, model_timeout)
+        try:
+            with linked_token(cancellation_token) as call_token:
+                result = await asyncio.wait_for(complete(model_client, messages, tools, call_token, on_chunk),
+                                                timeout=timeout)
+        except asyncio.TimeoutError:
+            if timeout_stats is not None:
+                timeout_stats.timed_out("model")
+            raise StageTimeoutError("model", timeout) from None
+        return result
+
+    async def call_tool(call: FunctionCall) -> FunctionExecutionResult:
+        nonlocal timeouts
+        async with slots or contextlib.nullcontext():
+            with telemetry.stage("tool", tool=call.name, call_id=call.id) as span:
+                timeout = time_left(cancellation_token, policy.call_timeout)
+                # Cancelled on timeout, tools that honour their token stop early.
+                with linked_token(cancellation_token) as call_token:
+                    try:
+                        return await asyncio.wait_for(
+                            caller.send_message(message=call, recipient=tool_agent_id, cancellation_token=call_token),
+                            timeout=timeout)
+                    except asyncio.TimeoutError:
+                        call_token.cancel()
+                timeouts += 1
+                if timeout_stats is not None:
+                    timeout_stats.timed_out("tool")
+                telemetry.annotate(outcome="timeout")
+                span.set_attribute("timeout", True)
+                return FunctionExecutionResult(
+                    content=f"Error: {call.name} timed out after {timeout:.3g}s", call_id=call.id)
+
+    response = await call_model(input_messages, tool_schema)
+    generated_messages.append(AssistantMessage(content=response.content, source=caller_source))
+
+    # Keep iterating until the model stops generating tool calls.
+    while isinstance(response.content, list) and all(isinstance(item, FunctionCall) for item in response.content):
+        iterations += 1
+        calls += len(response.content)
+        fan_out = max(fan_out, len(response.content))
+        started = time.perf_counter()
+        results: List[FunctionExecutionResult | BaseException] = await asyncio.gather(
+            *[call_tool(call) for call in response.content],
+            return_exceptions=True,
+        )
+        wall_time += time.perf_counter() - started
+        function_results: List[FunctionExecutionResult] = []
+        for result in results:
+            if isinstance(result, FunctionExecutionResult):
+                function_results.append(result)
+            elif isinstance(result, ToolException):
+                function_results.append(FunctionExecutionResult(content=f"Error: {result}", call_id=result.call_id))
+            elif isinstance(result, BaseException):
+                raise result  # Unexpected exception.
+        generated_messages.append(FunctionExecutionResultMessage(content=function_results))
+        # Out of iterations, the model answers from what the tools returned so far.
+        truncated = iterations >= policy.max_iterations
+        response = await call_model(input_messages + generated_messages, [] if truncated else tool_schema)
+        generated_messages.append(AssistantMessage(content=response.content, source=caller_source))
+        if truncated:
+            if not isinstance(response.content, str):
+                raise RuntimeError(f"Model kept calling tools after {policy.max_iterations} iterations.")
+            break
+
+    telemetry.annotate(tool_calls=calls, tool_iterations=iterations, tool_fan_out=fan_out,
+                       tool_wall_time=wall_time, tool_timeouts=timeouts)
+    if stats is not None:
+        stats.turns += 1
+        stats.calls += calls
+        stats.timeouts += timeouts
+        stats.truncated += iterations >= policy.max_iterations
+        stats.calls_per_turn.append(calls)
+        stats.fan_out.append(fan_out)
+        stats.wall_time.append(wall_time)
+    return generated_messages
@@ -0,0 +1,103 @@
+from array import array
+from typing import Dict, List, Sequence
+from autogen_core.models import (
+    LLMMessage,
+    UserMessage,
+)
+from data_agents.persistence.snapshot import LazyMessages
+from data_agents.utils.utils import count_tokens
+
+# Role, name and separators the chat format adds to every message.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def message_tokens(message: LLMMessage) -> int:
+    content = message.content
+    if not isinstance(content, str):
+        content = " ".join(item if isinstance(item, str) else str(item) for item in content)
+    return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def content_length(message: LLMMessage) -> int:
+    content = message.content
+    return len(content) if isinstance(content, str) else sum(len(str(item)) for item in content)
+
+
+class Transcript:
+    """Append-only messages of a session, shared by its agents.
+
+    A group chat message is delivered to every subscriber as the same object, the first agent to
+    add it stores it with its token count, later adds of that object return the same position.
+    System notes the agents add to their own histories, e.g. "Transferred to HR_onpre", are
+    interned, so every agent's copy of a note is one shared message.
+    """
+
+    def __init__(self) -> None:
+        self._messages: List[LLMMessage] | LazyMessages = []
+        self._tokens = array("I")
+        # Position of each stored message by identity, the transcript keeps them alive.
+        self._positions: Dict[int, int] = {}
+        self._notes: List[LLMMessage] = []
+        self._note_tokens = array("I")
+        self._note_positions: Dict[str, int] = {}
+        # Characters of the messages' contents, approximately their bytes.
+        self.nbytes = 0
+
+    def add(self, message: LLMMessage) -> int:
+        position = self._positions.get(id(message))
+        if position is None:
+            position = len(self._messages)
+            self._messages.append(message)
+            self._tokens.append(message_tokens(message))
+            self._positions[id(message)] = position
+            self.nbytes += content_length(message)
+        return position
+
+    def load(self, messages: Sequence[LLMMessage]) -> None:
+        """Start from the saved messages of a resumed session, before any message is added.
+
+        Messages of a snapshot stay encoded, and their tokens uncounted, until an agent reads them.
+        """
+        self._messages = messages.copy() if isinstance(messages, LazyMessages) else list(messages)
+        # Zero is never a message's count, it marks the ones not counted yet.
+        self._tokens = array("I", bytes(self._tokens.itemsize * len(self._messages)))
+        self._positions = {}
+        self.nbytes = self._messages.nbytes if isinstance(self._messages, LazyMessages) else \
+            sum(content_length(message) for message in self._messages)
+
+    def note(self, content: str) -> int:
+        position = self._note_positions.get(content)
+        if position is None:
+            note = UserMessage(content=content, source="system")
+            position = len(self._notes)
+            self._notes.append(note)
+            self._note_tokens.append(message_tokens(note))
+            self._note_positions[content] = position
+            self.nbytes += len(content)
+        return position
+
+    def message(self, position: int) -> LLMMessage:
+        return self._messages[position]
+
+    def tokens(self, position: int) -> int:
+        tokens = self._tokens[position]
+        if not tokens:
+            tokens = self._tokens[position] = message_tokens(self._messages[position])
+        return tokens
+
+    def note_message(self, position: int) -> LLMMessage:
+        return self._notes[position]
+
+    def note_tokens(self, position: int) -> int:
+        return self._note_tokens[position]
+
+    @property
+    def messages(self) -> Sequence[LLMMessage]:
+        return self._messages
+
+    def copy_messages(self) -> Sequence[LLMMessage]:
+        """The messages so far, unaffected by later adds, e.g. for a save."""
+        return self._messages.copy()
+
+    def __len__(self) -> int:
+        return len(self._messages)
@@ -0,0 +1,118 @@
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional
+import json
+import logging
+import re
+import time
+from data_agents.models.pool import BackendTelemetry
+from data_agents.sensitivity import label_of
+
+logger = logging.getLogger(__name__)
+# One JSON line per decision, route this logger to a file to analyse the decisions later.
+decision_logger = logging.getLogger("data_agents.twin_decisions")
+
+_LABEL = re.compile(r"\s*label:\s*\S+\s*$")
+
+
+def capability_of(description: str) -> str:
+    """A participant's description without its deployment label, twins share it."""
+    return _LABEL.sub("", description).strip()
+
+
+def estimated_latency(telemetry: BackendTelemetry) -> float:
+    """Expected seconds to an answer: the median latency, stretched by the queue and by retries of failures."""
+    latency = telemetry.p50 or 0.0
+    load = 1 + telemetry.queue_depth / max(telemetry.capacity, 1)
+    return latency * load / (1 - min(telemetry.error_rate, 0.9))
+
+
+@dataclass
+class TwinDecision:
+    time: float
+    selected: str
+    chosen: str
+    reason: str
+    estimates: Dict[str, Optional[float]]
+    telemetry: Dict[str, Optional[Dict[str, Any]]]
+
+
+@dataclass
+class TwinStats:
+    decisions: int = 0
+    switched: int = 0
+    recent: Deque[TwinDecision] = field(default_factory=lambda: deque(maxlen=100))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "decisions": self.decisions,
+            "switched": self.switched,
+            "recent": [asdict(decision) for decision in list(self.recent)[-10:]],
+        }
+
+
+class TwinBalancer:
+    """Picks between participants that differ only by their deployment label, from live backend telemetry.
+
+    The selector still decides who should answer. When the twin of the participant it picked is also
+    a candidate, the one whose backend is expected to answer first gets the turn: a public pick may
+    always move on-premise, an on-premise pick moves to its public twin only while the conversation
+    is not flagged sensitive. Unhealthy backends lose to healthy ones, ties keep the selector's
+    choice, so the decision is deterministic for a given telemetry.
+    """
+
+    def __init__(self, participant_topic_types: List[str], participant_descriptions: List[str],
+                 telemetry: Callable[[str], Optional[BackendTelemetry]]) -> None:
+        self._telemetry = telemetry
+        self._labels: Dict[str, str] = {}
+        self._twins: Dict[str, str] = {}
+        by_capability: Dict[str, List[str]] = {}
+        for topic_type, description in zip(participant_topic_types, participant_descriptions, strict=True):
+            self._labels[topic_type] = label_of(description)
+            by_capability.setdefault(capability_of(description), []).append(topic_type)
+        for topic_types in by_capability.values():
+            if len(topic_types) == 2 and len({self._labels[topic_type] for topic_type in topic_types}) == 2:
+                first, second = topic_types
+                self._twins[first], self._twins[second] = second, first
+        self.stats = TwinStats()
+
+    def twin_of(self, topic_type: str) -> Optional[str]:
+        return self._twins.get(topic_type)
+
+    def choose(self, selected: str, candidates: List[str], sensitive: bool) -> str:
+        """`selected` or its twin among `candidates`, never a public one for a `sensitive` conversation."""
+        twin = self._twins.get(selected)
+        if twin is None or twin not in candidates or (sensitive and self._labels[twin] != "on-premise"):
+            return selected
+        telemetry = {topic_type: self._telemetry(self._labels[topic_type]) for topic_type in (selected, twin)}
+        if telemetry[selected] is None or telemetry[twin] is None:
+            return selected
+
+        def rank(topic_type: str) -> tuple:
+            backend = telemetry[topic_type]
+            return not backend.healthy, estimated_latency(backend), backend.p95 or 0.0
+
+        chosen = twin if rank(twin) < rank(selected) else selected
+        if not telemetry[chosen].healthy:
+            reason = "both unhealthy"
+        elif not telemetry[selected].healthy:
+            reason = "selected unhealthy"
+        else:
+            reason = "faster" if chosen != selected else "not slower"
+        self._record(TwinDecision(
+            time=time.time(),
+            selected=selected,
+            chosen=chosen,
+            reason=reason,
+            estimates={topic_type: estimated_latency(backend) for topic_type, backend in telemetry.items()},
+            telemetry={topic_type: asdict(backend) for topic_type, backend in telemetry.items()},
+        ))
+        return chosen
+
+    def _record(self, decision: TwinDecision) -> None:
+        self.stats.decisions += 1
+        if decision.chosen != decision.selected:
+            self.stats.switched += 1
+            logger.info(f"{decision.selected} -> {decision.chosen} ({decision.reason}).")
+        self.stats.recent.append(decision)
+        decision_logger.info(json.dumps(asdict(decision)))
@@ -1,4 +1,5 @@
 from autogen_core import (
+    CancellationToken,
     DefaultTopicId,
     MessageContext,
     RoutedAgent,
@@ -7,33 +8,94 @@ from autogen_core import (
 from autogen_core.models import (
     UserMessage,
 )
-from data_agents.messages import GroupChatMessage, RequestToSpeak
+from data_agents.messages import GroupChatMessage, InputRequest, RequestToSpeak, StreamChunk, TerminateMessage
+from data_agents.deadline import TimeoutStats, past_deadline, time_left
+from data_agents import telemetry
 import asyncio
+import logging
 from typing import Optional, Callable
 
+logger = logging.getLogger(__name__)
+
 class UserAgent(RoutedAgent):
     def __init__(self, 
                  description: str, 
                  group_chat_topic_type: str,
-                 output_message_queue: asyncio.Queue[GroupChatMessage | None],
-                 input_func: Optional[Callable] = None
+                 output_message_queue: asyncio.Queue[UserMessage | StreamChunk | InputRequest | None],
+                 input_func: Optional[Callable] = None,
+                 cancellation_token: Optional[CancellationToken] = None,
+                 suspend: Optional[Callable[[], None]] = None,
+                 input_timeout: Optional[float] = None,
+                 timeout_stats: Optional[TimeoutStats] = None,
                 ) -> None:
         super().__init__(description=description)
         self._group_chat_topic_type = group_chat_topic_type
         self.output_message_queue = output_message_queue
         self.input_func = input_func
+        # The session's token, cancelled once nobody reads the output queue any more.
+        self._cancellation_token = cancellation_token
+        self._output_lock = asyncio.Lock()
+        # When set, the user's turn suspends the session instead of waiting on `input_func`.
+        self._suspend = suspend
+        self._input_timeout = input_timeout
+        self._timeout_stats = timeout_stats
+
+    async def _output(self, message: UserMessage | StreamChunk | InputRequest) -> None:
+        # Handlers run concurrently, the lock keeps messages in order while they wait for room.
+        async with self._output_lock:
+            if self._cancellation_token is not None and self._cancellation_token.is_cancelled():
+                return
+            if not self.output_message_queue.full():
+                self.output_message_queue.put_nowait(message)
+                return
+            # Backpressure: wait for the consumer, unless the session goes away first.
+            put = asyncio.ensure_future(self.output_message_queue.put(message))
+            if self._cancellation_token is not None:
+                self._cancellation_token.link_future(put)
+            try:
+                await put
+            except asyncio.CancelledError:
+                if self._cancellation_token is None or not self._cancellation_token.is_cancelled():
+                    raise
 
     @message_handler
     async def handle_message(self, message: GroupChatMessage, ctx: MessageContext) -> None:
         # When integrating with a frontend, this is where group chat message would be sent to the frontend.
         assert isinstance(message.body, UserMessage)
-        await self.output_message_queue.put(message.body)
+        await self._output(message.body)
+
+    @message_handler
+    async def handle_stream_chunk(self, message: StreamChunk, ctx: MessageContext) -> None:
+        await self._output(message)
     
     @message_handler
     async def handle_request_to_speak(self, message: RequestToSpeak, ctx: MessageContext) -> None:
         # print(f"\n{'-'*80}\n{self.id.type} speaking:", flush=True)
-        user_input = await self.input_func(prompt="Enter your message, type 'APPROVE' to conclude the task: ", cancellation_token=None)
+        prompt = "Enter your message, type 'APPROVE' to conclude the task: "
+        await self._output(InputRequest(prompt=prompt))
+        if self._suspend is not None:
+            self._suspend()
+            return
+        timeout = time_left(ctx.cancellation_token, self._input_timeout)
+        try:
+            with telemetry.stage("user_input", session_id=self.id.key, topic_type=self.id.type):
+                user_input = await asyncio.wait_for(
+                    self.input_func(prompt=prompt, cancellation_token=self._cancellation_token), timeout=timeout)
+        except asyncio.TimeoutError:
+            if past_deadline(ctx.cancellation_token):
+                return
+            logger.warning(f"{self.id}: no input within {timeout}s.")
+            if self._timeout_stats is not None:
+                self._timeout_stats.timed_out("user_input")
+                self._timeout_stats.fell_back("user_input", "terminate")
+            await self.publish_message(
+                TerminateMessage(f"{self.id.type} (termination condition): No input in time."),
+                DefaultTopicId(type=self._group_chat_topic_type),
+                cancellation_token=ctx.cancellation_token,
+            )
+            return
         await self.publish_message(
             GroupChatMessage(body=UserMessage(content=user_input, source=self.id.type)),
             DefaultTopicId(type=self._group_chat_topic_type),
+            cancellation_token=ctx.cancellation_token,
         )
\ No newline at end of file
@@ -0,0 +1,129 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Literal, Mapping, Optional
+import asyncio
+import json
+import statistics
+import time
+from autogen_core import CancellationToken
+from autogen_core.tools import BaseTool, Tool
+from data_agents.cache import TTLCache
+
+
+@dataclass
+class ToolCachePolicy:
+    """How results of a tool may be reused.
+
+    - "none": every call runs the tool, concurrent calls are not coalesced (tools with side effects, or
+      whose results are personal: a `CachedTool` is shared by every session of the engine).
+    - "ttl": results are reused for `ttl` seconds per arguments, up to `maxsize` of them.
+    - "args": results are reused per arguments until evicted, up to `maxsize` of them.
+    """
+    mode: Literal["none", "ttl", "args"] = "none"
+    ttl: Optional[float] = None
+    maxsize: int = 256
+
+
+@dataclass
+class _Flight:
+    """A run of the wrapped tool shared by the concurrent calls with the same arguments."""
+    task: asyncio.Task
+    cancellation_token: CancellationToken
+    waiters: int = 0
+
+
+@dataclass
+class ToolStats:
+    calls: int = 0
+    hits: int = 0
+    coalesced: int = 0
+    errors: int = 0
+    # Latency of the calls that ran the tool, in seconds.
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=1000))
+
+    def as_dict(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        return {
+            "calls": self.calls,
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "runs": len(latencies),
+            "p50_ms": statistics.median(latencies) * 1e3 if latencies else None,
+            "p95_ms": latencies[int(len(latencies) * 0.95)] * 1e3 if latencies else None,
+        }
+
+
+class CachedTool(BaseTool[Any, Any]):
+    """Wraps a tool with result memoization and single-flight.
+
+    Concurrent calls with the same arguments share one run of the wrapped tool. A caller that gives
+    up only cancels its own wait, the run is cancelled once every caller waiting on it gave up.
+    """
+
+    def __init__(self, tool: Tool, policy: ToolCachePolicy) -> None:
+        super().__init__(tool.args_type(), tool.return_type(), tool.name, tool.description)
+        self._tool = tool
+        self._policy = policy
+        self._cache = TTLCache(maxsize=policy.maxsize, ttl=policy.ttl if policy.mode == "ttl" else None,
+                               enabled=policy.mode != "none")
+        self._inflight: Dict[str, _Flight] = {}
+        self.stats = ToolStats()
+
+    @property
+    def schema(self):
+        return self._tool.schema
+
+    def return_value_as_string(self, value: Any) -> str:
+        return self._tool.return_value_as_string(value)
+
+    async def run(self, args: Any, cancellation_token: CancellationToken) -> Any:
+        return await self.run_json(args.model_dump(), cancellation_token)
+
+    async def run_json(self, args: Mapping[str, Any], cancellation_token: CancellationToken) -> Any:
+        self.stats.calls += 1
+        if self._policy.mode == "none":
+            return await self._timed_run(args, cancellation_token)
+
+        key = json.dumps(args, sort_keys=True, default=str)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self.stats.hits += 1
+            return cached
+
+        flight = self._inflight.get(key)
+        if flight is not None:
+            self.stats.coalesced += 1
+        else:
+            run_token = CancellationToken()
+            flight = _Flight(task=asyncio.ensure_future(self._timed_run(args, run_token)), cancellation_token=run_token)
+            self._inflight[key] = flight
+            flight.task.add_done_callback(lambda done, key=key: self._finish(key, done))
+        flight.waiters += 1
+        waiter = asyncio.shield(flight.task)
+        if cancellation_token is not None:
+            cancellation_token.link_future(waiter)
+        try:
+            return await waiter
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # The last caller gave up, nobody is left to use the result.
+                flight.cancellation_token.cancel()
+                flight.task.cancel()
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        if key in self._inflight and self._inflight[key].task is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is None and task.result() is not None:
+            self._cache.put(key, task.result())
+
+    async def _timed_run(self, args: Mapping[str, Any], cancellation_token: CancellationToken) -> Any:
+        start = time.perf_counter()
+        try:
+            return await self._tool.run_json(args, cancellation_token)
+        except Exception:
+            self.stats.errors += 1
+            raise
+        finally:
+            self.stats.latencies.append(time.perf_counter() - start)
@@ -0,0 +1,30 @@
+from concurrent.futures import Executor
+from typing import Any, Callable, Optional
+import asyncio
+import functools
+from autogen_core import CancellationToken
+from autogen_core.tools import FunctionTool
+from pydantic import BaseModel
+
+
+class ThreadedFunctionTool(FunctionTool):
+    """`FunctionTool` running a synchronous function on `executor` rather than the loop's default one.
+
+    A dedicated pool keeps blocking tools from starving other users of the default executor,
+    e.g. persistence, and bounds how many run at once. Coroutine functions run on the loop as usual.
+    """
+
+    def __init__(self, func: Callable[..., Any], description: str, executor: Executor,
+                 name: Optional[str] = None) -> None:
+        super().__init__(func, description, name=name)
+        self._executor = executor
+
+    async def run(self, args: BaseModel, cancellation_token: CancellationToken) -> Any:
+        if asyncio.iscoroutinefunction(self._func):
+            return await super().run(args, cancellation_token)
+        kwargs = args.model_dump()
+        if self._has_cancellation_support:
+            kwargs["cancellation_token"] = cancellation_token
+        future = asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(self._func, **kwargs))
+        cancellation_token.link_future(future)
+        return await future
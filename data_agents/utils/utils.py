@@ -1 +1,24 @@
-# pass
\ No newline at end of file
+import functools
+import logging
+
+logger = logging.getLogger(__name__)
+
+TOKEN_ENCODING = "cl100k_base"
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception:
+        # tiktoken downloads the encoding on first use, which fails on hosts without internet access.
+        logger.warning(f"Token encoding {TOKEN_ENCODING} unavailable, estimating token counts from length.")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
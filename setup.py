@@ -32,7 +32,7 @@ setuptools.setup(
     packages=setuptools.find_packages(exclude=['tests*']),
     entry_points={
         'console_scripts': [
-            'lr-start = tool_legacy.process_data:main',
+            'lr-start = data_agents.server:main',
         ]
     },
     install_requires=min_requires,
@@ -0,0 +1,142 @@
+import asyncio
+import json
+from typing import List
+import pytest
+from autogen_core import CancellationToken
+from autogen_core.tools import FunctionTool
+from data_agents.utils.tools.cached import CachedTool, ToolCachePolicy
+
+ARGS = {"query": "annual leave"}
+KEY = json.dumps(ARGS, sort_keys=True)
+
+
+class Rules:
+    """A tool looking up HR rules, each run waits for `gate` and records how it ended."""
+
+    def __init__(self) -> None:
+        self.gate = asyncio.Event()
+        self.runs = 0
+        self.cancelled = 0
+
+    async def __call__(self, query: str) -> str:
+        self.runs += 1
+        try:
+            await self.gate.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return f"rules about {query} (run {self.runs})"
+
+
+def cached_tool(rules: Rules, **policy) -> CachedTool:
+    return CachedTool(FunctionTool(rules.__call__, name="hr_rules", description="HR rules."), ToolCachePolicy(**policy))
+
+
+async def settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_calls_share_one_run():
+    async def main() -> None:
+        rules = Rules()
+        tool = cached_tool(rules, mode="args")
+        calls = [asyncio.ensure_future(tool.run_json(ARGS, CancellationToken())) for _ in range(3)]
+        await settle()
+        assert rules.runs == 1
+        assert tool._inflight[KEY].waiters == 3
+        rules.gate.set()
+        results = await asyncio.gather(*calls)
+        assert results == ["rules about annual leave (run 1)"] * 3
+        assert KEY not in tool._inflight
+        assert (tool.stats.calls, tool.stats.coalesced, tool.stats.hits) == (3, 2, 0)
+
+        # Later calls are answered from the cache.
+        assert await tool.run_json(ARGS, CancellationToken()) == "rules about annual leave (run 1)"
+        assert rules.runs == 1 and tool.stats.hits == 1
+
+    asyncio.run(main())
+
+
+def test_run_is_cancelled_with_its_last_waiter():
+    async def main() -> None:
+        rules = Rules()
+        tool = cached_tool(rules, mode="args")
+        tokens = [CancellationToken(), CancellationToken()]
+        calls = [asyncio.ensure_future(tool.run_json(ARGS, token)) for token in tokens]
+        await settle()
+
+        # The leader gives up, the run goes on for the other caller.
+        tokens[0].cancel()
+        await settle()
+        assert calls[0].cancelled()
+        assert tool._inflight[KEY].waiters == 1
+        assert rules.cancelled == 0
+
+        # Nobody is left to use the result.
+        tokens[1].cancel()
+        await settle()
+        assert calls[1].cancelled()
+        assert rules.cancelled == 1
+        assert KEY not in tool._inflight
+
+        # A cancelled run is not cached, the next call runs the tool again.
+        rules.gate.set()
+        assert await tool.run_json(ARGS, CancellationToken()) == "rules about annual leave (run 2)"
+
+    asyncio.run(main())
+
+
+def test_results_expire_after_the_ttl():
+    async def main() -> List[str]:
+        rules = Rules()
+        rules.gate.set()
+        tool = cached_tool(rules, mode="ttl", ttl=0.05)
+        results = [await tool.run_json(ARGS, CancellationToken()), await tool.run_json(ARGS, CancellationToken())]
+        await asyncio.sleep(0.1)
+        results.append(await tool.run_json(ARGS, CancellationToken()))
+        assert tool.stats.hits == 1
+        return results
+
+    assert asyncio.run(main()) == ["rules about annual leave (run 1)", "rules about annual leave (run 1)",
+                                   "rules about annual leave (run 2)"]
+
+
+def test_mode_none_runs_every_call():
+    async def main() -> None:
+        rules = Rules()
+        tool = cached_tool(rules, mode="none")
+        calls = [asyncio.ensure_future(tool.run_json(ARGS, CancellationToken())) for _ in range(3)]
+        await settle()
+        # Not coalesced.
+        assert rules.runs == 3
+        assert not tool._inflight
+        rules.gate.set()
+        await asyncio.gather(*calls)
+        # Not cached.
+        await tool.run_json(ARGS, CancellationToken())
+        assert rules.runs == 4
+        assert (tool.stats.calls, tool.stats.coalesced, tool.stats.hits) == (4, 0, 0)
+
+    asyncio.run(main())
+
+
+def test_failed_run_is_shared_and_not_cached():
+    async def main() -> None:
+        runs = []
+
+        async def failing(query: str) -> str:
+            runs.append(query)
+            await asyncio.sleep(0.01)
+            raise ConnectionError("HR database unavailable")
+
+        tool = CachedTool(FunctionTool(failing, name="hr_rules", description="HR rules."), ToolCachePolicy(mode="args"))
+        calls = [tool.run_json(ARGS, CancellationToken()) for _ in range(2)]
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        assert all(isinstance(result, ConnectionError) for result in results)
+        assert len(runs) == 1
+        with pytest.raises(ConnectionError):
+            await tool.run_json(ARGS, CancellationToken())
+        assert len(runs) == 2 and tool.stats.errors == 2
+
+    asyncio.run(main())
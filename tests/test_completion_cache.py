@@ -0,0 +1,113 @@
+import asyncio
+from typing import List, Sequence
+import httpx
+import pytest
+from autogen_core import FunctionCall
+from autogen_core.models import (
+    AssistantMessage,
+    CreateResult,
+    FunctionExecutionResult,
+    FunctionExecutionResultMessage,
+    LLMMessage,
+    RequestUsage,
+    SystemMessage,
+    UserMessage,
+)
+from data_agents.engine import RouterConfig, RouterEngine
+from data_agents.models.cached_client import CachedChatCompletionClient, CompletionCache, completion_key
+from data_agents.models.scripted_client import ScriptedChatCompletionClient, router_rules
+from data_agents.server import RouterServer, create_app
+
+QUESTION = [SystemMessage(content="You are an HR assistant."), UserMessage(content="What's my salary?", source="User")]
+TOOLS = [{"name": "get_salary", "description": "Salary of an employee.",
+          "parameters": {"type": "object", "properties": {"employee_id": {"type": "string"}}}}]
+
+
+@pytest.fixture(autouse=True)
+def workspace(tmp_path, monkeypatch):
+    # Sessions get a workspace under the working directory.
+    monkeypatch.chdir(tmp_path)
+
+
+class StubClient:
+    """Answers every request with `answer`, counting the requests."""
+
+    def __init__(self, answer: str = "Your salary is 52,000 EUR.") -> None:
+        self.answer = answer
+        self.calls = 0
+
+    async def create(self, messages, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        self.calls += 1
+        return CreateResult(finish_reason="stop", content=self.answer, usage=RequestUsage(10, 5), cached=False)
+
+
+def ask(client: CachedChatCompletionClient, messages: Sequence[LLMMessage] = QUESTION) -> CreateResult:
+    return asyncio.run(client.create(messages, tools=TOOLS))
+
+
+def test_on_premise_answers_stay_in_their_label_and_session():
+    cache = CompletionCache()
+    model = StubClient()
+    session_1 = CachedChatCompletionClient(model, cache, "on-premise", scope="u1~Alice~token~1")
+    assert not ask(session_1).cached
+    assert ask(session_1).cached
+
+    # Neither another session nor a public client gets the sensitive answer.
+    session_2 = CachedChatCompletionClient(model, cache, "on-premise", scope="u2~Bob~token~2")
+    public = CachedChatCompletionClient(model, cache, "public")
+    assert not ask(session_2).cached
+    assert not ask(public).cached
+    assert ask(public).cached
+    assert model.calls == 3
+    stats = cache.stats()
+    assert stats["on-premise"]["hits"] == 1 and stats["public"]["hits"] == 1
+
+
+def tool_loop(result: str) -> List[LLMMessage]:
+    call = FunctionCall(id="call_0", name="get_salary", arguments='{"employee_id": "1234"}')
+    return [*QUESTION, AssistantMessage(content=[call], source="HR_onpre"),
+            FunctionExecutionResultMessage(content=[FunctionExecutionResult(call_id="call_0", content=result)])]
+
+
+def test_tool_call_traffic_changes_the_key():
+    keys = {
+        completion_key(QUESTION, TOOLS),
+        completion_key(QUESTION, []),
+        completion_key(tool_loop("52000"), TOOLS),
+        completion_key(tool_loop("61000"), TOOLS),
+        completion_key(QUESTION, TOOLS, scope="u1~Alice~token~1"),
+    }
+    assert len(keys) == 5
+    assert completion_key(tool_loop("52000"), TOOLS) == completion_key(tool_loop("52000"), TOOLS)
+
+    # The answer is only reused when the tools returned the same results.
+    model = StubClient()
+    client = CachedChatCompletionClient(model, CompletionCache(), "public")
+    assert not ask(client, tool_loop("52000")).cached
+    assert not ask(client, tool_loop("61000")).cached
+    assert ask(client, tool_loop("52000")).cached
+
+
+def test_engine_never_shares_on_premise_answers_between_sessions():
+    async def main() -> dict:
+        model_client = ScriptedChatCompletionClient(rules=router_rules(route="HR_onpre", tool_calls=()),
+                                                    default="Employees get 10 days of annual leave.")
+        engine = RouterEngine(model_client=model_client, completion_cache=CompletionCache(), config=RouterConfig())
+
+        async def approve(prompt: str = "", cancellation_token=None) -> str:
+            return "APPROVE"
+
+        for user in [("u1", "Alice", "token"), ("u2", "Bob", "token"), ("u1", "Alice", "token")]:
+            [message async for message in engine.run_stream(*user, "What's the annual leave policy?",
+                                                            input_func=approve)]
+        stats = (await httpx.AsyncClient(app=create_app(RouterServer(engine)), base_url="http://router")
+                 .get("/stats")).json()["completion_cache"]
+        await engine.stop()
+        return stats
+
+    stats = asyncio.run(main())
+    on_premise = stats["on-premise"]
+    # Bob's request is Alice's first one, sent from another session. Her second conversation continues her history.
+    assert on_premise["hits"] == 0
+    assert on_premise["misses"] == 3
+    assert stats["public"]["misses"] == 0
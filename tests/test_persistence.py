@@ -0,0 +1,199 @@
+import asyncio
+from typing import Any, Dict, List, Mapping, Tuple
+import pytest
+from autogen_core.models import UserMessage
+from sqlalchemy import func, select
+from data_agents.persistence.base import SessionConflictError
+from data_agents.persistence.localfile import LocalFilePersistence
+from data_agents.persistence.segmentlog import SegmentLogPersistence
+from data_agents.persistence import sql
+from data_agents.persistence.sql import SQLPersistence
+
+SESSION_ID = "u1~Alice~token~0b6f8f6e-0000-4000-8000-000000000000"
+USER = "u1~Alice~token"
+
+
+@pytest.fixture(params=["snapshot", "snapshot-lz4", "segmentlog", "sql"])
+def backend(request, tmp_path):
+    """A factory of persistence instances over the same storage, a new one per call like a restarted router."""
+    instances = []
+
+    def create():
+        if request.param == "snapshot":
+            persistence = LocalFilePersistence(str(tmp_path / "sessions"))
+        elif request.param == "snapshot-lz4":
+            persistence = LocalFilePersistence(str(tmp_path / "sessions"), compression="lz4")
+        elif request.param == "segmentlog":
+            persistence = SegmentLogPersistence(str(tmp_path / "sessions"), compact_every=4)
+        else:
+            persistence = SQLPersistence(f"sqlite:///{tmp_path / 'sessions.sqlite3'}")
+        instances.append(persistence)
+        return persistence
+
+    yield create
+    for persistence in instances:
+        if isinstance(persistence, SQLPersistence):
+            persistence.close()
+
+
+def messages(*contents: str) -> List[UserMessage]:
+    return [UserMessage(content=content, source="User" if index % 2 == 0 else "HR_onpre")
+            for index, content in enumerate(contents)]
+
+
+def session_state(history: List[UserMessage], num_rounds: int, session_id: str = SESSION_ID) -> Dict[str, Any]:
+    return {
+        f"HR_onpre/{session_id}": {"memory": {"messages": list(history)}, "persona": 1},
+        f"group_chat_manager/{session_id}": {
+            "memory": {"messages": list(history)},
+            "previous_participant": "User",
+            "num_rounds": num_rounds,
+            "elapsed": 1.5,
+            "sensitive": False,
+        },
+        # An agent without a message history.
+        f"tool_executor_agent_4_hr_onpre/{session_id}": {"calls": 3},
+    }
+
+
+def normalized(content: Mapping[str, Any]) -> Dict[str, Any]:
+    """The content with its messages as (source, content) pairs, comparable across backends."""
+    result = {}
+    for agent, state in content.items():
+        state = dict(state)
+        if "memory" in state:
+            memory = dict(state["memory"])
+            memory["messages"] = [(message.source, message.content) for message in memory["messages"]]
+            state["memory"] = memory
+        result[agent] = state
+    return result
+
+
+def test_round_trip(backend):
+    content = session_state(messages("What's the annual leave?", "Ten days.", "And sick days?"), num_rounds=3)
+    backend().save_content(SESSION_ID, content)
+
+    persistence = backend()
+    assert normalized(persistence.load_content(SESSION_ID)) == normalized(content)
+    assert persistence.get_uuid(USER) == SESSION_ID
+
+
+def test_round_trip_of_a_growing_history(backend):
+    history = messages("What's the annual leave?", "Ten days.")
+    persistence = backend()
+    for turn in range(10):
+        history += messages(f"Question {turn}?", f"Answer {turn}.")
+        persistence.save_content(SESSION_ID, session_state(history, num_rounds=turn))
+
+    assert normalized(backend().load_content(SESSION_ID)) == normalized(session_state(history, num_rounds=9))
+
+
+def test_round_trip_of_a_rewritten_history(backend):
+    persistence = backend()
+    persistence.save_content(SESSION_ID, session_state(messages("a", "b", "c", "d"), num_rounds=2))
+    # Shorter, e.g. summarized.
+    persistence.save_content(SESSION_ID, session_state(messages("summary", "e"), num_rounds=3))
+    # As long as before, with a different stored prefix.
+    history = messages("summary", "f", "g", "h")
+    persistence.save_content(SESSION_ID, session_state(history, num_rounds=4))
+
+    assert normalized(backend().load_content(SESSION_ID)) == normalized(session_state(history, num_rounds=4))
+
+
+def test_round_trip_of_resumed_session(backend):
+    history = messages("What's the annual leave?", "Ten days.")
+    backend().save_content(SESSION_ID, session_state(history, num_rounds=1))
+
+    # Loaded, extended and saved again by another instance, as a resumed session is.
+    persistence = backend()
+    loaded = persistence.load_content(SESSION_ID)
+    for state in loaded.values():
+        if "memory" in state:
+            state["memory"]["messages"].extend(messages("And sick days?", "Five days."))
+    persistence.save_content(SESSION_ID, loaded)
+
+    expected = session_state(history + messages("And sick days?", "Five days."), num_rounds=1)
+    assert normalized(backend().load_content(SESSION_ID)) == normalized(expected)
+
+
+def test_sql_round_trip_with_a_long_token(tmp_path):
+    # E.g. a JWT, longer than the 255 characters of a VARCHAR.
+    user = "u1~Alice~" + "eyJhbGciOiJSUzI1NiJ9." * 20
+    session_id = f"{user}~0b6f8f6e-0000-4000-8000-000000000000"
+    url = f"sqlite:///{tmp_path / 'sessions.sqlite3'}"
+    persistence = SQLPersistence(url)
+    persistence.save_content(session_id, session_state(messages("What's the annual leave?", "Ten days."),
+                                                       num_rounds=1, session_id=session_id))
+    content = session_state(messages("What's the annual leave?", "Ten days.", "And sick days?"), num_rounds=2,
+                            session_id=session_id)
+    persistence.save_content(session_id, content)
+    persistence.close()
+
+    persistence = SQLPersistence(url)
+    try:
+        assert normalized(persistence.load_content(session_id)) == normalized(content)
+        assert persistence.get_uuid(user) == session_id
+        # SQLite does not enforce the length of a VARCHAR, Postgres does.
+        with persistence._engine.connect() as conn:
+            for table in sql.metadata.sorted_tables:
+                for column in table.columns:
+                    length = getattr(column.type, "length", None)
+                    if length is not None:
+                        assert conn.execute(select(func.max(func.length(column)))).scalar() <= length
+    finally:
+        persistence.close()
+
+
+def test_missing_session(backend):
+    persistence = backend()
+    assert not persistence.load_content(SESSION_ID)
+    assert not persistence.get_uuid(USER)
+
+
+def test_async_round_trip(backend):
+    content = session_state(messages("What's the annual leave?", "Ten days."), num_rounds=1)
+
+    async def save() -> Tuple[str, Mapping[str, Any]]:
+        persistence = backend()
+        await persistence.asave_content(uuid=SESSION_ID, content=content)
+        # Queued sessions are found and read back before they are written.
+        found = await persistence.aget_uuid(USER)
+        loaded = await persistence.aload_content(uuid=SESSION_ID)
+        await persistence.aflush()
+        return found, loaded
+
+    found, loaded = asyncio.run(save())
+    assert found == SESSION_ID
+    assert normalized(loaded) == normalized(content)
+
+    async def load() -> Mapping[str, Any]:
+        return await backend().aload_content(uuid=SESSION_ID)
+
+    assert normalized(asyncio.run(load())) == normalized(content)
+
+
+def test_sql_conflicting_save_is_refused_until_reload(tmp_path):
+    url = f"sqlite:///{tmp_path / 'sessions.sqlite3'}"
+    first, second = SQLPersistence(url), SQLPersistence(url)
+    try:
+        history = messages("What's the annual leave?", "Ten days.")
+        first.save_content(SESSION_ID, session_state(history, num_rounds=1))
+        second.load_content(SESSION_ID)
+        first.save_content(SESSION_ID, session_state(history + messages("And sick days?"), num_rounds=2))
+
+        # Built on the version before the first replica's save.
+        stale = session_state(history + messages("Parental leave?"), num_rounds=2)
+        with pytest.raises(SessionConflictError):
+            second.save_content(SESSION_ID, stale)
+        assert second.conflicted(SESSION_ID)
+        with pytest.raises(SessionConflictError):
+            second.save_content(SESSION_ID, stale)
+
+        reloaded = second.load_content(SESSION_ID)
+        assert not second.conflicted(SESSION_ID)
+        expected = session_state(history + messages("And sick days?"), num_rounds=2)
+        assert normalized(reloaded) == normalized(expected)
+        second.save_content(SESSION_ID, reloaded)
+    finally:
+        first.close()
+        second.close()
@@ -0,0 +1,180 @@
+import asyncio
+import gc
+from typing import Any, Dict, List, Optional
+import pytest
+from autogen_core.models import CreateResult, RequestUsage, UserMessage
+from data_agents.models.pool import CircuitBreaker, Endpoint, EndpointPool, NoHealthyEndpointError
+
+MESSAGES = [UserMessage(content="What's the annual leave policy?", source="User")]
+
+
+class StubClient:
+    """Answers with its name after `latency` seconds, or raises `error`, or waits for `gate`."""
+
+    def __init__(self, name: str, latency: float = 0.0, error: Optional[BaseException] = None,
+                 gate: Optional[asyncio.Event] = None) -> None:
+        self.name = name
+        self.latency = latency
+        self.error = error
+        self.gate = gate
+        self.calls = 0
+        self.cancelled = 0
+
+    async def create(self, messages, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        self.calls += 1
+        try:
+            if self.gate is not None:
+                await self.gate.wait()
+            await asyncio.sleep(self.latency)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        return CreateResult(finish_reason="stop", content=self.name, usage=RequestUsage(0, 0), cached=False)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def endpoint(client: StubClient, label: str = "on-premise", **kwargs: Any) -> Endpoint:
+    return Endpoint(name=client.name, client=client, label=label, **kwargs)
+
+
+def create(pool: EndpointPool) -> str:
+    return asyncio.run(pool.create(MESSAGES)).content
+
+
+def test_breaker_opens_and_lets_one_probe_through_when_half_open():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10.0, clock=clock)
+    breaker.on_failure()
+    assert breaker.state == "closed" and breaker.allows()
+    breaker.on_failure()
+    assert breaker.state == "open" and not breaker.allows()
+
+    clock.now = 10.0
+    assert breaker.state == "half-open" and breaker.allows()
+    breaker.on_start()
+    # One probe at a time.
+    assert not breaker.allows()
+    breaker.on_failure()
+    assert breaker.state == "open"
+
+    clock.now = 20.0
+    breaker.on_start()
+    breaker.on_success()
+    assert breaker.state == "closed" and breaker.allows()
+
+
+def test_open_breaker_routes_around_the_endpoint():
+    clock = FakeClock()
+    failing = StubClient("vllm-1", error=ConnectionError("refused"))
+    healthy = StubClient("vllm-2")
+    pool = EndpointPool("on-premise", [
+        endpoint(failing, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=10.0, clock=clock)),
+        endpoint(healthy),
+    ], backoff_base=0.0)
+
+    assert create(pool) == "vllm-2"
+    assert pool.endpoints[0].breaker.state == "open"
+    calls = failing.calls
+    for _ in range(3):
+        assert create(pool) == "vllm-2"
+    assert failing.calls == calls
+
+    # Half-open, the recovered endpoint gets the probe and closes again.
+    clock.now = 10.0
+    failing.error = None
+    assert create(pool) == "vllm-1"
+    assert pool.endpoints[0].breaker.state == "closed"
+
+
+def test_no_healthy_endpoint():
+    pool = EndpointPool("on-premise", [endpoint(StubClient("vllm-1"))], retries=0)
+    pool.endpoints[0].breaker.trip()
+    with pytest.raises(NoHealthyEndpointError):
+        create(pool)
+
+
+def test_retry_excludes_the_failed_endpoint():
+    failing = StubClient("vllm-1", error=ConnectionError("refused"))
+    healthy = StubClient("vllm-2", latency=0.01)
+    pool = EndpointPool("on-premise", [endpoint(failing), endpoint(healthy)], retries=2, backoff_base=0.0)
+
+    assert create(pool) == "vllm-2"
+    assert (failing.calls, healthy.calls) == (1, 1)
+    assert pool.retries == 1
+    assert pool.endpoints[0].errors == 1
+
+
+def test_non_retriable_error_is_raised_at_once():
+    failing = StubClient("vllm-1", error=ValueError("bad request"))
+    pool = EndpointPool("on-premise", [endpoint(failing), endpoint(StubClient("vllm-2"))], backoff_base=0.0)
+    with pytest.raises(ValueError):
+        create(pool)
+    assert pool.retries == 0
+    # Not the endpoint's fault, its circuit stays closed.
+    assert pool.endpoints[0].breaker.state == "closed"
+
+
+def hedged_pool(*clients: StubClient) -> EndpointPool:
+    pool = EndpointPool("on-premise", [endpoint(client) for client in clients], hedge_percentile=0.5,
+                        hedge_min_samples=1, backoff_base=0.0)
+    # Recent requests took 20 ms, a request still running after that is hedged.
+    pool._latencies.extend([0.02] * 10)
+    return pool
+
+
+def test_hedge_wins_over_a_slow_endpoint():
+    slow, fast = StubClient("vllm-1", latency=1.0), StubClient("vllm-2", latency=0.01)
+    pool = hedged_pool(slow, fast)
+
+    assert create(pool) == "vllm-2"
+    assert (pool.hedges, pool.hedge_wins) == (1, 1)
+    # The losing request was cancelled, and says nothing about its endpoint.
+    assert slow.cancelled == 1
+    assert pool.endpoints[0].errors == 0 and pool.endpoints[0].outstanding == 0
+
+
+def test_no_hedge_before_enough_samples():
+    slow, fast = StubClient("vllm-1", latency=0.05), StubClient("vllm-2")
+    pool = EndpointPool("on-premise", [endpoint(slow), endpoint(fast)], hedge_percentile=0.5, hedge_min_samples=20)
+    assert create(pool) == "vllm-1"
+    assert pool.hedges == 0
+
+
+def test_failure_beside_a_winner_is_retrieved():
+    reported: List[Dict[str, Any]] = []
+
+    async def main() -> str:
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: reported.append(context))
+        gate = asyncio.Event()
+        # Both requests finish in the same step, the primary failing and the hedge answering.
+        primary = StubClient("vllm-1", error=ConnectionError("reset"), gate=gate)
+        secondary = StubClient("vllm-2", gate=gate)
+        pool = hedged_pool(primary, secondary)
+        asyncio.get_running_loop().call_later(0.05, gate.set)
+        result = await pool.create(MESSAGES)
+        gc.collect()
+        await asyncio.sleep(0)
+        return result.content
+
+    for _ in range(10):
+        assert asyncio.run(main()) == "vllm-2"
+    assert not reported
+
+
+def test_labels_are_enforced():
+    with pytest.raises(ValueError):
+        Endpoint(name="azure-eu", client=StubClient("azure-eu"), label="cloud")
+    # A public endpoint can not serve on-premise traffic.
+    with pytest.raises(ValueError):
+        EndpointPool("on-premise", [endpoint(StubClient("vllm-1")), endpoint(StubClient("azure-eu"), "public")])
+    with pytest.raises(ValueError):
+        EndpointPool("public", [])
@@ -0,0 +1,62 @@
+from typing import List, Set
+import pytest
+from autogen_core.models import UserMessage
+from data_agents.selector_history import SelectorHistory
+
+
+class CountingMessages(list):
+    """Messages that record which positions were read."""
+
+    def __init__(self, messages: List[UserMessage]) -> None:
+        super().__init__(messages)
+        self.read: Set[int] = set()
+
+    def __getitem__(self, index):
+        self.read.add(index if index >= 0 else index + len(self))
+        return super().__getitem__(index)
+
+    def __iter__(self):
+        self.read.update(range(len(self)))
+        return super().__iter__()
+
+
+def conversation(count: int) -> List[UserMessage]:
+    return [UserMessage(content=f"message {index}: " + "the annual leave policy applies. " * (1 + index % 3),
+                        source="User" if index % 2 == 0 else "HR_onpre") for index in range(count)]
+
+
+def appended(messages: List[UserMessage], budget: int | None, summary: str, folded: int) -> SelectorHistory:
+    history = SelectorHistory(token_budget=budget)
+    history.set_summary(summary)
+    history.folded = folded
+    for message in messages[folded:]:
+        history.append(message)
+    return history
+
+
+@pytest.mark.parametrize("budget", [None, 30, 200, 100000])
+@pytest.mark.parametrize("folded", [0, 12])
+def test_load_matches_appending(budget, folded):
+    messages = conversation(40)
+    summary = "earlier messages asked about the leave policy." if folded else ""
+    loaded = SelectorHistory(token_budget=budget)
+    loaded.load(messages, summary=summary, folded=folded)
+    expected = appended(messages, budget, summary, folded)
+    assert loaded.render() == expected.render()
+    assert loaded.tokens == expected.tokens
+    assert loaded.needs_summary == expected.needs_summary
+    assert list(loaded.pending) == list(expected.pending)
+    loaded.set_summary("new summary")
+    expected.set_summary("new summary")
+    assert loaded.folded == expected.folded
+    assert loaded.render() == expected.render()
+
+
+def test_load_reads_only_the_window():
+    messages = CountingMessages(conversation(1000))
+    history = SelectorHistory(token_budget=200)
+    history.load(messages)
+    # The messages kept in the window, and the newest one that no longer fit.
+    assert messages.read == set(range(1000 - len(history._window) - 1, 1000))
+    assert history.needs_summary
+    assert len(history.pending) == 1000 - len(history._window)
@@ -0,0 +1,165 @@
+import asyncio
+import contextlib
+import json
+import socket
+from typing import Any, AsyncIterator, Dict, List, Tuple
+import httpx
+import pytest
+import uvicorn
+from data_agents.engine import RouterConfig, RouterEngine
+from data_agents.models.scripted_client import ScriptedChatCompletionClient, router_rules
+from data_agents.server import ChatRequest, RouterServer, create_app
+
+ANSWER = "Employees get ten days of annual leave per year and five more after five years of service."
+USER = {"user_id": "u1", "user_name": "Alice", "user_token": "token"}
+
+
+@pytest.fixture(autouse=True)
+def workspace(tmp_path, monkeypatch):
+    # Sessions get a workspace under the working directory.
+    monkeypatch.chdir(tmp_path)
+
+
+def create_engine(**config: Any) -> RouterEngine:
+    # The on-premise HR assistant answers every question without tools, a word per chunk.
+    model_client = ScriptedChatCompletionClient(rules=router_rules(tool_calls=()), default=ANSWER,
+                                                latency=0.01, chunk_words=1)
+    return RouterEngine(model_client=model_client, config=RouterConfig(streaming=True, **config))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.asynccontextmanager
+async def serving(server: RouterServer) -> AsyncIterator[httpx.AsyncClient]:
+    port = free_port()
+    uvicorn_server = uvicorn.Server(uvicorn.Config(create_app(server), host="127.0.0.1", port=port,
+                                                   log_level="warning"))
+    serve = asyncio.create_task(uvicorn_server.serve())
+    while not uvicorn_server.started:
+        await asyncio.sleep(0.01)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=10) as client:
+            yield client
+    finally:
+        uvicorn_server.should_exit = True
+        await serve
+
+
+async def read_events(response: httpx.Response) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    event = None
+    async for line in response.aiter_lines():
+        line = line.rstrip("\r\n")
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            yield event, json.loads(line[len("data: "):])
+
+
+async def eventually(condition, timeout: float = 5.0) -> None:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.02)
+
+
+def test_sessions_over_the_limit_are_rejected():
+    async def main() -> None:
+        server = RouterServer(create_engine(), max_sessions=1)
+        async with serving(server) as client:
+            async with client.stream("POST", "/sessions", json={**USER, "task": "What's the leave policy?"}) as first:
+                async for event, _ in read_events(first):
+                    if event == "input":
+                        break
+                second = await client.post("/sessions", json={**USER, "user_id": "u2", "task": "Hi"})
+                assert second.status_code == 503
+                assert second.headers["retry-after"] == "1"
+            await eventually(lambda: not server.conversations)
+            # A slot is free again.
+            async with client.stream("POST", "/sessions", json={**USER, "task": "Hi"}) as third:
+                assert third.status_code == 200
+            assert server.stats()["rejected"] == 1
+
+    asyncio.run(main())
+
+
+def test_client_disconnect_cancels_the_session():
+    async def main() -> None:
+        engine = create_engine()
+        server = RouterServer(engine, keepalive_interval=0.05)
+        async with serving(server) as client:
+            async with client.stream("POST", "/sessions", json={**USER, "task": "What's the leave policy?"}) as response:
+                async for event, data in read_events(response):
+                    if event == "session":
+                        conversation = server.conversations[data["conversation_id"]]
+                    if event == "input":
+                        break
+                assert engine.sessions
+            # Gone while the conversation waits for the user's turn.
+            await eventually(lambda: not server.conversations and not engine.sessions)
+            assert conversation.cancellation_token.is_cancelled()
+
+    asyncio.run(main())
+
+
+def test_bounded_output_queue_applies_backpressure():
+    async def main() -> None:
+        engine = create_engine(output_queue_size=2)
+        server = RouterServer(engine)
+        conversation = server.admit()
+        events = server.events(conversation, ChatRequest(**USER, task="What's the leave policy?"))
+        received: List[str] = [await events.__anext__()]
+        while not received[-1].startswith("event: chunk"):
+            received.append(await events.__anext__())
+
+        # A client that stopped reading: the session buffers what its queue holds, its agents wait.
+        await asyncio.sleep(0.5)
+        queue = next(iter(engine.sessions.values())).output_message_queue
+        assert queue.full() and queue.qsize() == 2
+
+        # Nothing was dropped or reordered while they waited.
+        while not received[-1].startswith("event: input"):
+            received.append(await events.__anext__())
+        chunks = [json.loads(event.split("data: ", 1)[1]) for event in received if event.startswith("event: chunk")]
+        assert [chunk["index"] for chunk in chunks] == list(range(len(chunks)))
+        assert "".join(chunk["content"] for chunk in chunks) == ANSWER
+        await events.aclose()
+        server.release(conversation)
+        await engine.stop()
+
+    asyncio.run(main())
+
+
+def test_suspended_session_resumes_with_the_reply():
+    async def main() -> None:
+        engine = create_engine(suspend_at_user_turn=True)
+        server = RouterServer(engine)
+        async with serving(server) as client:
+            async with client.stream("POST", "/sessions", json={**USER, "task": "What's the leave policy?"}) as response:
+                events = [(event, data) async for event, data in read_events(response)]
+            conversation_id = events[0][1]["conversation_id"]
+            assert events[-1][0] == "input"
+            assert ("message", {"source": "HR_onpre", "content": ANSWER}) in events
+            # Suspended: its stream ended and it holds nothing until the reply.
+            assert not server.conversations and not engine.sessions
+            assert server.stats()["suspended"] == 1
+
+            async with client.stream("POST", f"/sessions/{conversation_id}/input",
+                                     json={"content": "And for part-time staff?"}) as response:
+                events = [(event, data) async for event, data in read_events(response)]
+            assert ("message", {"source": "User", "content": "And for part-time staff?"}) in events
+            assert ("message", {"source": "HR_onpre", "content": ANSWER}) in events
+            assert events[-1][0] == "input"
+
+            async with client.stream("POST", f"/sessions/{conversation_id}/input",
+                                     json={"content": "APPROVE"}) as response:
+                events = [(event, data) async for event, data in read_events(response)]
+            assert events[-1][0] == "terminate"
+            assert server.stats()["suspended"] == 0
+            assert (await client.post(f"/sessions/{conversation_id}/input", json={"content": "Hi"})).status_code == 404
+
+    asyncio.run(main())
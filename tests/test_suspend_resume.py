@@ -0,0 +1,127 @@
+import asyncio
+from typing import Any, Dict, List, Tuple
+import pytest
+from autogen_core.models import UserMessage
+from data_agents.engine import GROUP_CHAT_MANAGER_TYPE, RouterConfig, RouterEngine
+from data_agents.messages import InputRequest, TerminateMessage
+from data_agents.models.scripted_client import ScriptedChatCompletionClient, router_rules
+from data_agents.persistence.localfile import LocalFilePersistence
+from data_agents.session_cache import SessionCache
+
+QUESTION = "What's the annual leave policy?"
+REPLIES = ["And how many sick days do I get?", "Does unused leave carry over?", "Can part-time staff take leave?",
+           "How early do I need to ask?", "Is there parental leave?", "What about public holidays?"]
+# Reached before the replies run out, a conversation that loses count on resume would not end.
+MAX_ROUNDS = 7
+USER = ("u1", "Alice", "token")
+
+
+@pytest.fixture(autouse=True)
+def workspace(tmp_path, monkeypatch):
+    # Sessions get a workspace under the working directory.
+    monkeypatch.chdir(tmp_path)
+
+
+def create_engine(name: str, suspend: bool, **kwargs: Any) -> Tuple[RouterEngine, LocalFilePersistence]:
+    persistence = LocalFilePersistence(name)
+    model_client = ScriptedChatCompletionClient(rules=router_rules(), default="Employees get 10 days of annual leave.")
+    config = RouterConfig(suspend_at_user_turn=suspend, max_rounds=MAX_ROUNDS)
+    return RouterEngine(model_client=model_client, persistence=persistence, config=config, **kwargs), persistence
+
+
+async def manager_state(persistence: LocalFilePersistence) -> Dict[str, Any]:
+    session_id = await persistence.aget_uuid("~".join(USER))
+    state = await persistence.aload_content(uuid=session_id)
+    return next(value for key, value in state.items() if key.startswith(GROUP_CHAT_MANAGER_TYPE + "/"))
+
+
+def answers(messages: List[Any]) -> List[Tuple[str, Any]]:
+    return [(message.source, message.content) for message in messages
+            if isinstance(message, UserMessage) and message.source != "User"]
+
+
+def comparable(state: Dict[str, Any]) -> Dict[str, Any]:
+    """The manager's state with its messages as (source, content) pairs, without the time it ran for."""
+    state = {key: value for key, value in state.items() if key != "elapsed"}
+    state["memory"] = {**state["memory"],
+                       "messages": [(message.source, message.content) for message in state["memory"]["messages"]]}
+    return state
+
+
+async def held_run() -> Tuple[List[Any], Dict[str, Any]]:
+    engine, persistence = create_engine("held", suspend=False)
+    replies = iter(REPLIES)
+
+    async def input_func(prompt: str = "", cancellation_token=None) -> str:
+        return next(replies)
+
+    messages = [message async for message in engine.run_stream(*USER, QUESTION, input_func=input_func)]
+    await engine.stop()
+    return messages, await manager_state(persistence)
+
+
+async def suspended_run(session_cache: SessionCache | None = None) -> Tuple[List[Any], Dict[str, Any]]:
+    engine, persistence = create_engine("suspended", suspend=True, session_cache=session_cache)
+    messages: List[Any] = []
+    for task in [QUESTION, *REPLIES]:
+        run = [message async for message in engine.run_stream(*USER, task)]
+        messages += run
+        if isinstance(run[-1], TerminateMessage):
+            break
+        assert isinstance(run[-1], InputRequest)
+        assert not engine.sessions
+    await engine.stop()
+    return messages, await manager_state(persistence)
+
+
+@pytest.mark.parametrize("session_cache", [None, SessionCache(maxsize=4)], ids=["reloaded", "resident"])
+def test_suspended_session_continues_like_a_held_one(session_cache):
+    held_messages, held_state = asyncio.run(held_run())
+    suspended_messages, suspended_state = asyncio.run(suspended_run(session_cache))
+
+    assert isinstance(held_messages[-1], TerminateMessage)
+    assert "Max rounds" in held_messages[-1].content
+    assert isinstance(suspended_messages[-1], TerminateMessage)
+    assert suspended_messages[-1].content == held_messages[-1].content
+    assert answers(suspended_messages) == answers(held_messages)
+    assert comparable(suspended_state) == comparable(held_state)
+    # Ended, the user's next message starts a conversation of its own.
+    assert suspended_state["num_rounds"] == 0 and suspended_state["elapsed"] is None
+
+
+def test_manager_state_round_trip():
+    async def run() -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        engine, persistence = create_engine("manager", suspend=True)
+        async for _ in engine.run_stream(*USER, QUESTION):
+            pass
+        saved = await manager_state(persistence)
+        # Resumed by a fresh manager, which keeps counting from the saved rounds.
+        async for _ in engine.run_stream(*USER, REPLIES[0]):
+            pass
+        await engine.stop()
+        return saved, await manager_state(persistence)
+
+    saved, resaved = asyncio.run(run())
+    assert saved["previous_participant"] == "User"
+    assert saved["num_rounds"] > 0
+    assert resaved["num_rounds"] > saved["num_rounds"]
+    assert resaved["elapsed"] >= saved["elapsed"]
+
+
+def test_new_conversation_starts_its_own_round_count():
+    async def run() -> List[List[Any]]:
+        engine, _ = create_engine("conversations", suspend=False)
+
+        async def input_func(prompt: str = "", cancellation_token=None) -> str:
+            return REPLIES[0]
+
+        runs = [[message async for message in engine.run_stream(*USER, QUESTION, input_func=input_func)]
+                for _ in range(3)]
+        await engine.stop()
+        return runs
+
+    runs = asyncio.run(run())
+    # Every conversation of the user runs to the round limit, none ends at once on the previous one's count.
+    assert [len(messages) for messages in runs] == [len(runs[0])] * 3
+    assert all("Max rounds" in messages[-1].content for messages in runs)
+    assert len(answers(runs[0])) > 1
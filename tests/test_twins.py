@@ -0,0 +1,59 @@
+from typing import Dict, Optional
+import pytest
+from data_agents import engine
+from data_agents.models.pool import BackendTelemetry
+from data_agents.twins import TwinBalancer
+
+PARTICIPANTS = [engine.HR_ONPREMISE_TOPIC_TYPE, engine.HR_PUBLIC_TOPIC_TYPE, engine.USER_TOPIC_TYPE]
+DESCRIPTIONS = [engine.HR_ONPREMISE_DESCRIPTION, engine.HR_PUBLIC_DESCRIPTION, engine.USER_DESCRIPTION]
+ON_PREMISE, PUBLIC = engine.HR_ONPREMISE_TOPIC_TYPE, engine.HR_PUBLIC_TOPIC_TYPE
+
+
+def backend(label: str, p50: float, queue_depth: int = 0, healthy: bool = True) -> BackendTelemetry:
+    return BackendTelemetry(label=label, queue_depth=queue_depth, capacity=8, p50=p50, p95=p50 * 2,
+                            error_rate=0.0, healthy=healthy)
+
+
+def balancer(telemetry: Dict[str, Optional[BackendTelemetry]]) -> TwinBalancer:
+    return TwinBalancer(PARTICIPANTS, DESCRIPTIONS, telemetry.get)
+
+
+FAST_ON_PREMISE = {"on-premise": backend("on-premise", 0.2), "public": backend("public", 0.8)}
+FAST_PUBLIC = {"on-premise": backend("on-premise", 0.5, queue_depth=16), "public": backend("public", 0.3)}
+
+
+@pytest.mark.parametrize("selected", [ON_PREMISE, PUBLIC])
+def test_faster_twin_gets_the_turn_either_way(selected):
+    assert balancer(FAST_ON_PREMISE).choose(selected, PARTICIPANTS, sensitive=False) == ON_PREMISE
+    assert balancer(FAST_PUBLIC).choose(selected, PARTICIPANTS, sensitive=False) == PUBLIC
+
+
+def test_sensitive_conversation_never_moves_to_public():
+    twins = balancer(FAST_PUBLIC)
+    assert twins.choose(ON_PREMISE, PARTICIPANTS, sensitive=True) == ON_PREMISE
+    # Public participants are no candidates of a sensitive conversation, but even if they were.
+    assert twins.choose(PUBLIC, PARTICIPANTS, sensitive=True) == PUBLIC
+    assert balancer(FAST_ON_PREMISE).choose(PUBLIC, PARTICIPANTS, sensitive=True) == ON_PREMISE
+
+
+def test_twin_that_is_no_candidate_keeps_the_selection():
+    # E.g. the public twin spoke last.
+    candidates = [ON_PREMISE, engine.USER_TOPIC_TYPE]
+    assert balancer(FAST_PUBLIC).choose(ON_PREMISE, candidates, sensitive=False) == ON_PREMISE
+
+
+def test_unhealthy_backend_loses_and_ties_keep_the_selection():
+    telemetry = {"on-premise": backend("on-premise", 0.1, healthy=False), "public": backend("public", 0.9)}
+    twins = balancer(telemetry)
+    assert twins.choose(ON_PREMISE, PARTICIPANTS, sensitive=False) == PUBLIC
+    assert twins.stats.recent[-1].reason == "selected unhealthy"
+
+    tie = {"on-premise": backend("on-premise", 0.4), "public": backend("public", 0.4)}
+    for selected in (ON_PREMISE, PUBLIC):
+        assert balancer(tie).choose(selected, PARTICIPANTS, sensitive=False) == selected
+
+
+def test_missing_telemetry_keeps_the_selection():
+    twins = balancer({"on-premise": backend("on-premise", 0.1)})
+    assert twins.choose(PUBLIC, PARTICIPANTS, sensitive=False) == PUBLIC
+    assert twins.stats.decisions == 0